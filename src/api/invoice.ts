@@ -1,12 +1,17 @@
 // 发票API服务
 import type {
   Invoice,
+  BatchUploadResult,
   MergeTask,
+  MergeGroup,
+  MergePreview,
+  MergeProgress,
   DashboardStats,
   PageRequest,
   PageResponse,
   ApiResponse,
 } from '@/types/invoice'
+import type { LayoutConfig } from '@/stores/layout'
 
 const API_BASE = '/api/v1'
 
@@ -31,6 +36,11 @@ export async function getInvoiceDetail(id: string): Promise<ApiResponse<Invoice>
   return response.json()
 }
 
+/** 发票缩略图地址 (small 用于列表, medium 用于排版预览) */
+export function getThumbnailUrl(id: string, size: 'small' | 'medium' = 'small'): string {
+  return `${API_BASE}/invoices/${id}/thumbnail?size=${size}`
+}
+
 /** 上传发票文件 */
 export async function uploadInvoice(
   file: File,
@@ -63,7 +73,7 @@ export async function uploadInvoice(
 }
 
 /** 批量上传发票 */
-export async function batchUploadInvoices(files: File[]): Promise<ApiResponse<Invoice[]>> {
+export async function batchUploadInvoices(files: File[]): Promise<ApiResponse<BatchUploadResult[]>> {
   const formData = new FormData()
   files.forEach((file) => formData.append('files', file))
 
@@ -82,15 +92,66 @@ export async function deleteInvoice(id: string): Promise<ApiResponse<null>> {
   return response.json()
 }
 
-/** 创建合并任务 */
+/** 创建合并任务 (仅PDF输出使用排版配置, 预览缩放 scale 由服务端忽略) */
 export async function createMergeTask(
   invoiceIds: string[],
   outputType: 'pdf' | 'zip',
+  layout?: LayoutConfig,
 ): Promise<ApiResponse<MergeTask>> {
   const response = await fetch(`${API_BASE}/merge-tasks`, {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify({ invoiceIds, outputType }),
+    body: JSON.stringify({ invoiceIds, outputType, layout }),
+  })
+  return response.json()
+}
+
+/** 向已完成的合并任务追加发票 (生成新任务, 只拼版新增部分) */
+export async function appendMergeTask(
+  taskId: string,
+  invoiceIds: string[],
+): Promise<ApiResponse<MergeTask>> {
+  const response = await fetch(`${API_BASE}/merge-tasks/${taskId}/append`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ invoiceIds }),
+  })
+  return response.json()
+}
+
+/** 取消合并任务: 排队中的任务立即取消, 执行中的任务在 Worker 下一次心跳后停止 */
+export async function cancelMergeTask(taskId: string): Promise<ApiResponse<MergeTask>> {
+  const response = await fetch(`${API_BASE}/merge-tasks/${taskId}/cancel`, { method: 'POST' })
+  return response.json()
+}
+
+/** 创建分组合并任务: 按规则 (groupBy) 或显式分组 (groups) 一次生成多个输出 */
+export async function createMergeBatch(options: {
+  groupBy?: 'seller' | 'month' | 'type'
+  invoiceIds?: string[]
+  groups?: MergeGroup[]
+  outputType: 'pdf' | 'zip'
+  layout?: LayoutConfig
+  bundle?: boolean
+}): Promise<ApiResponse<MergeTask>> {
+  const response = await fetch(`${API_BASE}/merge-tasks/batch`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(options),
+  })
+  return response.json()
+}
+
+/** 预览合并结果的某一页 (只渲染该页, 返回的 imageUrl 可直接用作图片地址) */
+export async function previewMergePage(
+  invoiceIds: string[],
+  layout: LayoutConfig | undefined,
+  page = 1,
+): Promise<ApiResponse<MergePreview>> {
+  const response = await fetch(`${API_BASE}/merge-tasks/preview`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ invoiceIds, layout, page }),
   })
   return response.json()
 }
@@ -101,6 +162,48 @@ export async function getMergeTaskDetail(id: string): Promise<ApiResponse<MergeT
   return response.json()
 }
 
+/** 等待合并任务结束 (completed / failed / cancelled), 通过 SSE 接收进度, 连接失败时改为轮询 */
+export async function waitForMergeTask(
+  id: string,
+  onProgress?: (progress: MergeProgress) => void,
+  interval = 1000,
+): Promise<MergeTask> {
+  if (typeof EventSource !== 'undefined') {
+    const task = await new Promise<MergeTask | null>((resolve) => {
+      const source = new EventSource(`${API_BASE}/merge-tasks/${id}/progress`)
+      source.addEventListener('progress', (event) => {
+        onProgress?.(JSON.parse((event as MessageEvent).data))
+      })
+      source.addEventListener('end', (event) => {
+        source.close()
+        resolve(JSON.parse((event as MessageEvent).data))
+      })
+      source.onerror = () => {
+        source.close()
+        resolve(null)
+      }
+    })
+    if (task) {
+      return task
+    }
+  }
+  return pollMergeTask(id, interval)
+}
+
+/** 轮询等待合并任务结束 */
+async function pollMergeTask(id: string, interval: number): Promise<MergeTask> {
+  for (;;) {
+    const result = await getMergeTaskDetail(id)
+    if (result.code !== 0) {
+      throw new Error(result.message)
+    }
+    if (['completed', 'failed', 'cancelled', 'expired'].includes(result.data.status)) {
+      return result.data
+    }
+    await new Promise((resolve) => setTimeout(resolve, interval))
+  }
+}
+
 /** 获取合并任务列表 */
 export async function getMergeTaskList(
   params: PageRequest,
@@ -110,9 +213,10 @@ export async function getMergeTaskList(
   return response.json()
 }
 
-/** 下载合并文件 */
-export function downloadMergedFile(taskId: string): void {
-  window.open(`${API_BASE}/merge-tasks/${taskId}/download`, '_blank')
+/** 下载合并文件, group 为分组合并 (未打包) 时分组的序号 */
+export function downloadMergedFile(taskId: string, group?: number): void {
+  const query = group === undefined ? '' : `?group=${group}`
+  window.open(`${API_BASE}/merge-tasks/${taskId}/download${query}`, '_blank')
 }
 
 /** 保存草稿 */
@@ -37,6 +37,18 @@ export interface Invoice {
   createdAt: string
   /** 更新时间 */
   updatedAt: string
+  /** 上传的文件与该发票内容相同, 未重复存储 (仅上传接口返回) */
+  duplicate?: boolean
+}
+
+/** 批量上传中单个文件的结果 */
+export interface BatchUploadResult {
+  id: string | null
+  fileName: string
+  status: 'success' | 'failed'
+  invoice?: Invoice | null
+  /** 失败原因 */
+  error?: string | null
 }
 
 /** 上传文件项 */
@@ -54,12 +66,72 @@ export interface UploadFileItem {
 export interface MergeTask {
   id: string
   invoiceIds: string[]
-  status: 'pending' | 'processing' | 'completed' | 'failed'
+  status: 'pending' | 'processing' | 'completed' | 'failed' | 'cancelled' | 'expired'
   outputType: 'pdf' | 'zip'
   totalPages: number
   totalAmount: number
   createdAt: string
   downloadUrl?: string
+  /** 失败原因 */
+  errorMessage?: string
+  /** 下载失败而未合并的发票 */
+  failedInvoices: { invoiceId: string; reason: string }[]
+  /** 各阶段耗时(秒) */
+  stageTimings: Record<string, number>
+  /** 是否复用了相同输入的合并结果 */
+  cacheHit: boolean
+  /** 创建时预估的输出大小(字节) */
+  estimatedSize: number
+  /** 分组合并的各分组输出 (普通合并为空) */
+  groups: MergeGroupResult[]
+  /** 分组输出是否打包为一个ZIP */
+  bundle: boolean
+  /** 追加合并的基础任务ID */
+  baseTaskId?: string
+  /** 执行中的任务是否已请求取消 */
+  cancelRequested: boolean
+}
+
+/** 合并进度 (SSE progress 事件) */
+export interface MergeProgress {
+  taskId: string
+  status: MergeTask['status']
+  /** 当前阶段: cache / fetch / base / render / upload */
+  stage?: string
+  /** 当前阶段已完成数量 (upload 为字节数) */
+  done: number
+  total: number
+  /** 当前阶段已耗时(秒) */
+  elapsed: number
+  stageTimings: Record<string, number>
+  errorMessage?: string
+}
+
+/** 分组合并的分组 */
+export interface MergeGroup {
+  name: string
+  invoiceIds: string[]
+}
+
+/** 分组合并中一个分组的输出 */
+export interface MergeGroupResult extends MergeGroup {
+  /** 输出文件名 (打包时为ZIP内的路径) */
+  fileName?: string
+  totalPages: number
+  totalAmount: number
+  /** 未打包时的单独下载地址 */
+  downloadUrl?: string
+  failedInvoices: { invoiceId: string; reason: string }[]
+  errorMessage?: string
+}
+
+/** 合并预览页 */
+export interface MergePreview {
+  /** 页码(从1开始) */
+  page: number
+  totalPages: number
+  /** 预览图地址(JPEG) */
+  imageUrl: string
 }
 
 /** 统计数据 */
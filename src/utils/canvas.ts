@@ -3,6 +3,7 @@
  */
 
 import type { Invoice } from '@/types/invoice'
+import { getThumbnailUrl } from '@/api/invoice'
 import type { LayoutConfig } from '@/stores/layout'
 
 /** A4尺寸常量(像素, 96dpi) */
@@ -161,15 +162,20 @@ export async function renderPage(
     let img = imageCache.get(invoice.id)
     if (!img && invoice.fileUrl) {
       try {
-        if (invoice.fileType === 'pdf') {
-          img = await pdfToImage(invoice.fileUrl)
-        } else {
-          img = await loadImage(invoice.fileUrl)
-        }
-        imageCache.set(invoice.id, img)
+        // 优先使用服务端缩略图, 不在浏览器中下载和渲染原文件
+        img = await loadImage(getThumbnailUrl(invoice.id, 'medium'))
       } catch {
-        // 图片加载失败，绘制占位符
+        try {
+          if (invoice.fileType === 'pdf') {
+            img = await pdfToImage(invoice.fileUrl)
+          } else if (invoice.fileType !== 'ofd') {
+            img = await loadImage(invoice.fileUrl)
+          }
+        } catch {
+          // 图片加载失败，绘制占位符
+        }
       }
+      if (img) imageCache.set(invoice.id, img)
     }
 
     if (img) {
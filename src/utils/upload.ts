@@ -4,8 +4,8 @@
 
 const API_BASE = '/api/v1'
 
-/** 切片大小: 2MB */
-const CHUNK_SIZE = 2 * 1024 * 1024
+/** 切片大小: 5MB (与服务端 UPLOAD_CHUNK_SIZE 一致, MinIO 拼接要求除最后一片外不小于 5MB) */
+const CHUNK_SIZE = 5 * 1024 * 1024
 
 /** 最大并发数 */
 const MAX_CONCURRENT = 3
@@ -27,6 +27,8 @@ interface UploadResult {
   success: boolean
   fileId?: string
   error?: string
+  /** 与已有发票内容相同, 未重复上传 */
+  duplicate?: boolean
 }
 
 /**
@@ -36,6 +38,35 @@ function calculateFileHash(file: File): string {
   return `${file.name}_${file.size}_${file.lastModified}`
 }
 
+/**
+ * 计算文件内容的 SHA-256 (浏览器不支持 crypto.subtle 时返回 null)
+ */
+async function calculateContentHash(file: File): Promise<string | null> {
+  if (!globalThis.crypto?.subtle) return null
+  try {
+    const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer())
+    return Array.from(new Uint8Array(digest))
+      .map((b) => b.toString(16).padStart(2, '0'))
+      .join('')
+  } catch {
+    return null
+  }
+}
+
+/**
+ * 按内容哈希查询已有发票(秒传)
+ */
+async function checkExisting(sha256: string): Promise<string | null> {
+  try {
+    const response = await fetch(`${API_BASE}/invoices/check-hash?sha256=${sha256}`)
+    if (!response.ok) return null
+    const result = await response.json()
+    return result.data?.id ?? null
+  } catch {
+    return null
+  }
+}
+
 /**
  * 将文件切片
  */
@@ -86,6 +117,22 @@ async function uploadChunk(
   return response.ok
 }
 
+/**
+ * 查询已上传的切片(断点续传)
+ */
+async function getUploadedChunks(fileHash: string): Promise<Set<number>> {
+  try {
+    const response = await fetch(
+      `${API_BASE}/invoices/upload-chunk?fileHash=${encodeURIComponent(fileHash)}`,
+    )
+    if (!response.ok) return new Set()
+    const result = await response.json()
+    return new Set<number>(result.data?.uploadedChunks ?? [])
+  } catch {
+    return new Set()
+  }
+}
+
 /**
  * 合并切片请求
  */
@@ -101,6 +148,7 @@ async function mergeChunks(fileHash: string, fileName: string, totalChunks: numb
     success: response.ok,
     fileId: result.data?.id,
     error: result.message,
+    duplicate: result.data?.duplicate,
   }
 }
 
@@ -156,12 +204,16 @@ export async function uploadWithChunks(
   const totalChunks = chunks.length
 
   const controller = new ConcurrencyController(MAX_CONCURRENT)
-  let uploadedCount = 0
 
   try {
-    // 并发上传所有切片
+    // 跳过上次已上传的切片
+    const uploaded = await getUploadedChunks(fileHash)
+    let uploadedCount = uploaded.size
+    onProgress?.(Math.round((uploadedCount / totalChunks) * 90))
+
+    // 并发上传剩余切片
     await Promise.all(
-      chunks.map((chunk) =>
+      chunks.filter((chunk) => !uploaded.has(chunk.index)).map((chunk) =>
         controller.add(async () => {
           const success = await uploadChunk(fileHash, chunk, file.name, totalChunks)
           if (!success) {
@@ -210,7 +262,7 @@ export async function uploadFile(
     xhr.onload = () => {
       if (xhr.status >= 200 && xhr.status < 300) {
         const result = JSON.parse(xhr.responseText)
-        resolve({ success: true, fileId: result.data?.id })
+        resolve({ success: true, fileId: result.data?.id, duplicate: result.data?.duplicate })
       } else {
         resolve({ success: false, error: xhr.statusText })
       }
@@ -222,12 +274,78 @@ export async function uploadFile(
 }
 
 /**
- * 智能上传 - 根据文件大小选择上传方式
+ * 直传对象存储: 获取预签名URL → PUT 到 MinIO → 登记发票
+ * 预签名失败或存储不可直连(如未配置 CORS)时返回 null, 由调用方改用经 API 上传
+ */
+export async function uploadDirect(
+  file: File,
+  onProgress?: ProgressCallback,
+  sha256?: string,
+): Promise<UploadResult | null> {
+  let presign: { objectName: string; uploadUrl: string }
+  try {
+    const response = await fetch(`${API_BASE}/invoices/presign`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ fileName: file.name, size: file.size }),
+    })
+    if (!response.ok) return null
+    presign = (await response.json()).data
+  } catch {
+    return null
+  }
+
+  const uploaded = await new Promise<boolean>((resolve) => {
+    const xhr = new XMLHttpRequest()
+    xhr.open('PUT', presign.uploadUrl)
+    xhr.setRequestHeader('Content-Type', file.type || 'application/octet-stream')
+
+    xhr.upload.onprogress = (e) => {
+      if (e.lengthComputable) {
+        onProgress?.(Math.round((e.loaded / e.total) * 95)) // 95%用于上传
+      }
+    }
+    xhr.onload = () => resolve(xhr.status >= 200 && xhr.status < 300)
+    xhr.onerror = () => resolve(false)
+    xhr.send(file)
+  })
+  if (!uploaded) return null
+
+  const response = await fetch(`${API_BASE}/invoices/register`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ objectName: presign.objectName, fileName: file.name, sha256 }),
+  })
+  const result = await response.json()
+  onProgress?.(100)
+  return {
+    success: response.ok,
+    fileId: result.data?.id,
+    error: result.detail ?? result.message,
+    duplicate: result.data?.duplicate,
+  }
+}
+
+/**
+ * 智能上传 - 优先直传对象存储, 不可用时根据文件大小选择上传方式
  */
 export async function smartUpload(
   file: File,
   onProgress?: ProgressCallback,
 ): Promise<UploadResult> {
+  // 服务端已有相同内容的发票时跳过上传
+  const sha256 = await calculateContentHash(file)
+  if (sha256) {
+    const existingId = await checkExisting(sha256)
+    if (existingId) {
+      onProgress?.(100)
+      return { success: true, fileId: existingId, duplicate: true }
+    }
+  }
+
+  const direct = await uploadDirect(file, onProgress, sha256 ?? undefined)
+  if (direct) return direct
+
   // 大于5MB使用切片上传
   if (file.size > 5 * 1024 * 1024) {
     return uploadWithChunks(file, onProgress)
@@ -37,6 +37,57 @@ class Settings(BaseSettings):
     minio_secret_key: str = "minioadmin"
     minio_bucket_name: str = "invoice"
     minio_secure: bool = False
+    minio_max_connections: int = 16
+    minio_part_size: int = 16 * 1024 * 1024  # 分片上传的分片大小 (最小 5MB)
+
+    # 上传配置
+    upload_max_file_mb: int = 10
+    upload_max_batch_files: int = 20
+    upload_concurrency: int = 8  # 批量上传时并发写入 MinIO 的文件数
+    upload_chunk_size: int = 5 * 1024 * 1024  # 与前端 CHUNK_SIZE 一致, 不能小于 MinIO 拼接要求的 5MB
+    upload_chunk_ttl_hours: int = 24  # 未完成合并的切片和未登记的直传文件保留时长
+    upload_presign_expires: int = 900  # 直传预签名URL有效期 (秒)
+
+    # 合并任务队列配置
+    merge_worker_processes: int = 2
+    merge_worker_poll_interval: float = 1.0
+    merge_task_heartbeat_seconds: int = 10
+    merge_task_stale_seconds: int = 120
+    merge_task_max_attempts: int = 3
+    merge_fetch_concurrency: int = 8
+    merge_spool_max_bytes: int = 8 * 1024 * 1024  # 合并结果超过该大小时写入磁盘临时文件
+    merge_memory_budget_mb: int = 256  # 单个任务保留在内存中的输入总大小, 超出的输入转存到磁盘, 0 表示不限制
+    merge_cache_ttl_hours: int = 168  # 合并结果缓存在最后一次使用后保留的时长
+    merge_image_dpi: int = 200  # 图片嵌入PDF时的目标分辨率
+    merge_jpeg_quality: int = 85  # 需要缩放的图片重新编码时的JPEG质量
+    merge_render_processes: int = 2  # 每个 Worker 的渲染进程数, 0 表示在 Worker 进程内渲染
+    merge_batch_max_groups: int = 100  # 分组合并一次最多生成的输出数
+    merge_task_timeout_seconds: int = 1800  # 单个任务的执行时间上限, 0 表示不限制
+    merge_max_input_mb: int = 1024  # 单个任务读取的输入文件总大小上限, 0 表示不限制
+    merge_max_pages: int = 5000  # 单个任务输出的页数上限, 0 表示不限制
+    merge_max_memory_mb: int = 0  # 执行期间 Worker 进程的内存上限 (仅 Linux), 0 表示不限制
+    merge_progress_url: str = "http://127.0.0.1:8000/api/v1/merge-tasks/progress"  # Worker 推送进度的 API 地址, 为空时不推送
+    merge_progress_token: str = ""  # Worker 推送进度的共享令牌, 为空时由 secret_key 派生
+    merge_progress_interval: float = 0.5  # 同一任务两次进度推送的最小间隔 (秒)
+
+    # 发票字段提取配置 (worker.py, 在渲染进程池中执行)
+    extract_batch_size: int = 20
+    extract_claim_timeout_seconds: int = 300  # 认领后超过该时长未完成, 其他 Worker 可重新认领
+    extract_max_attempts: int = 3
+    extract_recognizer: str = ""  # 图片 OCR 识别器 "模块路径:类名", 为空时使用桩实现
+
+    # 缩略图与合并预览配置 (API 进程按需生成, 缓存在 MinIO)
+    thumbnail_concurrency: int = 2  # 同时生成缩略图的数量, 超出的请求排队等待
+    thumbnail_jpeg_quality: int = 80
+    thumbnail_max_age: int = 30 * 24 * 3600  # 浏览器缓存时长 (秒), 缩略图与原文件一样不会改变
+    merge_preview_dpi: int = 72  # 合并预览页的渲染分辨率
+    merge_preview_ttl_hours: int = 24  # 合并预览页缓存的保留时长
+
+    # 合并文件下载配置 (API 进程)
+    merge_download_mode: str = "redirect"  # redirect: 重定向到 MinIO 公开地址; proxy: 经 API 分块转发 (支持 Range 和 304)
+    merge_download_chunk_size: int = 1024 * 1024  # 转发时每次从 MinIO 读取的字节数
+    merge_download_cache_dir: str = ""  # 转发过的合并文件缓存在本地磁盘的目录, 为空时不缓存
+    merge_download_cache_mb: int = 2048  # 本地缓存的总大小上限, 超出时删除最久未访问的文件
 
     class Config:
         env_file = ".env"
@@ -1,7 +1,7 @@
 """
 数据库配置 - SQLite3
 """
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 from app.config import settings
@@ -26,6 +26,28 @@ def get_db():
         db.close()
 
 
+def _sync_columns():
+    """为已存在的表补齐新增列和索引 (create_all 不会修改已有表)"""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}"))
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
+
 def init_db():
     """初始化数据库表"""
+    import app.models  # noqa: F401  确保模型已注册
+
     Base.metadata.create_all(bind=engine)
+    _sync_columns()
@@ -0,0 +1,79 @@
+"""
+中间件 - 上传请求体大小限制
+
+在请求体流入时累计字节数, 超过上限立即返回 413, 不等整个请求体解析落盘后再检查。
+带 Content-Length 的请求在读取请求体之前即可拒绝。
+"""
+from typing import Dict, Optional
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import settings
+
+# multipart 边界、字段头等开销的余量
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+def _upload_limits() -> Dict[str, int]:
+    """上传路径 → 请求体字节数上限"""
+    max_file = settings.upload_max_file_mb * 1024 * 1024
+    return {
+        "/api/v1/invoices/upload": max_file + MULTIPART_OVERHEAD,
+        "/api/v1/invoices/upload-chunk": settings.upload_chunk_size + MULTIPART_OVERHEAD,
+        "/api/v1/invoices/batch-upload": settings.upload_max_batch_files * (max_file + MULTIPART_OVERHEAD),
+    }
+
+
+class UploadSizeLimitMiddleware:
+    """上传请求体大小限制 (纯 ASGI 中间件, 不缓冲请求体)"""
+
+    def __init__(self, app: ASGIApp, limits: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.limits = limits or _upload_limits()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        limit = self.limits.get(scope.get("path", "")) if scope["type"] == "http" else None
+        if limit is None or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            await self._reject(scope, send)
+            return
+
+        received = 0
+        rejected = False
+
+        async def limited_receive() -> Message:
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # 先回复 413, 再让应用按客户端断开处理, 停止继续解析
+                    rejected = True
+                    await self._reject(scope, send)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message: Message):
+            if not rejected:
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not rejected:
+                raise
+
+    @staticmethod
+    async def _reject(scope: Scope, send: Send):
+        response = JSONResponse(
+            {"detail": f"文件大小超过{settings.upload_max_file_mb}MB限制"},
+            status_code=413,
+        )
+        await response(scope, None, send)
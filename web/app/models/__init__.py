@@ -3,7 +3,8 @@
 """
 from app.models.invoice import Invoice
 from app.models.merge_task import MergeTask
+from app.models.merge_cache import MergeCache
 from app.models.draft import Draft
 from app.models.user import User
 
-__all__ = ["Invoice", "MergeTask", "Draft", "User"]
+__all__ = ["Invoice", "MergeTask", "MergeCache", "Draft", "User"]
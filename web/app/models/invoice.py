@@ -2,7 +2,7 @@
 发票数据模型
 """
 from datetime import datetime
-from sqlalchemy import Column, String, Float, DateTime, Enum
+from sqlalchemy import Column, String, Float, DateTime, Enum, Integer
 import enum
 
 from app.database import Base
@@ -45,8 +45,19 @@ class Invoice(Base):
     amount = Column(Float, default=0.0, comment="金额(不含税)")
     tax_amount = Column(Float, default=0.0, comment="税额")
     total_amount = Column(Float, default=0.0, comment="价税合计")
-    status = Column(String(20), default=InvoiceStatus.PENDING.value, comment="状态")
+    status = Column(String(20), default=InvoiceStatus.PENDING.value, index=True, comment="状态")
     file_url = Column(String(500), nullable=True, comment="原始文件URL")
     file_type = Column(String(10), default=FileType.PDF.value, comment="文件类型")
+    content_hash = Column(String(64), nullable=True, unique=True, index=True, comment="文件内容SHA-256")
+    file_size = Column(Integer, nullable=True, comment="文件大小(字节)")
+    page_count = Column(Integer, nullable=True, comment="页数")
+    page_width = Column(Float, nullable=True, comment="首页宽度(PDF/OFD为pt, 图片为像素)")
+    page_height = Column(Float, nullable=True, comment="首页高度(PDF/OFD为pt, 图片为像素)")
+    artifact_object = Column(String(500), nullable=True, comment="合并用预处理产物对象名, 为空时使用原文件")
+    artifact_size = Column(Integer, nullable=True, comment="合并时读取的文件大小(字节)")
+    extract_worker = Column(String(100), nullable=True, comment="认领字段提取的Worker")
+    extract_claimed_at = Column(DateTime, nullable=True, comment="字段提取认领时间")
+    extract_attempts = Column(Integer, default=0, comment="字段提取尝试次数")
+    extract_error = Column(String(500), nullable=True, comment="字段提取失败或缺失字段说明")
     created_at = Column(DateTime, default=datetime.now, comment="创建时间")
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, comment="更新时间")
@@ -0,0 +1,27 @@
+"""
+合并结果缓存数据模型
+"""
+from datetime import datetime
+from sqlalchemy import Column, String, Integer, DateTime
+import enum
+
+from app.database import Base
+
+
+class MergeCacheStatus(str, enum.Enum):
+    BUILDING = "building"
+    READY = "ready"
+
+
+class MergeCache(Base):
+    """合并结果缓存表 (按输入内容寻址)"""
+    __tablename__ = "merge_cache"
+
+    key = Column(String(64), primary_key=True, comment="缓存键(SHA-256)")
+    status = Column(String(20), default=MergeCacheStatus.BUILDING.value, comment="状态")
+    owner_task_id = Column(String(32), nullable=True, comment="正在生成结果的任务ID")
+    output_type = Column(String(10), nullable=True, comment="输出类型")
+    object_name = Column(String(500), nullable=True, comment="合并结果对象名")
+    total_pages = Column(Integer, default=0, comment="总页数")
+    created_at = Column(DateTime, default=datetime.now, comment="创建时间")
+    last_used_at = Column(DateTime, default=datetime.now, index=True, comment="最近使用时间")
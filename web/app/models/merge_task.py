@@ -2,7 +2,7 @@
 合并任务数据模型
 """
 from datetime import datetime
-from sqlalchemy import Column, String, Float, Integer, DateTime, Text
+from sqlalchemy import Column, String, Float, Integer, DateTime, Text, Boolean
 import enum
 
 from app.database import Base
@@ -13,6 +13,8 @@ class MergeTaskStatus(str, enum.Enum):
     PROCESSING = "processing"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"
+    EXPIRED = "expired"  # 已完成, 合并结果随缓存过期被清理
 
 
 class OutputType(str, enum.Enum):
@@ -26,9 +28,29 @@ class MergeTask(Base):
 
     id = Column(String(32), primary_key=True, index=True)
     invoice_ids = Column(Text, nullable=False, comment="发票ID列表(JSON)")
-    status = Column(String(20), default=MergeTaskStatus.PENDING.value, comment="状态")
+    status = Column(String(20), default=MergeTaskStatus.PENDING.value, index=True, comment="状态")
     output_type = Column(String(10), default=OutputType.PDF.value, comment="输出类型")
+    layout = Column(Text, nullable=True, comment="排版配置(JSON)")
     total_pages = Column(Integer, default=0, comment="总页数")
     total_amount = Column(Float, default=0.0, comment="总金额")
+    estimated_size = Column(Integer, default=0, comment="创建时预估的输出大小(字节)")
     download_url = Column(String(500), nullable=True, comment="下载链接")
+    object_name = Column(String(500), nullable=True, comment="合并结果对象名")
+    error_message = Column(Text, nullable=True, comment="失败原因")
+    failed_invoices = Column(Text, nullable=True, comment="下载失败的发票及原因(JSON)")
+    stage_timings = Column(Text, nullable=True, comment="各阶段耗时秒数(JSON)")
+    cache_key = Column(String(64), nullable=True, comment="合并结果缓存键")
+    cache_hit = Column(Boolean, default=False, comment="是否复用了缓存结果")
+    groups = Column(Text, nullable=True, comment="分组合并的分组及各输出结果(JSON), 为空时为普通合并")
+    bundle = Column(Boolean, default=False, comment="分组输出是否打包为一个ZIP")
+    base_task_id = Column(String(32), nullable=True, comment="追加合并的基础任务ID")
+    cancel_requested = Column(Boolean, default=False, comment="执行中的任务是否已请求取消")
+
+    # 任务队列
+    worker_id = Column(String(100), nullable=True, comment="处理该任务的Worker")
+    attempts = Column(Integer, default=0, comment="已尝试次数")
+    started_at = Column(DateTime, nullable=True, comment="开始处理时间")
+    heartbeat_at = Column(DateTime, nullable=True, comment="最近心跳时间")
+    finished_at = Column(DateTime, nullable=True, comment="结束时间")
+
     created_at = Column(DateTime, default=datetime.now, comment="创建时间")
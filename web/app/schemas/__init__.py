@@ -6,11 +6,26 @@ from app.schemas.invoice import (
     InvoiceCreate,
     InvoiceUpdate,
     InvoiceResponse,
+    BatchUploadResult,
+    ChunkUploadResponse,
+    ChunkStatusResponse,
+    MergeChunksRequest,
+    PresignUploadRequest,
+    PresignUploadResponse,
+    RegisterUploadRequest,
     DashboardStats,
 )
 from app.schemas.merge_task import (
+    LayoutOptions,
     MergeTaskCreate,
     MergeTaskResponse,
+    MergeAppendRequest,
+    MergeGroup,
+    MergeBatchCreate,
+    MergeGroupResult,
+    MergeProgressEvent,
+    MergePreviewRequest,
+    MergePreviewResponse,
 )
 from app.schemas.draft import DraftCreate, DraftResponse
 
@@ -21,9 +36,24 @@ __all__ = [
     "InvoiceCreate",
     "InvoiceUpdate",
     "InvoiceResponse",
+    "BatchUploadResult",
+    "ChunkUploadResponse",
+    "ChunkStatusResponse",
+    "MergeChunksRequest",
+    "PresignUploadRequest",
+    "PresignUploadResponse",
+    "RegisterUploadRequest",
     "DashboardStats",
+    "LayoutOptions",
     "MergeTaskCreate",
     "MergeTaskResponse",
+    "MergeAppendRequest",
+    "MergeGroup",
+    "MergeBatchCreate",
+    "MergeGroupResult",
+    "MergeProgressEvent",
+    "MergePreviewRequest",
+    "MergePreviewResponse",
     "DraftCreate",
     "DraftResponse",
 ]
@@ -1,7 +1,7 @@
 """
 发票相关Schema
 """
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel, Field
 
 
@@ -60,12 +60,83 @@ class InvoiceResponse(BaseModel):
     file_type: str = Field(alias="fileType")
     created_at: str = Field(alias="createdAt")
     updated_at: str = Field(alias="updatedAt")
+    duplicate: bool = Field(default=False, description="上传的文件与已有发票内容相同, 未重复存储")
 
     class Config:
         populate_by_name = True
         from_attributes = True
 
 
+class BatchUploadResult(BaseModel):
+    """批量上传中单个文件的结果"""
+    id: Optional[str] = None
+    file_name: str = Field(alias="fileName")
+    status: str = Field(description="success / failed")
+    invoice: Optional[InvoiceResponse] = None
+    error: Optional[str] = None
+
+    class Config:
+        populate_by_name = True
+
+
+class ChunkUploadResponse(BaseModel):
+    """切片上传响应"""
+    chunk_index: int = Field(alias="chunkIndex")
+    received: bool = True
+
+    class Config:
+        populate_by_name = True
+
+
+class ChunkStatusResponse(BaseModel):
+    """已上传切片 (断点续传)"""
+    file_hash: str = Field(alias="fileHash")
+    uploaded_chunks: List[int] = Field(default_factory=list, alias="uploadedChunks")
+
+    class Config:
+        populate_by_name = True
+
+
+class MergeChunksRequest(BaseModel):
+    """合并切片请求"""
+    file_hash: str = Field(alias="fileHash", min_length=1)
+    file_name: str = Field(alias="fileName", min_length=1)
+    total_chunks: int = Field(alias="totalChunks", ge=1)
+
+    class Config:
+        populate_by_name = True
+
+
+class PresignUploadRequest(BaseModel):
+    """直传预签名请求"""
+    file_name: str = Field(alias="fileName", min_length=1)
+    size: int = Field(ge=1, description="文件大小(字节)")
+
+    class Config:
+        populate_by_name = True
+
+
+class PresignUploadResponse(BaseModel):
+    """直传预签名响应"""
+    object_name: str = Field(alias="objectName")
+    upload_url: str = Field(alias="uploadUrl")
+    method: str = "PUT"
+    expires_in: int = Field(alias="expiresIn", description="有效期(秒)")
+
+    class Config:
+        populate_by_name = True
+
+
+class RegisterUploadRequest(BaseModel):
+    """直传完成后登记发票"""
+    object_name: str = Field(alias="objectName", min_length=1)
+    file_name: str = Field(alias="fileName", min_length=1)
+    sha256: Optional[str] = Field(None, min_length=64, max_length=64, description="文件内容 SHA-256 (可选, 用于校验上传内容)")
+
+    class Config:
+        populate_by_name = True
+
+
 class DashboardStats(BaseModel):
     """仪表板统计"""
     processed_count: int = Field(alias="processedCount")
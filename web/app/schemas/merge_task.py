@@ -1,14 +1,120 @@
 """
 合并任务相关Schema
 """
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional
 from pydantic import BaseModel, Field
 
 
+class LayoutOptions(BaseModel):
+    """排版配置 (对应前端 LayoutConfig, 仅 PDF 输出有效)"""
+    layout: Literal["1x1", "2x1", "2x2"] = Field(default="2x1", description="每页布局")
+    orientation: Literal["portrait", "landscape"] = Field(default="portrait", description="纸张方向")
+    margin: float = Field(default=10, ge=0, le=50, description="边距(mm)")
+    gap: float = Field(default=5, ge=0, le=50, description="间距(mm)")
+    show_page_number: bool = Field(default=False, alias="showPageNumber", description="显示页码")
+    show_category_label: bool = Field(default=False, alias="showCategoryLabel", description="显示分类标签")
+
+    class Config:
+        populate_by_name = True
+        extra = "ignore"
+
+
 class MergeTaskCreate(BaseModel):
     """创建合并任务"""
     invoice_ids: List[str] = Field(alias="invoiceIds")
     output_type: str = Field(default="pdf", alias="outputType")
+    layout: Optional[LayoutOptions] = None
+
+    class Config:
+        populate_by_name = True
+
+
+class MergeAppendRequest(BaseModel):
+    """向已完成的合并任务追加发票"""
+    invoice_ids: List[str] = Field(alias="invoiceIds")
+
+    class Config:
+        populate_by_name = True
+
+
+class MergeGroup(BaseModel):
+    """分组合并中的一个分组, 生成一个输出文件"""
+    name: str = Field(min_length=1, max_length=100, description="分组名称 (用作文件名)")
+    invoice_ids: List[str] = Field(alias="invoiceIds")
+
+    class Config:
+        populate_by_name = True
+
+
+class MergeBatchCreate(BaseModel):
+    """创建分组合并任务: 按规则 (groupBy + invoiceIds) 或显式分组 (groups) 生成多个输出"""
+    group_by: Optional[Literal["seller", "month", "type"]] = Field(
+        default=None, alias="groupBy", description="分组规则: 销方 / 开票月份 / 发票类型",
+    )
+    invoice_ids: List[str] = Field(default_factory=list, alias="invoiceIds")
+    groups: List[MergeGroup] = Field(default_factory=list)
+    output_type: str = Field(default="pdf", alias="outputType")
+    layout: Optional[LayoutOptions] = None
+    bundle: bool = Field(default=True, description="是否把全部输出打包为一个 ZIP (附 manifest.json)")
+
+    class Config:
+        populate_by_name = True
+
+
+class MergePreviewRequest(BaseModel):
+    """预览合并结果的某一页"""
+    invoice_ids: List[str] = Field(alias="invoiceIds")
+    layout: Optional[LayoutOptions] = None
+    page: int = Field(default=1, ge=1, description="页码(从1开始)")
+
+    class Config:
+        populate_by_name = True
+
+
+class MergePreviewResponse(BaseModel):
+    """合并预览页"""
+    page: int
+    total_pages: int = Field(alias="totalPages")
+    image_url: str = Field(alias="imageUrl")
+
+    class Config:
+        populate_by_name = True
+
+
+class FailedInvoice(BaseModel):
+    """合并时处理失败的发票"""
+    invoice_id: str = Field(alias="invoiceId")
+    reason: str
+
+    class Config:
+        populate_by_name = True
+
+
+class MergeGroupResult(BaseModel):
+    """分组合并中一个分组的输出"""
+    name: str
+    invoice_ids: List[str] = Field(alias="invoiceIds")
+    file_name: Optional[str] = Field(None, alias="fileName")
+    total_pages: int = Field(0, alias="totalPages")
+    total_amount: float = Field(0.0, alias="totalAmount")
+    download_url: Optional[str] = Field(None, alias="downloadUrl")
+    failed_invoices: List[FailedInvoice] = Field(default_factory=list, alias="failedInvoices")
+    error_message: Optional[str] = Field(None, alias="errorMessage")
+
+    class Config:
+        populate_by_name = True
+
+
+class MergeProgressEvent(BaseModel):
+    """合并进度 (Worker 推送, 通过 SSE 下发)"""
+    task_id: str = Field(alias="taskId")
+    status: str
+    stage: Optional[str] = Field(None, description="当前阶段: cache / fetch / base / render / upload")
+    done: int = Field(0, description="当前阶段已完成数量 (upload 为字节数)")
+    total: int = Field(0, description="当前阶段总数量")
+    elapsed: float = Field(0.0, description="当前阶段已耗时(秒)")
+    stage_timings: Dict[str, float] = Field(default_factory=dict, alias="stageTimings")
+    error_message: Optional[str] = Field(None, alias="errorMessage")
 
     class Config:
         populate_by_name = True
@@ -24,6 +130,16 @@ class MergeTaskResponse(BaseModel):
     total_amount: float = Field(alias="totalAmount")
     created_at: str = Field(alias="createdAt")
     download_url: Optional[str] = Field(None, alias="downloadUrl")
+    error_message: Optional[str] = Field(None, alias="errorMessage")
+    failed_invoices: List[FailedInvoice] = Field(default_factory=list, alias="failedInvoices")
+    stage_timings: Dict[str, float] = Field(default_factory=dict, alias="stageTimings")
+    cache_hit: bool = Field(False, alias="cacheHit")
+    estimated_size: int = Field(0, alias="estimatedSize")
+    layout: Optional[LayoutOptions] = None
+    groups: List[MergeGroupResult] = Field(default_factory=list)
+    bundle: bool = False
+    base_task_id: Optional[str] = Field(None, alias="baseTaskId")
+    cancel_requested: bool = Field(False, alias="cancelRequested")
 
     class Config:
         populate_by_name = True
@@ -2,7 +2,27 @@
 业务服务层 (Service)
 """
 from app.services.invoice_service import InvoiceService
+from app.services.chunk_upload_service import ChunkUploadService
+from app.services.batch_upload_service import BatchUploadService
+from app.services.direct_upload_service import DirectUploadService
+from app.services.thumbnail_service import ThumbnailService
 from app.services.merge_service import MergeService
+from app.services.merge_download import MergeDownloadService
+from app.services.merge_preview import MergePreviewService
+from app.services.merge_progress import ProgressHub
+from app.services.merge_queue import MergeQueue
 from app.services.draft_service import DraftService
 
-__all__ = ["InvoiceService", "MergeService", "DraftService"]
+__all__ = [
+    "InvoiceService",
+    "ChunkUploadService",
+    "BatchUploadService",
+    "DirectUploadService",
+    "ThumbnailService",
+    "MergeService",
+    "MergeDownloadService",
+    "MergePreviewService",
+    "ProgressHub",
+    "MergeQueue",
+    "DraftService",
+]
@@ -0,0 +1,132 @@
+"""
+批量上传服务 - 有界并发写入 MinIO, 发票记录一次事务批量插入
+
+内容相同的文件 (SHA-256 一致) 只存储一次: 与已有发票相同时直接返回已有发票,
+同一批次内重复的文件复用第一个文件的结果。
+"""
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.invoice import Invoice
+from app.services.invoice_service import InvoiceService
+from app.services.minio_service import MinioService
+from app.schemas.invoice import BatchUploadResult, InvoiceResponse
+from app.utils.file_utils import hash_stream
+
+
+@dataclass
+class BatchUploadItem:
+    """批量上传中的一个文件, error 非空表示已在校验阶段被拒绝"""
+    file_name: str
+    stream: Optional[BinaryIO] = None
+    file_type: Optional[str] = None
+    length: int = -1
+    error: Optional[str] = None
+    content_hash: Optional[str] = None
+    object_name: Optional[str] = None
+    response: Optional[InvoiceResponse] = None
+
+
+class BatchUploadService:
+    """批量上传服务"""
+
+    @staticmethod
+    def upload(db: Session, items: List[BatchUploadItem]) -> List[BatchUploadResult]:
+        """上传一批文件, 按输入顺序返回每个文件的结果"""
+        pending = [item for item in items if item.error is None]
+        for item in pending:
+            item.content_hash = hash_stream(item.stream)
+
+        # 一次查询找出已存在的内容
+        existing: Dict[str, Invoice] = {}
+        if pending:
+            hashes = {item.content_hash for item in pending}
+            existing = {
+                inv.content_hash: inv
+                for inv in db.query(Invoice).filter(Invoice.content_hash.in_(hashes)).all()
+            }
+
+        to_store: List[BatchUploadItem] = []
+        first_by_hash: Dict[str, BatchUploadItem] = {}
+        for item in pending:
+            if item.content_hash in existing:
+                item.response = InvoiceService.to_response(existing[item.content_hash], duplicate=True)
+            elif item.content_hash not in first_by_hash:
+                first_by_hash[item.content_hash] = item
+                to_store.append(item)
+
+        if to_store:
+            workers = max(1, min(settings.upload_concurrency, len(to_store)))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-upload") as pool:
+                futures = [pool.submit(BatchUploadService._store, item) for item in to_store]
+                for future in futures:
+                    future.result()
+
+        stored = [item for item in to_store if item.object_name]
+        if stored:
+            BatchUploadService._save(db, stored)
+
+        # 同一批次内重复的文件复用第一个文件的结果
+        for item in pending:
+            first = first_by_hash.get(item.content_hash)
+            if first is None or first is item or item.response is not None:
+                continue
+            if first.response is not None:
+                item.response = first.response.model_copy(update={"duplicate": True})
+            else:
+                item.error = first.error
+
+        return [BatchUploadService._result(item) for item in items]
+
+    @staticmethod
+    def _save(db: Session, stored: List[BatchUploadItem]):
+        """一次事务写入全部新发票; 与并发上传冲突时逐条写入"""
+        invoices = [
+            InvoiceService.build_invoice(item.object_name, item.file_name, item.file_type, item.content_hash)
+            for item in stored
+        ]
+        # 响应在提交前生成, 避免提交后逐条刷新
+        responses = [InvoiceService.to_response(invoice) for invoice in invoices]
+        try:
+            db.add_all(invoices)
+            db.commit()
+        except Exception:
+            db.rollback()
+        else:
+            for item, response in zip(stored, responses):
+                item.response = response
+            return
+
+        for item, invoice in zip(stored, invoices):
+            try:
+                saved, duplicate = InvoiceService.save_new(db, invoice)
+                item.response = InvoiceService.to_response(saved, duplicate)
+            except Exception:
+                db.rollback()
+                MinioService.delete_file(item.object_name)
+                item.error = "保存发票记录失败"
+
+    @staticmethod
+    def _result(item: BatchUploadItem) -> BatchUploadResult:
+        if item.response is None:
+            return BatchUploadResult(fileName=item.file_name, status="failed", error=item.error)
+        return BatchUploadResult(
+            id=item.response.id,
+            fileName=item.file_name,
+            status="success",
+            invoice=item.response,
+        )
+
+    @staticmethod
+    def _store(item: BatchUploadItem):
+        """上传单个文件, 失败原因记录在 item.error"""
+        try:
+            item.object_name, _ = InvoiceService.store_stream(
+                item.stream, item.file_name, item.file_type, item.length
+            )
+        except Exception as e:
+            item.error = str(e)
@@ -0,0 +1,140 @@
+"""
+分片上传服务 - 切片直接写入 MinIO, 合并时在 MinIO 服务端拼接
+
+切片存放在 chunks/{上传目录}/{序号} 下, 上传目录由 fileHash 计算得出, 同一文件重传时可续传;
+合并通过 compose_object 在存储端完成, API 进程不缓冲整个文件。
+"""
+import hashlib
+import io
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.invoice import FileType, Invoice
+from app.services.invoice_service import InvoiceService
+from app.services.minio_service import MinioService
+from app.utils.file_utils import CONTENT_TYPES, SNIFF_BYTES, sniff_file_type, sniff_head, validate_file_size
+from app.utils.ofd_utils import is_ofd_package
+
+CHUNK_PREFIX = "chunks"
+
+
+class ChunkUploadService:
+    """分片上传服务"""
+
+    @staticmethod
+    def _upload_dir(file_hash: str) -> str:
+        """fileHash 可能包含文件名等任意字符, 统一转换为固定长度的目录名"""
+        digest = hashlib.sha1(file_hash.encode("utf-8")).hexdigest()
+        return f"{CHUNK_PREFIX}/{digest}"
+
+    @staticmethod
+    def chunk_object_name(file_hash: str, chunk_index: int) -> str:
+        return f"{ChunkUploadService._upload_dir(file_hash)}/{chunk_index:05d}"
+
+    @staticmethod
+    def _list_chunks(file_hash: str) -> Dict[int, int]:
+        """已上传的切片: 序号 → 大小"""
+        chunks = {}
+        for obj in MinioService.list_objects(ChunkUploadService._upload_dir(file_hash) + "/"):
+            name = obj.object_name.rsplit("/", 1)[-1]
+            if name.isdigit():
+                chunks[int(name)] = obj.size
+        return chunks
+
+    @staticmethod
+    def save_chunk(
+        file_hash: str,
+        chunk_index: int,
+        total_chunks: int,
+        stream: BinaryIO,
+        length: int,
+    ) -> str:
+        """保存一个切片, 返回错误信息 (成功时为空字符串)"""
+        chunk_size = settings.upload_chunk_size
+        if total_chunks < 1 or not validate_file_size((total_chunks - 1) * chunk_size + 1):
+            return f"文件大小超过{settings.upload_max_file_mb}MB限制"
+        if not 0 <= chunk_index < total_chunks:
+            return "切片序号无效"
+        # MinIO 拼接要求除最后一片外每片大小一致且不小于 5MB
+        if length > chunk_size or (chunk_index < total_chunks - 1 and length != chunk_size):
+            return f"切片大小必须为 {chunk_size // 1024 // 1024}MB (最后一片除外)"
+        # 文件头部在第一片中, 按魔数判断类型
+        if chunk_index == 0 and not sniff_head(stream):
+            return "不支持的文件类型"
+
+        MinioService.upload_file_stream(
+            stream,
+            ChunkUploadService.chunk_object_name(file_hash, chunk_index),
+            length,
+        )
+        return ""
+
+    @staticmethod
+    def uploaded_chunks(file_hash: str) -> List[int]:
+        """已上传的切片序号, 用于断点续传"""
+        return sorted(ChunkUploadService._list_chunks(file_hash))
+
+    @staticmethod
+    def merge(
+        db: Session,
+        file_hash: str,
+        filename: str,
+        total_chunks: int,
+    ) -> Tuple[Optional[Invoice], bool, str]:
+        """合并切片并创建发票, 返回 (发票, 是否重复, 错误信息)
+
+        先按顺序流式计算各切片拼接后的 SHA-256, 与已有发票内容相同时不再拼接, 直接返回已有发票。
+        文件类型按拼接后的文件头判断, 不取决于文件名; zip 头部需检查包结构确认是 OFD, 不合格的文件直接删除。
+        """
+        chunks = ChunkUploadService._list_chunks(file_hash)
+        missing = [i for i in range(total_chunks) if i not in chunks]
+        if missing:
+            return None, False, f"缺少切片: {', '.join(str(i) for i in missing)}"
+        if not validate_file_size(sum(chunks[i] for i in range(total_chunks))):
+            return None, False, f"文件大小超过{settings.upload_max_file_mb}MB限制"
+
+        chunk_names = [ChunkUploadService.chunk_object_name(file_hash, i) for i in range(total_chunks)]
+        digest = hashlib.sha256()
+        head = b""
+        for name in chunk_names:
+            for block in MinioService.iter_file(name):
+                if len(head) < SNIFF_BYTES:
+                    head += block[:SNIFF_BYTES - len(head)]
+                digest.update(block)
+        content_hash = digest.hexdigest()
+        file_type = sniff_file_type(head)
+        if not file_type:
+            ChunkUploadService._delete_chunks(file_hash, chunks)
+            return None, False, "不支持的文件类型"
+
+        existing = InvoiceService.get_by_hash(db, content_hash)
+        if existing:
+            ChunkUploadService._delete_chunks(file_hash, chunks)
+            return existing, True, ""
+
+        object_name = MinioService.generate_object_name(filename, prefix="invoices")
+        MinioService.compose_files(chunk_names, object_name, CONTENT_TYPES[file_type])
+        ChunkUploadService._delete_chunks(file_hash, chunks)
+        if file_type == FileType.OFD.value:
+            # zip 头部无法区分 OFD, 下载完整文件检查包结构 (已限制大小)
+            if not is_ofd_package(io.BytesIO(MinioService.download_file(object_name))):
+                MinioService.delete_file(object_name)
+                return None, False, "不支持的文件类型"
+
+        invoice, duplicate = InvoiceService.create_from_object(
+            db, object_name, filename, file_type, content_hash=content_hash
+        )
+        return invoice, duplicate, ""
+
+    @staticmethod
+    def _delete_chunks(file_hash: str, chunk_indexes):
+        MinioService.delete_files([
+            ChunkUploadService.chunk_object_name(file_hash, i) for i in chunk_indexes
+        ])
+
+    @staticmethod
+    def cleanup_stale() -> int:
+        """清理超过 upload_chunk_ttl_hours 未完成合并的切片, 返回删除数量"""
+        return MinioService.delete_stale(CHUNK_PREFIX + "/", settings.upload_chunk_ttl_hours)
@@ -0,0 +1,115 @@
+"""
+直传服务 - 客户端通过预签名 PUT URL 直接上传到 MinIO, API 只处理元数据
+
+文件先上传到 incoming/ 下, 登记时校验大小和文件头并计算 SHA-256, 与已有发票内容相同时直接返回已有发票,
+否则在存储端复制到 invoices/ 后创建发票; 未登记的文件由 Worker 定期清理。
+"""
+import hashlib
+import io
+import uuid
+from pathlib import Path
+from typing import Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.invoice import FileType, Invoice
+from app.schemas.invoice import PresignUploadResponse
+from app.services.invoice_service import InvoiceService
+from app.services.minio_service import MinioService
+from app.utils.file_utils import CONTENT_TYPES, SNIFF_BYTES, sniff_file_type, validate_file_size
+from app.utils.ofd_utils import is_ofd_package
+
+INCOMING_PREFIX = "incoming"
+ALLOWED_EXTENSIONS = {".pdf", ".jpg", ".jpeg", ".png", ".ofd"}
+
+
+class DirectUploadService:
+    """直传服务"""
+
+    @staticmethod
+    def presign(file_name: str, size: int) -> Tuple[Optional[PresignUploadResponse], str]:
+        """生成预签名上传URL, 返回 (响应, 错误信息)"""
+        ext = Path(file_name).suffix.lower()
+        if ext not in ALLOWED_EXTENSIONS:
+            return None, "不支持的文件类型"
+        if not validate_file_size(size):
+            return None, f"文件大小超过{settings.upload_max_file_mb}MB限制"
+
+        # 完整 UUID, 避免他人猜到对象名称后抢先登记
+        object_name = f"{INCOMING_PREFIX}/{uuid.uuid4().hex}{ext}"
+        upload_url = MinioService.get_upload_url(object_name, settings.upload_presign_expires)
+        return PresignUploadResponse(
+            objectName=object_name,
+            uploadUrl=upload_url,
+            expiresIn=settings.upload_presign_expires,
+        ), ""
+
+    @staticmethod
+    def register(
+        db: Session,
+        object_name: str,
+        file_name: str,
+        sha256: Optional[str] = None,
+    ) -> Tuple[Optional[Invoice], bool, str]:
+        """登记已直传的文件并创建发票, 返回 (发票, 是否重复, 错误信息)
+
+        SHA-256 由服务端根据存储的对象计算, 客户端传入的 sha256 只用于校验上传内容是否完整。
+        """
+        if not object_name.startswith(INCOMING_PREFIX + "/") or "/" in object_name[len(INCOMING_PREFIX) + 1:]:
+            return None, False, "对象名称无效"
+
+        try:
+            stat = MinioService.stat_file(object_name)
+        except Exception:
+            return None, False, "文件尚未上传或已登记"
+
+        # 预签名 PUT 无法限制大小和内容, 登记时校验, 不合格的文件直接删除
+        if not validate_file_size(stat.size):
+            MinioService.delete_file(object_name)
+            return None, False, f"文件大小超过{settings.upload_max_file_mb}MB限制"
+        file_type = sniff_file_type(MinioService.read_head(object_name, SNIFF_BYTES))
+        content_hash = None
+        if file_type == FileType.OFD.value:
+            # zip 头部无法区分 OFD, 下载完整文件检查包结构 (已限制大小)
+            content = MinioService.download_file(object_name)
+            if not is_ofd_package(io.BytesIO(content)):
+                file_type = None
+            content_hash = hashlib.sha256(content).hexdigest()
+        if not file_type:
+            MinioService.delete_file(object_name)
+            return None, False, "不支持的文件类型"
+
+        if content_hash is None:
+            content_hash = DirectUploadService._hash_object(object_name)
+        if sha256 and sha256.lower() != content_hash:
+            MinioService.delete_file(object_name)
+            return None, False, "文件内容与 sha256 不符, 请重新上传"
+
+        existing = InvoiceService.get_by_hash(db, content_hash)
+        if existing:
+            MinioService.delete_file(object_name)
+            return existing, True, ""
+
+        target = MinioService.generate_object_name(file_name, prefix="invoices")
+        MinioService.copy_file(object_name, target, CONTENT_TYPES[file_type])
+        MinioService.delete_file(object_name)
+
+        # 并发登记相同内容时由 content_hash 唯一约束兜底
+        invoice, duplicate = InvoiceService.create_from_object(
+            db, target, file_name, file_type, content_hash=content_hash
+        )
+        return invoice, duplicate, ""
+
+    @staticmethod
+    def _hash_object(object_name: str) -> str:
+        """分块读取对象计算 SHA-256"""
+        digest = hashlib.sha256()
+        for chunk in MinioService.iter_file(object_name):
+            digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def cleanup_stale() -> int:
+        """清理超过 upload_chunk_ttl_hours 未登记的直传文件, 返回删除数量"""
+        return MinioService.delete_stale(INCOMING_PREFIX + "/", settings.upload_chunk_ttl_hours)
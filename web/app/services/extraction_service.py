@@ -0,0 +1,163 @@
+"""
+发票字段提取队列 - 基于 invoices 表, 由 Worker 在空闲时批量处理
+
+上传只写入 pending 状态的发票, 不等待识别; Worker 批量认领 pending 发票,
+并发下载文件后在渲染进程池中提取字段并生成合并用的预处理产物, 一次提交写回:
+关键字段齐全 → verified, 否则 → reviewing; 多次下载失败 → failed。
+"""
+import hashlib
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.invoice import Invoice, InvoiceStatus
+from app.services.invoice_extractor import extract_job
+from app.services.invoice_artifacts import ArtifactService, prepare_job
+from app.services.merge_fetch import MergeFetcher
+from app.services.render_pool import RenderPool
+
+# 关键字段的中文名, 写入 extract_error 供复核时查看
+FIELD_NAMES = {
+    "number": "发票号码",
+    "date": "开票日期",
+    "seller_name": "销方名称",
+    "total_amount": "价税合计",
+}
+
+
+def ingest_job(args):
+    """进程池任务: 同一文件的字段提取和预处理在一次传输中完成"""
+    file_type, content, dpi, jpeg_quality = args
+    return extract_job((file_type, content)), prepare_job((file_type, content, dpi, jpeg_quality))
+
+
+class ExtractionService:
+    """发票字段提取队列"""
+
+    @staticmethod
+    def claim_batch(db: Session, worker_id: str, limit: int) -> List[Invoice]:
+        """认领一批待提取的发票, 认领超时的发票可被重新认领"""
+        now = datetime.now()
+        claimable = [
+            Invoice.status == InvoiceStatus.PENDING.value,
+            func.coalesce(Invoice.extract_attempts, 0) < settings.extract_max_attempts,
+            or_(
+                Invoice.extract_worker.is_(None),
+                Invoice.extract_claimed_at < now - timedelta(seconds=settings.extract_claim_timeout_seconds),
+            ),
+        ]
+        candidates = [
+            invoice_id for (invoice_id,) in db.query(Invoice.id)
+            .filter(*claimable)
+            .order_by(Invoice.created_at.asc())
+            .limit(limit)
+            .all()
+        ]
+        if not candidates:
+            return []
+
+        # 条件 UPDATE 一次认领整批, 其他 Worker 已认领的行不会被覆盖
+        db.query(Invoice) \
+            .filter(Invoice.id.in_(candidates), *claimable) \
+            .update({
+                Invoice.extract_worker: worker_id,
+                Invoice.extract_claimed_at: now,
+                Invoice.extract_attempts: func.coalesce(Invoice.extract_attempts, 0) + 1,
+            }, synchronize_session=False)
+        db.commit()
+
+        return db.query(Invoice) \
+            .filter(
+                Invoice.id.in_(candidates),
+                Invoice.extract_worker == worker_id,
+                Invoice.extract_claimed_at == now,
+            ) \
+            .all()
+
+    @staticmethod
+    def run_batch(db: Session, worker_id: str) -> int:
+        """处理一批待提取的发票, 返回处理数量"""
+        invoices = ExtractionService.claim_batch(db, worker_id, settings.extract_batch_size)
+        if not invoices:
+            return 0
+
+        fetched = MergeFetcher.fetch([inv.id for inv in invoices], invoices)
+        results = RenderPool.map(ingest_job, [
+            (item.type, item.content, settings.merge_image_dpi, settings.merge_jpeg_quality)
+            for item in fetched.inputs
+        ])
+        hashes = ExtractionService._missing_hashes(db, fetched.inputs)
+
+        now = datetime.now()
+        for item, ((fields, error), (artifact, _)) in zip(fetched.inputs, results):
+            invoice = item.invoice
+            # 预处理失败不影响字段提取, 合并时回退到原文件
+            if artifact is not None:
+                try:
+                    ArtifactService.apply(invoice, len(item.content), artifact)
+                except Exception:
+                    pass
+            if fields is None:
+                invoice.status = InvoiceStatus.REVIEWING.value
+                invoice.extract_error = error[:500]
+            else:
+                for key, value in fields.values().items():
+                    setattr(invoice, key, value)
+                invoice.status = fields.status
+                invoice.extract_error = (
+                    "未识别: " + "、".join(FIELD_NAMES[key] for key in fields.missing)
+                    if fields.missing else None
+                )
+            invoice.extract_worker = None
+            invoice.updated_at = now
+
+        invoice_map = {inv.id: inv for inv in invoices}
+        for failure in fetched.failures:
+            # 保留认领, 超过认领超时后再重试
+            invoice = invoice_map[failure.invoice_id]
+            invoice.extract_error = failure.reason[:500]
+            if invoice.extract_attempts >= settings.extract_max_attempts:
+                invoice.status = InvoiceStatus.FAILED.value
+                invoice.updated_at = now
+
+        db.commit()
+        ExtractionService._backfill_hashes(db, hashes)
+        return len(invoices)
+
+    @staticmethod
+    def _backfill_hashes(db: Session, hashes: Dict[str, str]):
+        """逐条写入补算的内容哈希, 与并发写入的发票冲突 (唯一索引) 时跳过该条, 不影响提取结果"""
+        for invoice_id, content_hash in hashes.items():
+            try:
+                db.query(Invoice) \
+                    .filter(Invoice.id == invoice_id, Invoice.content_hash.is_(None)) \
+                    .update({Invoice.content_hash: content_hash}, synchronize_session=False)
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+
+    @staticmethod
+    def _missing_hashes(db: Session, inputs) -> Dict[str, str]:
+        """为尚无内容哈希的发票 (如直传文件) 补算 SHA-256, 与已有发票冲突时跳过"""
+        hashes = {
+            item.invoice.id: hashlib.sha256(item.content).hexdigest()
+            for item in inputs
+            if not item.invoice.content_hash
+        }
+        if not hashes:
+            return {}
+        taken = {
+            content_hash for (content_hash,) in db.query(Invoice.content_hash)
+            .filter(Invoice.content_hash.in_(set(hashes.values())))
+            .all()
+        }
+        result = {}
+        for invoice_id, content_hash in hashes.items():
+            if content_hash not in taken:
+                taken.add(content_hash)
+                result[invoice_id] = content_hash
+        return result
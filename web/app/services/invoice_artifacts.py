@@ -0,0 +1,115 @@
+"""
+发票预处理产物 - 入库时为每张发票生成合并可直接使用的版本, 并记录页数、尺寸和大小
+
+- PDF: 原文件即可矢量拼版, 只记录页数和首页尺寸
+- OFD: 转换后的 PDF (即 OFD 转换缓存)
+- 图片: 按标准槽位和合并 DPI 预先缩放、校正方向; 无需处理的图片直接使用原文件
+
+合并 PDF 时读取产物代替原文件, 图片只需从较小的产物做最终缩放;
+页数和产物大小记录在发票上, 可在下载前估算合并结果的页数和体积。
+"""
+import io
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from PIL import Image
+from pypdf import PdfReader
+from reportlab.lib.pagesizes import A4
+
+from app.models.invoice import FileType, Invoice
+from app.services.minio_service import MinioService
+from app.services.ofd_conversion import OfdConversionService
+from app.utils.image_utils import normalize_image
+from app.utils.ofd_render import render_ofd_to_pdf
+
+# 标准槽位: 任何布局的槽位都放得进 A4 长边见方, 按它缩放的图片满足所有布局的分辨率
+STANDARD_SLOT = (A4[1], A4[1])
+
+
+@dataclass
+class PreparedArtifact:
+    """预处理结果, data 为 None 表示直接使用原文件"""
+    page_count: int
+    width: float
+    height: float
+    data: Optional[bytes] = None
+    content_type: str = ""
+    suffix: str = ""
+
+
+def _measure_pdf(content: bytes) -> Tuple[int, float, float]:
+    """PDF 页数和首页显示尺寸 (pt, 已考虑旋转)"""
+    reader = PdfReader(io.BytesIO(content))
+    if not reader.pages:
+        return 0, 0.0, 0.0
+    page = reader.pages[0]
+    width, height = float(page.cropbox.width), float(page.cropbox.height)
+    if (page.rotation or 0) % 180:
+        width, height = height, width
+    return len(reader.pages), width, height
+
+
+def _prepare_image(content: bytes, dpi: int, jpeg_quality: int) -> PreparedArtifact:
+    original = Image.open(io.BytesIO(content))
+    normalized = normalize_image(content, STANDARD_SLOT, dpi, jpeg_quality)
+
+    if normalized.jpeg:
+        if normalized.data is content:
+            return PreparedArtifact(1, *original.size)
+        size = Image.open(io.BytesIO(normalized.data)).size
+        return PreparedArtifact(1, *size, data=normalized.data, content_type="image/jpeg", suffix="jpg")
+
+    # 非 JPEG 返回原始像素: 尺寸和方向都未改变时使用原文件, 否则无损编码为 PNG
+    if normalized.size == original.size and original.getexif().get(0x0112, 1) == 1:
+        return PreparedArtifact(1, *original.size)
+    buffer = io.BytesIO()
+    Image.frombytes(normalized.mode, normalized.size, normalized.data).save(buffer, format="PNG", optimize=True)
+    return PreparedArtifact(1, *normalized.size, data=buffer.getvalue(), content_type="image/png", suffix="png")
+
+
+def prepare_artifact(file_type: str, content: bytes, dpi: int, jpeg_quality: int) -> PreparedArtifact:
+    """生成单个文件的预处理产物"""
+    if file_type == FileType.PDF.value:
+        return PreparedArtifact(*_measure_pdf(content))
+    if file_type == FileType.OFD.value:
+        pdf = render_ofd_to_pdf(content)
+        return PreparedArtifact(*_measure_pdf(pdf), data=pdf, content_type="application/pdf")
+    return _prepare_image(content, dpi, jpeg_quality)
+
+
+def prepare_job(args) -> Tuple[Optional[PreparedArtifact], str]:
+    """进程池任务: 预处理单个文件, 返回 (结果, 错误信息)"""
+    file_type, content, dpi, jpeg_quality = args
+    try:
+        return prepare_artifact(file_type, content, dpi, jpeg_quality), ""
+    except Exception as e:
+        return None, f"预处理失败: {e}"
+
+
+class ArtifactService:
+    """发票预处理产物服务"""
+
+    @staticmethod
+    def artifact_name(invoice: Invoice, artifact: PreparedArtifact) -> str:
+        """产物对象名称: OFD 与转换缓存共用, 图片为 "<原对象名>.slot.<扩展名>" """
+        object_name = MinioService.object_name_from_url(invoice.file_url)
+        if invoice.file_type == FileType.OFD.value:
+            return OfdConversionService.converted_name(object_name)
+        return f"{object_name}.slot.{artifact.suffix}"
+
+    @staticmethod
+    def apply(invoice: Invoice, content_size: int, artifact: PreparedArtifact):
+        """上传产物并把页数、尺寸和大小写入发票 (不提交)"""
+        invoice.file_size = content_size
+        invoice.page_count = artifact.page_count
+        invoice.page_width = artifact.width
+        invoice.page_height = artifact.height
+        if artifact.data is None:
+            invoice.artifact_object = None
+            invoice.artifact_size = content_size
+            return
+
+        object_name = ArtifactService.artifact_name(invoice, artifact)
+        MinioService.upload_file(artifact.data, object_name, artifact.content_type)
+        invoice.artifact_object = object_name
+        invoice.artifact_size = len(artifact.data)
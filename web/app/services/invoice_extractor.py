@@ -0,0 +1,203 @@
+"""
+发票字段提取 - 从文件内容中识别发票代码、号码、金额等字段
+
+- 电子发票 PDF: 读取 pypdf 文本层
+- OFD: 优先读取 CustomTag 语义字段, 缺失的字段再从全文中匹配
+- 图片: 交给可插拔的 OCR 识别器 (EXTRACT_RECOGNIZER), 本地默认使用不识别任何文字的桩实现
+
+提取函数运行在渲染进程池中, 输入输出只包含可在进程间传递的简单数据。
+"""
+import importlib
+import io
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.models.invoice import FileType, InvoiceStatus, InvoiceType
+from app.utils.ofd_utils import OfdDocument
+
+_AMOUNT = r"[¥￥]?\s*(-?[\d,]+\.\d{2})"
+
+# 发票类型关键词, 按顺序匹配
+_TYPE_KEYWORDS = [
+    ("航空运输电子客票", InvoiceType.FLIGHT.value),
+    ("出租", InvoiceType.TAXI.value),
+    ("住宿", InvoiceType.HOTEL.value),
+    ("专用发票", InvoiceType.VAT_SPECIAL.value),
+    ("普通发票", InvoiceType.VAT_NORMAL.value),
+]
+
+# OFD CustomTag 字段名 → 提取字段
+_OFD_TAGS = {
+    "InvoiceCode": "code",
+    "InvoiceNo": "number",
+    "IssueDate": "date",
+    "BuyerName": "buyer_name",
+    "SellerName": "seller_name",
+    "TaxExclusiveTotalAmount": "amount",
+    "TaxTotalAmount": "tax_amount",
+    "TaxInclusiveTotalAmount": "total_amount",
+}
+
+
+@dataclass
+class ExtractedFields:
+    """提取结果, 未识别的字段为 None"""
+    type: Optional[str] = None
+    code: Optional[str] = None
+    number: Optional[str] = None
+    date: Optional[str] = None
+    seller_name: Optional[str] = None
+    buyer_name: Optional[str] = None
+    amount: Optional[float] = None
+    tax_amount: Optional[float] = None
+    total_amount: Optional[float] = None
+    missing: List[str] = field(default_factory=list)
+
+    @property
+    def status(self) -> str:
+        """关键字段齐全时为已核验, 否则需人工复核"""
+        return InvoiceStatus.REVIEWING.value if self.missing else InvoiceStatus.VERIFIED.value
+
+    def values(self) -> Dict[str, object]:
+        """已识别的字段"""
+        return {
+            key: value
+            for key, value in self.__dict__.items()
+            if key != "missing" and value is not None
+        }
+
+
+class Recognizer:
+    """图片 OCR 识别器接口, 实现 recognize 返回图片中的全部文字"""
+
+    def recognize(self, content: bytes) -> str:
+        raise NotImplementedError
+
+
+class StubRecognizer(Recognizer):
+    """本地开发用的桩识别器, 不识别任何文字 (图片发票进入人工复核)"""
+
+    def recognize(self, content: bytes) -> str:
+        return ""
+
+
+@lru_cache(maxsize=1)
+def get_recognizer() -> Recognizer:
+    """按 EXTRACT_RECOGNIZER ("模块路径:类名") 加载识别器, 未配置时使用桩实现"""
+    if not settings.extract_recognizer:
+        return StubRecognizer()
+    module_name, _, class_name = settings.extract_recognizer.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+def _parse_amount(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    match = re.search(r"-?[\d,]+(\.\d+)?", value)
+    return float(match.group(0).replace(",", "")) if match else None
+
+
+def _parse_date(value: Optional[str]) -> Optional[str]:
+    if not value:
+        return None
+    match = re.search(r"(\d{4})\s*[年\-/.]\s*(\d{1,2})\s*[月\-/.]\s*(\d{1,2})", value)
+    if not match:
+        return None
+    year, month, day = match.groups()
+    return f"{year}-{int(month):02d}-{int(day):02d}"
+
+
+def parse_invoice_text(text: str) -> ExtractedFields:
+    """从发票全文中匹配字段"""
+    fields = ExtractedFields()
+    compact = re.sub(r"[ \t　]+", " ", text)
+
+    for keyword, invoice_type in _TYPE_KEYWORDS:
+        if keyword in compact:
+            fields.type = invoice_type
+            break
+
+    match = re.search(r"发票代码\s*[:：]?\s*(\d{10,12})", compact)
+    if match:
+        fields.code = match.group(1)
+    match = re.search(r"发票号码\s*[:：]?\s*(\d{8,20})", compact)
+    if match:
+        fields.number = match.group(1)
+    match = re.search(r"开票日期\s*[:：]?\s*([\d年月日\-/. ]{8,})", compact)
+    if match:
+        fields.date = _parse_date(match.group(1))
+
+    # 版面顺序为购买方在前、销售方在后
+    names = re.findall(r"名\s*称\s*[:：]\s*([^\s:：]{2,})", compact)
+    if names:
+        fields.buyer_name = names[0]
+    if len(names) > 1:
+        fields.seller_name = names[1]
+
+    match = re.search(r"[（(]\s*小写\s*[）)]\s*" + _AMOUNT, compact)
+    if match:
+        fields.total_amount = _parse_amount(match.group(1))
+    match = re.search(r"合\s*计\s*" + _AMOUNT + r"\s*" + _AMOUNT, compact)
+    if match:
+        fields.amount = _parse_amount(match.group(1))
+        fields.tax_amount = _parse_amount(match.group(2))
+    if fields.total_amount is None and fields.amount is not None and fields.tax_amount is not None:
+        fields.total_amount = round(fields.amount + fields.tax_amount, 2)
+
+    return fields
+
+
+def _extract_pdf(content: bytes) -> ExtractedFields:
+    from pypdf import PdfReader
+
+    reader = PdfReader(io.BytesIO(content))
+    # 发票信息都在第一页, 多页时只读前两页
+    text = "\n".join(page.extract_text() or "" for page in reader.pages[:2])
+    return parse_invoice_text(text)
+
+
+def _extract_ofd(content: bytes) -> ExtractedFields:
+    document = OfdDocument(content)
+    fields = parse_invoice_text(document.plain_text())
+
+    for tag, value in document.tagged_fields().items():
+        key = _OFD_TAGS.get(tag)
+        if not key or not value:
+            continue
+        if key == "date":
+            parsed = _parse_date(value)
+        elif key in ("amount", "tax_amount", "total_amount"):
+            parsed = _parse_amount(value)
+        else:
+            parsed = value
+        if parsed is not None:
+            setattr(fields, key, parsed)
+    return fields
+
+
+def extract_fields(file_type: str, content: bytes) -> ExtractedFields:
+    """提取发票字段, 并标记缺失的关键字段"""
+    if file_type == FileType.PDF.value:
+        fields = _extract_pdf(content)
+    elif file_type == FileType.OFD.value:
+        fields = _extract_ofd(content)
+    else:
+        fields = parse_invoice_text(get_recognizer().recognize(content))
+
+    fields.missing = [
+        key for key in ("number", "date", "seller_name", "total_amount")
+        if not getattr(fields, key)
+    ]
+    return fields
+
+
+def extract_job(args) -> Tuple[Optional[ExtractedFields], str]:
+    """进程池任务: 提取单个文件, 返回 (结果, 错误信息)"""
+    file_type, content = args
+    try:
+        return extract_fields(file_type, content), ""
+    except Exception as e:
+        return None, f"字段提取失败: {e}"
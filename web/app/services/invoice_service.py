@@ -3,14 +3,18 @@
 """
 import uuid
 from datetime import datetime
-from typing import List, Optional, Tuple
+from typing import BinaryIO, List, Optional, Tuple
 
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
+from app.config import settings
 from app.models.invoice import Invoice, InvoiceStatus, InvoiceType, FileType
 from app.schemas.invoice import InvoiceResponse, DashboardStats
-from app.utils.file_utils import get_file_type_from_name
+from app.utils.file_utils import CONTENT_TYPES, HashingReader, get_file_type_from_name, hash_stream
 from app.services.minio_service import MinioService
+from app.services.ofd_conversion import OfdConversionService
+from app.services.thumbnail_service import ThumbnailService
 
 
 class InvoiceService:
@@ -66,25 +70,61 @@ class InvoiceService:
         return content_types.get(ext, "application/octet-stream")
 
     @staticmethod
-    async def create_from_file(db: Session, file_content: bytes, filename: str) -> Invoice:
-        """从文件创建发票"""
-        invoice_id = InvoiceService.generate_id()
-
-        # 上传到 MinIO
+    def store_stream(
+        stream: BinaryIO,
+        filename: str,
+        file_type: str,
+        length: int = -1,
+    ) -> Tuple[str, str]:
+        """把文件流上传到 MinIO, 返回 (对象名称, SHA-256)
+
+        内容边读边上传, 同时计算 SHA-256 并检查大小, 超过上限时抛出 FileTooLargeError。
+        file_type 为嗅探得到的实际文件类型。
+        """
+        reader = HashingReader(stream, settings.upload_max_file_mb * 1024 * 1024)
         object_name = MinioService.generate_object_name(filename, prefix="invoices")
-        content_type = InvoiceService.get_content_type(filename)
-        MinioService.upload_file(file_content, object_name, content_type)
+        MinioService.upload_file_stream(reader, object_name, length, CONTENT_TYPES[file_type])
+        return object_name, reader.sha256
 
-        # 获取访问URL
-        file_url = MinioService.get_public_url(object_name)
+    @staticmethod
+    def get_by_hash(db: Session, content_hash: str) -> Optional[Invoice]:
+        """根据文件内容哈希获取发票"""
+        return db.query(Invoice).filter(Invoice.content_hash == content_hash).first()
 
+    @staticmethod
+    def create_from_stream(
+        db: Session,
+        stream: BinaryIO,
+        filename: str,
+        file_type: str,
+        length: int = -1,
+    ) -> Tuple[Invoice, bool]:
+        """从文件流创建发票, 返回 (发票, 是否重复)
+
+        内容与已有发票完全相同时不再上传, 直接返回已有发票。
+        """
+        existing = InvoiceService.get_by_hash(db, hash_stream(stream))
+        if existing:
+            return existing, True
+
+        object_name, content_hash = InvoiceService.store_stream(stream, filename, file_type, length)
+        return InvoiceService.create_from_object(db, object_name, filename, file_type, content_hash)
+
+    @staticmethod
+    def build_invoice(
+        object_name: str,
+        filename: str,
+        file_type: Optional[str] = None,
+        content_hash: Optional[str] = None,
+    ) -> Invoice:
+        """为已存入 MinIO 的文件构建发票记录 (未写入数据库)"""
         now = datetime.now()
 
-        # 创建发票记录 (模拟OCR识别)
-        invoice = Invoice(
-            id=invoice_id,
-            code=f"0440019{str(uuid.uuid4().int)[:5]}",
-            number=str(uuid.uuid4().int)[:8],
+        # 字段由 Worker 异步提取 (ExtractionService), 此处只写入占位值
+        return Invoice(
+            id=InvoiceService.generate_id(),
+            code="",
+            number="",
             type=InvoiceType.OTHER.value,
             seller_name="待识别商户",
             buyer_name="待识别购方",
@@ -93,17 +133,44 @@ class InvoiceService:
             tax_amount=0.0,
             total_amount=0.0,
             status=InvoiceStatus.PENDING.value,
-            file_url=file_url,
-            file_type=get_file_type_from_name(filename),
+            file_url=MinioService.get_public_url(object_name),
+            file_type=file_type or get_file_type_from_name(filename),
+            content_hash=content_hash,
             created_at=now,
             updated_at=now,
         )
 
+    @staticmethod
+    def create_from_object(
+        db: Session,
+        object_name: str,
+        filename: str,
+        file_type: Optional[str] = None,
+        content_hash: Optional[str] = None,
+    ) -> Tuple[Invoice, bool]:
+        """为已存入 MinIO 的文件创建发票记录, 返回 (发票, 是否重复)"""
+        invoice = InvoiceService.build_invoice(object_name, filename, file_type, content_hash)
+        return InvoiceService.save_new(db, invoice)
+
+    @staticmethod
+    def save_new(db: Session, invoice: Invoice) -> Tuple[Invoice, bool]:
+        """写入新发票, 返回 (发票, 是否重复)
+
+        相同内容被并发上传时 content_hash 唯一约束冲突, 删除本次上传的对象并返回已有发票。
+        """
         db.add(invoice)
-        db.commit()
-        db.refresh(invoice)
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            existing = InvoiceService.get_by_hash(db, invoice.content_hash) if invoice.content_hash else None
+            if existing is None:
+                raise
+            MinioService.delete_file(MinioService.object_name_from_url(invoice.file_url))
+            return existing, True
 
-        return invoice
+        db.refresh(invoice)
+        return invoice, False
 
     @staticmethod
     def delete(db: Session, invoice_id: str) -> bool:
@@ -113,9 +180,13 @@ class InvoiceService:
             # 从 MinIO 删除文件
             if invoice.file_url:
                 try:
-                    # 从URL提取object_name
-                    object_name = "/".join(invoice.file_url.split("/")[-2:])
+                    object_name = MinioService.object_name_from_url(invoice.file_url)
                     MinioService.delete_file(object_name)
+                    if invoice.file_type == FileType.OFD.value:
+                        OfdConversionService.delete_cached(object_name)
+                    elif invoice.artifact_object:
+                        MinioService.delete_file(invoice.artifact_object)
+                    ThumbnailService.delete_all(object_name)
                 except Exception:
                     pass
 
@@ -146,8 +217,8 @@ class InvoiceService:
         )
 
     @staticmethod
-    def to_response(invoice: Invoice) -> InvoiceResponse:
-        """转换为响应对象"""
+    def to_response(invoice: Invoice, duplicate: bool = False) -> InvoiceResponse:
+        """转换为响应对象, duplicate 表示上传的文件与该发票内容相同"""
         return InvoiceResponse(
             id=invoice.id,
             code=invoice.code,
@@ -164,4 +235,5 @@ class InvoiceService:
             fileType=invoice.file_type,
             createdAt=invoice.created_at.isoformat() + "Z" if invoice.created_at else "",
             updatedAt=invoice.updated_at.isoformat() + "Z" if invoice.updated_at else "",
+            duplicate=duplicate,
         )
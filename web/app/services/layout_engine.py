@@ -0,0 +1,156 @@
+"""
+服务端排版引擎 - 与前端 LayoutConfig (src/stores/layout.ts) 保持一致
+
+页面几何在每个任务中只计算一次, 所有页面复用同一组槽位。
+坐标为 PDF 坐标系 (单位 pt, 原点在左下角), 槽位按从上到下、从左到右的顺序排列。
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+from reportlab.pdfgen.canvas import Canvas
+
+from app.schemas.merge_task import LayoutOptions
+
+# 布局 → (列数, 行数)
+GRID = {
+    "1x1": (1, 1),
+    "2x1": (1, 2),
+    "2x2": (2, 2),
+}
+
+INVOICE_TYPE_NAMES = {
+    "vat_special": "增值税专用",
+    "vat_normal": "增值税普通",
+    "flight": "航空客票",
+    "taxi": "出租车票",
+    "hotel": "酒店住宿",
+    "other": "其他",
+}
+
+# 内置中文字体 (无需字体文件)
+CJK_FONT = "STSong-Light"
+pdfmetrics.registerFont(UnicodeCIDFont(CJK_FONT))
+
+# 与前端 canvas 渲染一致的装饰尺寸 (96dpi 像素 → pt)
+_PX = 72 / 96
+LABEL_WIDTH = 80 * _PX
+LABEL_HEIGHT = 24 * _PX
+PAGE_NUMBER_OFFSET = 20 * _PX
+
+
+@dataclass(frozen=True)
+class Slot:
+    """页面上放置一张发票的区域"""
+    x: float
+    y: float
+    width: float
+    height: float
+
+    def fit(self, width: float, height: float) -> Tuple[float, float, float]:
+        """等比缩放内容居中放入槽位, 返回 (缩放比例, x, y)"""
+        scale = min(self.width / width, self.height / height)
+        x = self.x + (self.width - width * scale) / 2
+        y = self.y + (self.height - height * scale) / 2
+        return scale, x, y
+
+
+@dataclass(frozen=True)
+class PageGeometry:
+    """一个任务的页面几何"""
+    page_width: float
+    page_height: float
+    slots: Tuple[Slot, ...]
+
+    @property
+    def per_page(self) -> int:
+        return len(self.slots)
+
+    @property
+    def page_size(self) -> Tuple[float, float]:
+        return self.page_width, self.page_height
+
+    def page_count(self, item_count: int) -> int:
+        """item_count 个槽位内容需要的页数"""
+        return (item_count + self.per_page - 1) // self.per_page
+
+    def locate(self, index: int) -> Tuple[int, Slot]:
+        """第 index 个内容所在的 (页序号, 槽位)"""
+        return index // self.per_page, self.slots[index % self.per_page]
+
+
+class LayoutEngine:
+    """排版引擎"""
+
+    @staticmethod
+    def compute(options: Optional[LayoutOptions] = None) -> PageGeometry:
+        """计算页面几何"""
+        options = options or LayoutOptions()
+        return LayoutEngine._compute(options.layout, options.orientation, options.margin, options.gap)
+
+    @staticmethod
+    @lru_cache(maxsize=64)
+    def _compute(layout: str, orientation: str, margin_mm: float, gap_mm: float) -> PageGeometry:
+        page_width, page_height = landscape(A4) if orientation == "landscape" else A4
+        cols, rows = GRID[layout]
+        margin = margin_mm * mm
+        gap = gap_mm * mm
+
+        cell_width = (page_width - 2 * margin - gap * (cols - 1)) / cols
+        cell_height = (page_height - 2 * margin - gap * (rows - 1)) / rows
+        if cell_width <= 0 or cell_height <= 0:
+            raise ValueError("边距或间距过大, 页面放不下发票")
+
+        slots = []
+        for row in range(rows):
+            for col in range(cols):
+                slots.append(Slot(
+                    x=margin + col * (cell_width + gap),
+                    y=page_height - margin - (row + 1) * cell_height - row * gap,
+                    width=cell_width,
+                    height=cell_height,
+                ))
+        return PageGeometry(page_width, page_height, tuple(slots))
+
+    @staticmethod
+    def draw_category_label(c: Canvas, slot: Slot, invoice_type: Optional[str]):
+        """在槽位左上角绘制发票分类标签"""
+        c.saveState()
+        c.setFillColorRGB(19 / 255, 127 / 255, 236 / 255, alpha=0.9)
+        c.rect(slot.x, slot.y + slot.height - LABEL_HEIGHT, LABEL_WIDTH, LABEL_HEIGHT, stroke=0, fill=1)
+        c.setFillColorRGB(1, 1, 1)
+        c.setFont(CJK_FONT, 9)
+        c.drawString(
+            slot.x + 6,
+            slot.y + slot.height - LABEL_HEIGHT + 6,
+            INVOICE_TYPE_NAMES.get(invoice_type or "", "未知类型"),
+        )
+        c.restoreState()
+
+    @staticmethod
+    def draw_page_number(c: Canvas, geometry: PageGeometry, page_index: int, total_pages: int):
+        """在页面底部居中绘制页码"""
+        c.saveState()
+        c.setFillColorRGB(107 / 255, 114 / 255, 128 / 255)
+        c.setFont(CJK_FONT, 9)
+        c.drawCentredString(
+            geometry.page_width / 2,
+            PAGE_NUMBER_OFFSET,
+            f"第 {page_index + 1} 页 / 共 {total_pages} 页",
+        )
+        c.restoreState()
+
+    @staticmethod
+    def draw_placeholder(c: Canvas, slot: Slot, text: str):
+        """文件无法渲染时绘制占位块"""
+        c.saveState()
+        c.setFillColorRGB(0.95, 0.96, 0.96)
+        c.rect(slot.x, slot.y, slot.width, slot.height, stroke=0, fill=1)
+        c.setFillColorRGB(0.61, 0.64, 0.69)
+        c.setFont(CJK_FONT, 11)
+        c.drawCentredString(slot.x + slot.width / 2, slot.y + slot.height / 2, text)
+        c.restoreState()
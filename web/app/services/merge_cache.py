@@ -0,0 +1,205 @@
+"""
+合并结果缓存 - 内容寻址 + 单飞 (single-flight)
+
+缓存键由有序发票ID、各文件内容指纹、输出类型和排版参数计算得出。
+同一缓存键同时只有一个任务 (leader) 生成结果, 其余任务等待并直接复用其对象。
+缓存条目在最后一次使用后保留 merge_cache_ttl_hours, 过期后连同对象一起清理, 引用该对象的已完成任务标记为 expired。
+"""
+import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.invoice import Invoice
+from app.models.merge_cache import MergeCache, MergeCacheStatus
+from app.models.merge_task import MergeTask, MergeTaskStatus
+from app.services.minio_service import MinioService
+
+
+class MergeCacheService:
+    """合并结果缓存服务"""
+
+    @staticmethod
+    def compute_key(
+        invoice_ids: List[str],
+        invoices: List[Invoice],
+        output_type: str,
+        options: Optional[dict] = None,
+    ) -> Optional[str]:
+        """计算缓存键, 有发票缺失或无法获取文件指纹时返回 None (不走缓存)"""
+        invoice_map = {inv.id: inv for inv in invoices}
+        targets = [invoice_map.get(invoice_id) for invoice_id in invoice_ids]
+        if not targets or any(inv is None or not inv.file_url for inv in targets):
+            return None
+
+        def fingerprint(inv: Invoice) -> str:
+            stat = MinioService.stat_file(MinioService.object_name_from_url(inv.file_url))
+            return f"{stat.etag}:{stat.size}"
+
+        workers = max(1, min(settings.merge_fetch_concurrency, len(targets)))
+        try:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="merge-stat") as pool:
+                fingerprints = list(pool.map(fingerprint, targets))
+        except Exception:
+            return None
+
+        payload = json.dumps({
+            "invoices": list(zip(invoice_ids, fingerprints)),
+            "outputType": output_type,
+            "options": options or {},
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def acquire(
+        db: Session,
+        key: str,
+        task_id: str,
+        checkpoint: Optional[Callable[[], None]] = None,
+    ) -> Optional[MergeCache]:
+        """获取缓存结果
+
+        命中时返回已就绪的缓存条目; 返回 None 表示当前任务成为 leader, 需要自行生成并 publish/abandon。
+        其他任务正在生成同一结果时阻塞等待, 每轮等待前调用 checkpoint (如 MergeGuard.check), 可抛出异常中止等待。
+        """
+        while True:
+            if checkpoint is not None:
+                checkpoint()
+            entry = MergeCacheService._hit(db, key)
+            if entry is not None:
+                return entry
+
+            db.add(MergeCache(
+                key=key,
+                status=MergeCacheStatus.BUILDING.value,
+                owner_task_id=task_id,
+                created_at=datetime.now(),
+                last_used_at=datetime.now(),
+            ))
+            try:
+                db.commit()
+                return None
+            except IntegrityError:
+                db.rollback()
+
+            # 已有任务在生成: leader 失联则接管, 否则等待其完成
+            if MergeCacheService._take_over_if_orphaned(db, key, task_id):
+                return None
+            time.sleep(settings.merge_worker_poll_interval)
+
+    @staticmethod
+    def _hit(db: Session, key: str) -> Optional[MergeCache]:
+        """命中就绪条目并刷新使用时间 (与过期清理互斥)"""
+        updated = db.query(MergeCache) \
+            .filter(MergeCache.key == key, MergeCache.status == MergeCacheStatus.READY.value) \
+            .update({MergeCache.last_used_at: datetime.now()}, synchronize_session=False)
+        db.commit()
+        if not updated:
+            return None
+        return db.query(MergeCache).filter(MergeCache.key == key).first()
+
+    @staticmethod
+    def _take_over_if_orphaned(db: Session, key: str, task_id: str) -> bool:
+        """leader 任务已不在处理中 (失败/被回收/心跳超时) 时接管生成权"""
+        entry = db.query(MergeCache).filter(MergeCache.key == key).first()
+        if entry is None or entry.status != MergeCacheStatus.BUILDING.value:
+            return False
+
+        owner = db.query(MergeTask).filter(MergeTask.id == entry.owner_task_id).first()
+        deadline = datetime.now() - timedelta(seconds=settings.merge_task_stale_seconds)
+        alive = (
+            owner is not None
+            and owner.status == MergeTaskStatus.PROCESSING.value
+            and owner.heartbeat_at is not None
+            and owner.heartbeat_at >= deadline
+        )
+        if alive:
+            return False
+
+        updated = db.query(MergeCache) \
+            .filter(
+                MergeCache.key == key,
+                MergeCache.status == MergeCacheStatus.BUILDING.value,
+                MergeCache.owner_task_id == entry.owner_task_id,
+            ) \
+            .update({MergeCache.owner_task_id: task_id}, synchronize_session=False)
+        db.commit()
+        return bool(updated)
+
+    @staticmethod
+    def publish(
+        db: Session,
+        key: str,
+        task_id: str,
+        output_type: str,
+        object_name: str,
+        total_pages: int,
+    ):
+        """leader 生成完成, 发布缓存结果"""
+        now = datetime.now()
+        db.query(MergeCache) \
+            .filter(MergeCache.key == key, MergeCache.owner_task_id == task_id) \
+            .update({
+                MergeCache.status: MergeCacheStatus.READY.value,
+                MergeCache.output_type: output_type,
+                MergeCache.object_name: object_name,
+                MergeCache.total_pages: total_pages,
+                MergeCache.last_used_at: now,
+            }, synchronize_session=False)
+        db.commit()
+
+    @staticmethod
+    def abandon(db: Session, key: str, task_id: str):
+        """leader 生成失败或结果不可复用, 释放生成权"""
+        db.query(MergeCache) \
+            .filter(
+                MergeCache.key == key,
+                MergeCache.owner_task_id == task_id,
+                MergeCache.status == MergeCacheStatus.BUILDING.value,
+            ) \
+            .delete(synchronize_session=False)
+        db.commit()
+
+    @staticmethod
+    def evict_expired(db: Session) -> int:
+        """清理超过保留期未被使用的缓存结果, 返回清理数量
+
+        引用被删除对象的已完成任务 (生成该结果的任务和命中缓存的任务) 标记为 expired, 不再提供下载。
+        """
+        cutoff = datetime.now() - timedelta(hours=settings.merge_cache_ttl_hours)
+        expired = db.query(MergeCache.key, MergeCache.object_name) \
+            .filter(
+                MergeCache.status == MergeCacheStatus.READY.value,
+                MergeCache.last_used_at < cutoff,
+            ) \
+            .all()
+
+        evicted = 0
+        for key, object_name in expired:
+            # 条件删除: 期间被再次命中的条目不会被删除
+            deleted = db.query(MergeCache) \
+                .filter(MergeCache.key == key, MergeCache.last_used_at < cutoff) \
+                .delete(synchronize_session=False)
+            if deleted and object_name:
+                db.query(MergeTask) \
+                    .filter(
+                        MergeTask.object_name == object_name,
+                        MergeTask.status == MergeTaskStatus.COMPLETED.value,
+                    ) \
+                    .update({
+                        MergeTask.status: MergeTaskStatus.EXPIRED.value,
+                        MergeTask.download_url: None,
+                        MergeTask.error_message: "合并结果已过期清理, 请重新合并",
+                    }, synchronize_session=False)
+            db.commit()
+            if deleted:
+                if object_name:
+                    MinioService.delete_file(object_name)
+                evicted += 1
+        return evicted
@@ -0,0 +1,235 @@
+"""
+合并文件下载转发 - 经 API 从 MinIO 分块读取合并结果, 不依赖桶公开可读
+
+ETag / Last-Modified 取自 MinIO 对象, 浏览器带 If-None-Match / If-Modified-Since 重新验证时返回 304;
+支持单个 Range 请求 (断点续传、pdf.js 按需加载), 多个范围时返回完整文件。
+配置 merge_download_cache_dir 后, 完整转发过的文件同时写入本地磁盘缓存, 之后以 FileResponse 直接发送文件
+(ASGI 服务器支持 pathsend 扩展时由服务器零拷贝发送), 缓存按对象 ETag 区分, 超出总大小上限时删除最久未访问的文件。
+"""
+import hashlib
+import os
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterator, Mapping, Optional, Tuple
+from urllib.parse import quote
+
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+from app.config import settings
+from app.services.minio_service import MinioService
+
+# 请求的范围超出文件大小
+_UNSATISFIABLE = (-1, -1)
+
+
+@dataclass
+class DownloadObject:
+    """待下载的合并文件"""
+    object_name: str
+    file_name: str
+    size: int
+    etag: str
+    last_modified: Optional[datetime]
+    content_type: str
+    local_path: Optional[str] = None  # 本地缓存文件, 未缓存时为 None
+
+
+class MergeDownloadService:
+    """合并文件下载转发"""
+
+    @staticmethod
+    def stat(object_name: str, file_name: str) -> DownloadObject:
+        """读取对象元信息并查找本地缓存, 对象不存在时抛出异常"""
+        stat = MinioService.stat_file(object_name)
+        obj = DownloadObject(
+            object_name=object_name,
+            file_name=file_name,
+            size=stat.size,
+            etag=f'"{stat.etag}"',
+            last_modified=stat.last_modified,
+            content_type=stat.content_type or "application/octet-stream",
+        )
+        path = MergeDownloadService._cache_path(obj)
+        if path and os.path.isfile(path) and os.path.getsize(path) == obj.size:
+            # 更新访问时间, 淘汰时保留最近使用的文件
+            os.utime(path)
+            obj.local_path = path
+        return obj
+
+    @staticmethod
+    def response(obj: DownloadObject, request_headers: Mapping[str, str]) -> Response:
+        """按请求头生成 304 / 206 / 416 / 200 响应"""
+        headers = {
+            "ETag": obj.etag,
+            "Accept-Ranges": "bytes",
+            "Cache-Control": "private, no-cache",
+            "Content-Disposition": f"attachment; filename*=UTF-8''{quote(obj.file_name)}",
+        }
+        if obj.last_modified:
+            headers["Last-Modified"] = format_datetime(obj.last_modified.astimezone(timezone.utc), usegmt=True)
+
+        if MergeDownloadService._not_modified(obj, request_headers):
+            return Response(status_code=304, headers=headers)
+
+        byte_range = MergeDownloadService._requested_range(obj, request_headers, headers.get("Last-Modified"))
+        if byte_range == _UNSATISFIABLE:
+            headers["Content-Range"] = f"bytes */{obj.size}"
+            return Response(status_code=416, headers=headers)
+
+        if byte_range is None:
+            if obj.local_path:
+                return FileResponse(obj.local_path, media_type=obj.content_type, headers=headers)
+            headers["Content-Length"] = str(obj.size)
+            return StreamingResponse(
+                MergeDownloadService._iter_full(obj), media_type=obj.content_type, headers=headers,
+            )
+
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{obj.size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(
+            MergeDownloadService._iter_range(obj, start, end - start + 1),
+            status_code=206, media_type=obj.content_type, headers=headers,
+        )
+
+    @staticmethod
+    def _not_modified(obj: DownloadObject, request_headers: Mapping[str, str]) -> bool:
+        """条件请求是否命中 (If-None-Match 优先于 If-Modified-Since)"""
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            return "*" in tags or obj.etag in tags
+
+        if_modified_since = request_headers.get("if-modified-since")
+        if not if_modified_since or obj.last_modified is None:
+            return False
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return obj.last_modified.replace(microsecond=0) <= since
+
+    @staticmethod
+    def _requested_range(
+        obj: DownloadObject,
+        request_headers: Mapping[str, str],
+        last_modified: Optional[str],
+    ) -> Optional[Tuple[int, int]]:
+        """解析 Range 请求头, 返回 (起始, 结束) 闭区间; 不适用时返回 None (发送完整文件)"""
+        value = request_headers.get("range", "").strip()
+        if not value.startswith("bytes=") or "," in value:
+            return None
+        # If-Range 与当前版本不符时文件已变化, 发送完整文件
+        if_range = request_headers.get("if-range")
+        if if_range and if_range.strip() not in (obj.etag, last_modified):
+            return None
+
+        first, _, last = value[len("bytes="):].strip().partition("-")
+        try:
+            if first:
+                start = int(first)
+                end = int(last) if last else obj.size - 1
+                if last and end < start:
+                    return None
+                end = min(end, obj.size - 1)
+            else:
+                # bytes=-N 表示最后 N 个字节
+                suffix = int(last)
+                if suffix <= 0:
+                    return _UNSATISFIABLE
+                start = max(obj.size - suffix, 0)
+                end = obj.size - 1
+        except ValueError:
+            return None
+        if start >= obj.size:
+            return _UNSATISFIABLE
+        return start, end
+
+    @staticmethod
+    def _iter_range(obj: DownloadObject, start: int, length: int) -> Iterator[bytes]:
+        """读取指定范围, 有本地缓存时从文件读取"""
+        chunk_size = settings.merge_download_chunk_size
+        if obj.local_path:
+            with open(obj.local_path, "rb") as f:
+                f.seek(start)
+                remaining = length
+                while remaining > 0:
+                    chunk = f.read(min(chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+            return
+        yield from MinioService.iter_file(obj.object_name, chunk_size, offset=start, length=length)
+
+    @staticmethod
+    def _iter_full(obj: DownloadObject) -> Iterator[bytes]:
+        """从 MinIO 读取完整文件, 配置了本地缓存时同时写入缓存 (客户端中断时丢弃)"""
+        chunks = MinioService.iter_file(obj.object_name, settings.merge_download_chunk_size)
+        path = MergeDownloadService._cache_path(obj)
+        if path is None:
+            yield from chunks
+            return
+
+        temp_path = f"{path}.{uuid.uuid4().hex}.part"
+        try:
+            os.makedirs(settings.merge_download_cache_dir, exist_ok=True)
+            cache_file = open(temp_path, "wb")
+        except OSError:
+            cache_file = None
+
+        complete = False
+        try:
+            for chunk in chunks:
+                if cache_file is not None:
+                    try:
+                        cache_file.write(chunk)
+                    except OSError:
+                        # 磁盘写满等错误只影响缓存, 不中断下载
+                        cache_file.close()
+                        cache_file = None
+                yield chunk
+            complete = True
+        finally:
+            if cache_file is not None:
+                cache_file.close()
+                if complete and os.path.getsize(temp_path) == obj.size:
+                    os.replace(temp_path, path)
+                    MergeDownloadService._prune()
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    @staticmethod
+    def _cache_path(obj: DownloadObject) -> Optional[str]:
+        """本地缓存文件路径, 未配置缓存目录时返回 None"""
+        if not settings.merge_download_cache_dir:
+            return None
+        key = hashlib.sha256(f"{obj.object_name}:{obj.etag}".encode("utf-8")).hexdigest()
+        suffix = os.path.splitext(obj.object_name)[1]
+        return os.path.join(settings.merge_download_cache_dir, key + suffix)
+
+    @staticmethod
+    def _prune():
+        """缓存超过 merge_download_cache_mb 时删除最久未访问的文件"""
+        limit = settings.merge_download_cache_mb * 1024 * 1024
+        if not limit:
+            return
+        entries = []
+        with os.scandir(settings.merge_download_cache_dir) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.endswith(".part"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= limit:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
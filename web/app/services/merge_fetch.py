@@ -0,0 +1,337 @@
+"""
+合并输入下载 - 有界并发地从 MinIO 拉取发票文件
+
+prepared 时读取入库时生成的预处理产物 (OFD 转换后的 PDF、预缩放的图片),
+没有产物的 OFD 发票读取转换缓存, 未缓存的在渲染进程池中转换后写入缓存。
+指定内存预算时, 超出预算的输入在收集时转存到磁盘临时文件, 拼版、打包时按需读取;
+OFD 按预算分批转换, 转换结果同样计入预算。
+"""
+import io
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import BinaryIO, Callable, Iterator, List, Optional, Tuple
+
+from app.config import settings
+from app.models.invoice import FileType, Invoice
+from app.services.minio_service import MinioService
+from app.services.ofd_conversion import OfdConversionService
+
+
+class SpillFile:
+    """转存到磁盘的输入: 顺序追加到同一个临时文件, 按偏移量读取 (一次合并只占用一个文件句柄)"""
+
+    def __init__(self):
+        self._file = tempfile.TemporaryFile(prefix="merge-spill-")
+        self._lock = threading.Lock()
+        self.size = 0
+
+    def append(self, content: bytes) -> int:
+        """追加内容, 返回偏移量"""
+        with self._lock:
+            offset = self.size
+            self._file.seek(offset)
+            self._file.write(content)
+            self.size += len(content)
+        return offset
+
+    def read(self, offset: int, length: int) -> bytes:
+        with self._lock:
+            self._file.seek(offset)
+            return self._file.read(length)
+
+    def close(self):
+        self._file.close()
+
+
+class _SpillReader(io.RawIOBase):
+    """SpillFile 中一段内容的只读流"""
+
+    def __init__(self, spill: SpillFile, offset: int, length: int):
+        super().__init__()
+        self._spill = spill
+        self._offset = offset
+        self._length = length
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, pos: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            pos += self._pos
+        elif whence == io.SEEK_END:
+            pos += self._length
+        self._pos = max(0, pos)
+        return self._pos
+
+    def readinto(self, buffer) -> int:
+        size = max(0, min(len(buffer), self._length - self._pos))
+        data = self._spill.read(self._offset + self._pos, size) if size else b""
+        buffer[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+
+class MergeInput:
+    """一个待合并的输入文件, 内容在内存中, 或已转存到磁盘 (访问 content / open 时才读取)"""
+
+    def __init__(self, invoice: Invoice, name: str, type: str, content: bytes = b""):
+        self.invoice = invoice
+        self.name = name
+        self.type = type
+        self.size = len(content)
+        self._content = content
+        self._spilled: Optional[Tuple[SpillFile, int]] = None
+
+    @property
+    def content(self) -> bytes:
+        if self._spilled is None:
+            return self._content
+        spill, offset = self._spilled
+        return spill.read(offset, self.size)
+
+    @content.setter
+    def content(self, value: bytes):
+        self._content = value
+        self._spilled = None
+        self.size = len(value)
+
+    @property
+    def spilled(self) -> bool:
+        return self._spilled is not None
+
+    def spill_to(self, spill: SpillFile):
+        """把内容转存到磁盘并释放内存"""
+        if self._spilled is None:
+            self._spilled = (spill, spill.append(self._content))
+            self._content = b""
+
+    def open(self) -> BinaryIO:
+        """以流的方式读取内容, 已转存的内容按需从磁盘读取 (供 PdfReader 解析或流式写入 ZIP)"""
+        if self._spilled is None:
+            return io.BytesIO(self._content)
+        spill, offset = self._spilled
+        return io.BufferedReader(_SpillReader(spill, offset, self.size), buffer_size=64 * 1024)
+
+
+def budget_batches(items: List[MergeInput], budget: int) -> Iterator[List[MergeInput]]:
+    """按 budget 字节把输入分批, 每批读回内存的内容不超过预算 (单个超出预算的单独一批), 0 表示不分批"""
+    batch: List[MergeInput] = []
+    size = 0
+    for item in items:
+        if batch and budget and size + item.size > budget:
+            yield batch
+            batch, size = [], 0
+        batch.append(item)
+        size += item.size
+    if batch:
+        yield batch
+
+
+@dataclass
+class FetchFailure:
+    """下载失败的发票"""
+    invoice_id: str
+    reason: str
+
+
+@dataclass
+class FetchResult:
+    """下载阶段结果 (inputs 保持发票的原始顺序), 有输入转存到磁盘时用完需 close"""
+    inputs: List[MergeInput] = field(default_factory=list)
+    failures: List[FetchFailure] = field(default_factory=list)
+    elapsed: float = 0.0
+    spill: Optional[SpillFile] = None
+    memory_bytes: int = 0  # 保留在内存中的输入总大小
+    error: Optional[BaseException] = None  # on_input 拒绝时的异常, 之后的下载不再开始
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def count(self, item: MergeInput, on_input: Optional[Callable[[int], None]]):
+        """下载完成一个输入后调用 on_input(字节数), 拒绝时记录异常并抛出 (在下载线程中调用)"""
+        if on_input is None:
+            return
+        with self._lock:
+            if self.error is None:
+                try:
+                    on_input(item.size)
+                except Exception as e:
+                    self.error = e
+            error = self.error
+        if error is not None:
+            raise error
+
+    def keep(self, item: MergeInput, memory_budget: int):
+        """按内存预算保留输入, 超出预算的转存到磁盘 (在下载线程中调用)"""
+        with self._lock:
+            if not memory_budget or self.memory_bytes + item.size <= memory_budget:
+                self.memory_bytes += item.size
+                return
+            if self.spill is None:
+                self.spill = SpillFile()
+        item.spill_to(self.spill)
+
+    def replace(self, item: MergeInput, content: bytes, memory_budget: int):
+        """替换输入内容 (如 OFD 转换为 PDF), 原内容不再计入预算, 新内容按预算保留或转存"""
+        with self._lock:
+            if not item.spilled:
+                self.memory_bytes -= item.size
+        item.content = content
+        self.keep(item, memory_budget)
+
+    def close(self):
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
+
+    def __enter__(self) -> "FetchResult":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class MergeFetcher:
+    """合并输入下载器"""
+
+    @staticmethod
+    def fetch(
+        invoice_ids: List[str],
+        invoices: List[Invoice],
+        concurrency: Optional[int] = None,
+        prepared: bool = False,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+        memory_budget: int = 0,
+        on_input: Optional[Callable[[int], None]] = None,
+    ) -> FetchResult:
+        """按 invoice_ids 的顺序下载文件, 并发数默认取 merge_fetch_concurrency
+
+        prepared 为 True 时优先返回预处理产物, OFD 发票以转换后的 PDF 返回 (type 为 pdf)。
+        on_progress(已完成数, 总数) 按顺序收集到每个文件后在调用线程中调用, 抛出异常时取消尚未开始的下载。
+        memory_budget 为保留在内存中的输入总字节数, 超出的部分转存到磁盘, 0 表示全部保留在内存中。
+        on_input(字节数) 在每个文件下载完成后立即调用 (串行, 不按顺序), 抛出异常时停止下载并抛出该异常。
+        """
+        started = time.perf_counter()
+        result = FetchResult()
+        invoice_map = {inv.id: inv for inv in invoices}
+
+        jobs = []
+        for invoice_id in invoice_ids:
+            inv = invoice_map.get(invoice_id)
+            if inv is None:
+                result.failures.append(FetchFailure(invoice_id, "发票不存在"))
+            elif not inv.file_url:
+                result.failures.append(FetchFailure(invoice_id, "发票没有关联文件"))
+            else:
+                jobs.append(inv)
+
+        workers = max(1, min(concurrency or settings.merge_fetch_concurrency, len(jobs) or 1))
+        try:
+            MergeFetcher._collect(jobs, workers, prepared, memory_budget, result, on_progress, on_input)
+            if prepared:
+                MergeFetcher._convert_ofd(result, memory_budget)
+        except BaseException:
+            result.close()
+            raise
+
+        result.elapsed = time.perf_counter() - started
+        return result
+
+    @staticmethod
+    def _collect(
+        jobs: List[Invoice],
+        workers: int,
+        prepared: bool,
+        memory_budget: int,
+        result: FetchResult,
+        on_progress: Optional[Callable[[int, int], None]],
+        on_input: Optional[Callable[[int], None]],
+    ):
+        """并发下载并按提交顺序收集结果, 保证输出顺序与发票顺序一致"""
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="merge-fetch")
+        try:
+            futures = [
+                pool.submit(MergeFetcher._fetch_one, inv, prepared, memory_budget, result, on_input)
+                for inv in jobs
+            ]
+            for done, inv in enumerate(jobs, start=1):
+                # 取出后不再由 Future 持有内容, 转存到磁盘的输入才能真正释放内存
+                future, futures[done - 1] = futures[done - 1], None
+                try:
+                    result.inputs.append(future.result())
+                except Exception as e:
+                    if result.error is not None:
+                        raise result.error
+                    result.failures.append(FetchFailure(inv.id, str(e)))
+                if on_progress is not None:
+                    on_progress(done, len(jobs))
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    @staticmethod
+    def _fetch_one(
+        inv: Invoice,
+        prepared: bool,
+        memory_budget: int,
+        result: FetchResult,
+        on_input: Optional[Callable[[int], None]],
+    ) -> MergeInput:
+        """下载单个文件, 计入 on_input 后按内存预算保留"""
+        if result.error is not None:
+            raise result.error
+        file_type, content = MergeFetcher._download(inv, prepared)
+        item = MergeInput(
+            invoice=inv,
+            name=f"{inv.id}.{inv.file_type}",
+            type=file_type,
+            content=content,
+        )
+        result.count(item, on_input)
+        result.keep(item, memory_budget)
+        return item
+
+    @staticmethod
+    def _download(inv: Invoice, prepared: bool):
+        """下载单个文件, 返回 (类型, 内容); prepared 时优先使用预处理产物"""
+        object_name = MinioService.object_name_from_url(inv.file_url)
+        is_ofd = inv.file_type == FileType.OFD.value
+        if prepared and inv.artifact_object:
+            try:
+                content = MinioService.download_file(inv.artifact_object)
+                return (FileType.PDF.value if is_ofd else inv.file_type), content
+            except Exception:
+                # 产物丢失时回退到原文件
+                pass
+        if prepared and is_ofd:
+            cached = OfdConversionService.load_cached(object_name)
+            if cached is not None:
+                return FileType.PDF.value, cached
+        return inv.file_type, MinioService.download_file(object_name)
+
+    @staticmethod
+    def _convert_ofd(result: FetchResult, memory_budget: int):
+        """按内存预算分批转换未命中缓存的 OFD 输入, 转换结果计入预算, 失败的计入 failures"""
+        pending = [item for item in result.inputs if item.type == FileType.OFD.value]
+        failed = set()
+        for batch in budget_batches(pending, memory_budget):
+            converted = OfdConversionService.convert(
+                [MinioService.object_name_from_url(item.invoice.file_url) for item in batch],
+                [item.content for item in batch],
+            )
+            for item, (pdf, error) in zip(batch, converted):
+                if pdf is None:
+                    failed.add(item.invoice.id)
+                    result.failures.append(FetchFailure(item.invoice.id, error))
+                else:
+                    item.type = FileType.PDF.value
+                    result.replace(item, pdf, memory_budget)
+        if failed:
+            result.inputs = [item for item in result.inputs if item.invoice.id not in failed]
@@ -0,0 +1,97 @@
+"""
+合并任务限制 - 取消、执行时间、输入大小、页数和内存上限
+
+合并过程在下载、拼版、上传的各个进度点协作式调用 MergeGuard.check,
+超出限制或收到取消请求时抛出 MergeAborted, 由 MergeService 以明确的原因结束任务。
+取消请求由心跳线程随心跳读取, 因此生效延迟不超过 merge_task_heartbeat_seconds。
+"""
+import os
+import time
+from typing import Optional, Tuple
+
+from app.config import settings
+
+
+class MergeAborted(Exception):
+    """合并被中止, cancelled 为 True 表示用户取消, 否则为超出限制"""
+
+    def __init__(self, reason: str, cancelled: bool = False):
+        super().__init__(reason)
+        self.cancelled = cancelled
+
+
+def _current_rss_mb() -> Optional[float]:
+    """当前进程的常驻内存 (MB), 无法读取时返回 None (非 Linux)"""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+class MergeGuard:
+    """单个合并任务的限制检查, 上限为 0 表示不限制"""
+
+    def __init__(self, heartbeat=None):
+        # heartbeat 为 HeartbeatThread, 提供 cancelled / lost 两个事件
+        self.heartbeat = heartbeat
+        self.started = time.monotonic()
+        self.input_bytes = 0
+        self.pages = 0
+        self.peak_memory_mb = 0.0
+
+    def check(self):
+        """检查取消请求、执行时间和内存, 应在合并循环中频繁调用"""
+        if self.heartbeat is not None:
+            if self.heartbeat.cancelled.is_set():
+                raise MergeAborted("任务已取消", cancelled=True)
+            if self.heartbeat.lost.is_set():
+                raise MergeAborted("任务已被回收给其他 Worker")
+
+        timeout = settings.merge_task_timeout_seconds
+        if timeout and time.monotonic() - self.started > timeout:
+            raise MergeAborted(f"执行时间超过上限 {timeout} 秒")
+
+        limit = settings.merge_max_memory_mb
+        if limit:
+            rss = _current_rss_mb()
+            if rss is not None:
+                self.peak_memory_mb = max(self.peak_memory_mb, rss)
+                if rss > limit:
+                    raise MergeAborted(f"内存占用 {rss:.0f}MB 超过上限 {limit}MB")
+
+    def check_estimate(self, input_bytes: int, pages: int):
+        """执行前按发票记录的大小和预估页数检查, 明显超限的任务不下载"""
+        self._check_input_bytes(input_bytes, "预估")
+        self._check_pages(pages, "预估")
+
+    def add_input_bytes(self, size: int):
+        """累加实际读取的输入大小并检查"""
+        self.input_bytes += size
+        self._check_input_bytes(self.input_bytes)
+
+    def snapshot(self) -> Tuple[int, int]:
+        """当前累计的输入大小和页数, 供放弃某条合并路径后 restore"""
+        return self.input_bytes, self.pages
+
+    def restore(self, snapshot: Tuple[int, int]):
+        """回退到 snapshot 时的累计值, 放弃的路径已计入的输入和页数不再与改用的路径重复计算"""
+        self.input_bytes, self.pages = snapshot
+
+    def add_pages(self, pages: int):
+        """累加实际输出的页数并检查"""
+        self.pages += pages
+        self._check_pages(self.pages)
+
+    @staticmethod
+    def _check_input_bytes(size: int, label: str = ""):
+        limit = settings.merge_max_input_mb
+        if limit and size > limit * 1024 * 1024:
+            raise MergeAborted(f"{label}输入文件共 {size / 1024 / 1024:.1f}MB, 超过上限 {limit}MB")
+
+    @staticmethod
+    def _check_pages(pages: int, label: str = ""):
+        limit = settings.merge_max_pages
+        if limit and pages > limit:
+            raise MergeAborted(f"{label}输出 {pages} 页, 超过上限 {limit} 页")
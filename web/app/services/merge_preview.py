@@ -0,0 +1,157 @@
+"""
+合并预览 - 只渲染计划输出中的某一页, 不生成完整文档
+
+按发票记录的页数 (入库时预处理得到, 未知时按 1 页) 计算槽位分布, 只下载、解码落在该页的发票,
+拼版后以低分辨率栅格化。渲染结果按该页内容寻址缓存在 previews/ 下, 翻页和重复预览直接读取缓存。
+"""
+import hashlib
+import io
+import json
+from typing import Dict, List, Optional, Tuple
+
+from pypdf import PdfReader
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.invoice import FileType, Invoice
+from app.schemas.merge_task import LayoutOptions
+from app.services.layout_engine import LayoutEngine
+from app.services.merge_fetch import MergeFetcher, MergeInput
+from app.services.minio_service import MinioService
+from app.services.page_assembler import LayoutItem, PageAssembler
+from app.services.render_pool import RenderPool
+from app.services.thumbnail_service import ThumbnailService
+from app.utils.thumbnail_utils import thumbnail_job
+
+PREVIEW_PREFIX = "previews"
+
+# 槽位内容: (发票, 在该发票中的页序号, 发票在文档中的序号)
+PlannedSlot = Tuple[Invoice, int, int]
+
+
+class MergePreviewService:
+    """合并预览服务"""
+
+    @staticmethod
+    def plan(
+        invoice_ids: List[str],
+        invoices: List[Invoice],
+        options: LayoutOptions,
+    ) -> Tuple[List[PlannedSlot], int]:
+        """按顺序展开全部槽位, 返回 (槽位列表, 总页数)"""
+        invoice_map = {inv.id: inv for inv in invoices}
+        slots: List[PlannedSlot] = []
+        number = 0
+        for invoice_id in invoice_ids:
+            inv = invoice_map.get(invoice_id)
+            # 与合并一致: 不存在或没有文件的发票不占槽位
+            if inv is None or not inv.file_url:
+                continue
+            number += 1
+            for page_index in range(max(inv.page_count or 1, 1)):
+                slots.append((inv, page_index, number))
+        return slots, LayoutEngine.compute(options).page_count(len(slots))
+
+    @staticmethod
+    def preview_name(key: str) -> str:
+        return f"{PREVIEW_PREFIX}/{key}.jpg"
+
+    @staticmethod
+    def render_page(
+        db: Session,
+        invoice_ids: List[str],
+        options: Optional[LayoutOptions],
+        page: int,
+    ) -> Tuple[Optional[str], int, str]:
+        """渲染第 page 页 (从 1 开始), 返回 (预览键, 总页数, 错误信息)"""
+        options = options or LayoutOptions()
+        invoices = db.query(Invoice).filter(Invoice.id.in_(invoice_ids)).all()
+        slots, total_pages = MergePreviewService.plan(invoice_ids, invoices, options)
+        if total_pages == 0:
+            return None, 0, "没有可预览的发票"
+        if page > total_pages:
+            return None, total_pages, f"页码超出范围 (共 {total_pages} 页)"
+
+        per_page = LayoutEngine.compute(options).per_page
+        selected = slots[(page - 1) * per_page:page * per_page]
+        key = MergePreviewService._key(selected, options, page, total_pages)
+        ThumbnailService.get_or_render(
+            MergePreviewService.preview_name(key),
+            lambda: MergePreviewService._render(selected, options, page - 1, total_pages),
+        )
+        return key, total_pages, ""
+
+    @staticmethod
+    def load(key: str) -> Optional[bytes]:
+        """读取已渲染的预览页"""
+        if len(key) != 64 or not all(c in "0123456789abcdef" for c in key):
+            return None
+        try:
+            return MinioService.download_file(MergePreviewService.preview_name(key))
+        except Exception:
+            return None
+
+    @staticmethod
+    def cleanup_stale() -> int:
+        """清理超过 merge_preview_ttl_hours 的预览页, 返回删除数量"""
+        return MinioService.delete_stale(PREVIEW_PREFIX + "/", settings.merge_preview_ttl_hours)
+
+    @staticmethod
+    def _key(selected: List[PlannedSlot], options: LayoutOptions, page: int, total_pages: int) -> str:
+        """由该页内容计算缓存键 (文件内容不可变, 以内容哈希或对象地址标识)"""
+        payload = json.dumps({
+            "slots": [
+                [inv.content_hash or inv.file_url, page_index, number, inv.type]
+                for inv, page_index, number in selected
+            ],
+            "layout": options.model_dump(by_alias=True),
+            "page": page,
+            "totalPages": total_pages,
+            "dpi": settings.merge_preview_dpi,
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _render(
+        selected: List[PlannedSlot],
+        options: LayoutOptions,
+        page_index: int,
+        total_pages: int,
+    ) -> bytes:
+        """只下载该页用到的发票, 拼版为单页 PDF 后栅格化为 JPEG"""
+        needed: Dict[str, Invoice] = {}
+        for inv, _, _ in selected:
+            needed.setdefault(inv.id, inv)
+        fetched = MergeFetcher.fetch(list(needed), list(needed.values()), prepared=True)
+        inputs = {item.invoice.id: item for item in fetched.inputs}
+
+        readers: Dict[str, Optional[PdfReader]] = {}
+        items = []
+        for inv, index, number in selected:
+            source = inputs.get(inv.id)
+            if source is None:
+                # 下载失败的发票绘制占位块
+                source = MergeInput(invoice=inv, name=inv.id, type=inv.file_type, content=b"")
+                items.append(LayoutItem(source=source, number=number))
+            elif source.type == FileType.PDF.value:
+                if inv.id not in readers:
+                    try:
+                        readers[inv.id] = PdfReader(io.BytesIO(source.content))
+                    except Exception:
+                        readers[inv.id] = None
+                reader = readers[inv.id]
+                pdf_page = reader.pages[index] if reader is not None and index < len(reader.pages) else None
+                items.append(LayoutItem(source=source, number=number, page=pdf_page))
+            else:
+                items.append(LayoutItem(source=source, number=number, is_image=True))
+
+        assembler = PageAssembler(options)
+        output = io.BytesIO()
+        assembler.render(items, output, first_page=page_index, total_pages=total_pages)
+
+        geometry = assembler.geometry
+        max_edge = round(max(geometry.page_size) / 72 * settings.merge_preview_dpi)
+        return RenderPool.run(
+            thumbnail_job,
+            (FileType.PDF.value, output.getvalue(), max_edge, settings.thumbnail_jpeg_quality),
+        )
@@ -0,0 +1,234 @@
+"""
+合并进度 - Worker 上报, API 进程内存中分发给 SSE 订阅者
+
+Worker 侧 MergeProgress 记录各阶段 (fetch / render / upload 等) 的进度和耗时,
+节流后由后台线程 POST 到 API 的 /merge-tasks/progress; API 侧 ProgressHub 保存每个任务的最新进度,
+并推送给正在订阅该任务的连接。整个过程不轮询数据库, 推送失败只影响实时进度, 不影响合并本身。
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from typing import AsyncIterator, BinaryIO, Callable, Dict, Optional, Set
+
+from app.config import settings
+
+# 终态: 收到后订阅结束
+FINAL_STATUSES = ("completed", "failed", "cancelled", "expired")
+
+# 任务最新进度在最后一次更新后于 API 进程中保留的时长 (秒), 供晚到的订阅者读取
+RETENTION_SECONDS = 600
+
+
+def progress_token() -> str:
+    """Worker 与 API 之间的共享令牌, 未配置时由 secret_key 经 HMAC 派生 (不直接发送 secret_key)"""
+    if settings.merge_progress_token:
+        return settings.merge_progress_token
+    return hmac.new(settings.secret_key.encode("utf-8"), b"merge-progress", hashlib.sha256).hexdigest()
+
+
+class _Publisher(threading.Thread):
+    """后台推送线程: 每个任务只保留最新一条待发送进度, 发送慢时自动合并"""
+
+    def __init__(self):
+        super().__init__(daemon=True, name="merge-progress")
+        self._pending: Dict[str, dict] = {}
+        self._cond = threading.Condition()
+
+    def submit(self, event: dict):
+        with self._cond:
+            self._pending[event["taskId"]] = event
+            self._cond.notify()
+
+    def run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                events = list(self._pending.values())
+                self._pending.clear()
+            for event in events:
+                self._send(event)
+
+    @staticmethod
+    def _send(event: dict):
+        request = urllib.request.Request(
+            settings.merge_progress_url,
+            data=json.dumps(event, ensure_ascii=False).encode("utf-8"),
+            headers={"Content-Type": "application/json", "X-Progress-Token": progress_token()},
+            method="POST",
+        )
+        try:
+            urllib.request.urlopen(request, timeout=2).close()
+        except Exception:
+            # API 不可用时丢弃, 订阅者会在下一条进度或任务结束时追上
+            pass
+
+
+class MergeProgress:
+    """单个合并任务的进度记录 (Worker 侧)"""
+
+    _publisher: Optional[_Publisher] = None
+    _publisher_lock = threading.Lock()
+
+    def __init__(self, task_id: str, checkpoint: Optional[Callable[[], None]] = None):
+        self.task_id = task_id
+        # 每次进入阶段和更新进度时调用 (如 MergeGuard.check), 可抛出异常中止合并
+        self.checkpoint = checkpoint
+        self.timings: Dict[str, float] = {}
+        self.stage_name: Optional[str] = None
+        self.done = 0
+        self.total = 0
+        self._stage_started = 0.0
+        self._last_push = 0.0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str, total: int = 0, done: int = 0):
+        """进入一个阶段, 退出时把耗时累加到 timings (同名阶段多次进入时累加)"""
+        if self.checkpoint is not None:
+            self.checkpoint()
+        with self._lock:
+            self.stage_name = name
+            self.done = done
+            self.total = total
+            self._stage_started = time.perf_counter()
+        self._push(force=True)
+        try:
+            yield self
+        finally:
+            elapsed = time.perf_counter() - self._stage_started
+            self.timings[name] = round(self.timings.get(name, 0.0) + elapsed, 3)
+
+    def update(self, done: int, total: Optional[int] = None):
+        """更新当前阶段的完成数量, 推送按 merge_progress_interval 节流"""
+        if self.checkpoint is not None:
+            self.checkpoint()
+        with self._lock:
+            self.done = done
+            if total is not None:
+                self.total = total
+        self._push()
+
+    def record(self, name: str, seconds: float):
+        """直接记录一个阶段的耗时 (如排队时间)"""
+        self.timings[name] = round(max(seconds, 0.0), 3)
+
+    def finish(self, status: str, error: Optional[str] = None):
+        """推送终态"""
+        with self._lock:
+            self.stage_name = None
+            self.done = self.total = 0
+        self._push(force=True, status=status, error=error)
+
+    def event(self, status: str = "processing", error: Optional[str] = None) -> dict:
+        """当前进度事件"""
+        return {
+            "taskId": self.task_id,
+            "status": status,
+            "stage": self.stage_name,
+            "done": self.done,
+            "total": self.total,
+            "elapsed": round(time.perf_counter() - self._stage_started, 3) if self.stage_name else 0.0,
+            "stageTimings": dict(self.timings),
+            "errorMessage": error,
+        }
+
+    def _push(self, force: bool = False, status: str = "processing", error: Optional[str] = None):
+        if not settings.merge_progress_url:
+            return
+        now = time.perf_counter()
+        with self._lock:
+            if not force and now - self._last_push < settings.merge_progress_interval:
+                return
+            self._last_push = now
+            event = self.event(status, error)
+        MergeProgress._get_publisher().submit(event)
+
+    @classmethod
+    def _get_publisher(cls) -> _Publisher:
+        with cls._publisher_lock:
+            if cls._publisher is None:
+                cls._publisher = _Publisher()
+                cls._publisher.start()
+        return cls._publisher
+
+
+class ProgressStream:
+    """包装上传流, 按已读取的字节数更新进度 (length 为预估值时, 超出后总量随已读取量增长)"""
+
+    def __init__(self, stream: BinaryIO, progress: MergeProgress, length: int):
+        self._stream = stream
+        self._progress = progress
+        self._length = length
+        self._read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._stream.read(size)
+        self._read += len(data)
+        self._progress.update(self._read, max(self._length, self._read))
+        return data
+
+
+class ProgressHub:
+    """合并进度分发 (API 侧, 进程内)"""
+
+    _latest: Dict[str, dict] = {}
+    _updated_at: Dict[str, float] = {}
+    _subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    @classmethod
+    def publish(cls, event: dict):
+        """保存最新进度并推送给该任务的订阅者 (在事件循环中调用)"""
+        task_id = event["taskId"]
+        cls._prune()
+        cls._latest[task_id] = event
+        cls._updated_at[task_id] = time.monotonic()
+        for queue in cls._subscribers.get(task_id, ()):
+            if queue.full():
+                # 订阅者处理不过来时只保留较新的进度
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    @classmethod
+    def latest(cls, task_id: str) -> Optional[dict]:
+        return cls._latest.get(task_id)
+
+    @classmethod
+    async def subscribe(cls, task_id: str, keepalive: float = 15.0) -> AsyncIterator[Optional[dict]]:
+        """依次产出该任务的进度, 先产出已有的最新进度; 超过 keepalive 秒无进度时产出 None (用于保活)"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=16)
+        cls._subscribers.setdefault(task_id, set()).add(queue)
+        try:
+            latest = cls._latest.get(task_id)
+            if latest is not None:
+                yield latest
+                if latest.get("status") in FINAL_STATUSES:
+                    return
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                yield event
+                if event.get("status") in FINAL_STATUSES:
+                    return
+        finally:
+            subscribers = cls._subscribers.get(task_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    cls._subscribers.pop(task_id, None)
+
+    @classmethod
+    def _prune(cls):
+        """清理长时间没有更新的任务 (已结束, 或 Worker 异常退出后由其他 Worker 重新执行)"""
+        deadline = time.monotonic() - RETENTION_SECONDS
+        for task_id in [t for t, at in cls._updated_at.items() if at < deadline]:
+            cls._updated_at.pop(task_id, None)
+            cls._latest.pop(task_id, None)
@@ -0,0 +1,204 @@
+"""
+合并任务队列 - 基于 merge_tasks 表的持久化队列
+
+任务状态流转: pending → processing → completed / failed / cancelled (排队中的任务也可直接取消),
+合并结果随缓存过期被清理后 completed → expired
+认领与结束都通过带条件的 UPDATE 完成, 多个 Worker 进程 (可跨节点) 共享同一数据库即可协作。
+"""
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.merge_task import MergeTask, MergeTaskStatus
+from app.services.merge_progress import MergeProgress
+
+
+class MergeQueue:
+    """合并任务队列"""
+
+    @staticmethod
+    def claim(db: Session, worker_id: str, batch: int = 5) -> Optional[MergeTask]:
+        """认领一个待处理任务, 没有可认领的任务时返回 None"""
+        candidates = db.query(MergeTask.id) \
+            .filter(MergeTask.status == MergeTaskStatus.PENDING.value) \
+            .order_by(MergeTask.created_at.asc()) \
+            .limit(batch) \
+            .all()
+
+        for (task_id,) in candidates:
+            now = datetime.now()
+            claimed = db.query(MergeTask) \
+                .filter(
+                    MergeTask.id == task_id,
+                    MergeTask.status == MergeTaskStatus.PENDING.value,
+                ) \
+                .update({
+                    MergeTask.status: MergeTaskStatus.PROCESSING.value,
+                    MergeTask.worker_id: worker_id,
+                    MergeTask.attempts: func.coalesce(MergeTask.attempts, 0) + 1,
+                    MergeTask.started_at: now,
+                    MergeTask.heartbeat_at: now,
+                }, synchronize_session=False)
+            db.commit()
+
+            # 其他 Worker 抢先认领时 rowcount 为 0, 继续尝试下一个
+            if claimed:
+                return db.query(MergeTask).filter(MergeTask.id == task_id).first()
+
+        return None
+
+    @staticmethod
+    def heartbeat(db: Session, task_id: str, worker_id: str) -> bool:
+        """刷新任务心跳, 返回当前 Worker 是否仍持有该任务"""
+        updated = db.query(MergeTask) \
+            .filter(
+                MergeTask.id == task_id,
+                MergeTask.worker_id == worker_id,
+                MergeTask.status == MergeTaskStatus.PROCESSING.value,
+            ) \
+            .update({MergeTask.heartbeat_at: datetime.now()}, synchronize_session=False)
+        db.commit()
+        return bool(updated)
+
+    @staticmethod
+    def finish(db: Session, task_id: str, worker_id: str, values: dict) -> bool:
+        """写回任务结果, 任务已被回收给其他 Worker 时不覆盖"""
+        values = dict(values)
+        values.setdefault("finished_at", datetime.now())
+        updated = db.query(MergeTask) \
+            .filter(
+                MergeTask.id == task_id,
+                MergeTask.worker_id == worker_id,
+                MergeTask.status == MergeTaskStatus.PROCESSING.value,
+            ) \
+            .update(
+                {getattr(MergeTask, key): value for key, value in values.items()},
+                synchronize_session=False,
+            )
+        db.commit()
+        return bool(updated)
+
+    @staticmethod
+    def recover_stale(db: Session) -> int:
+        """回收心跳超时的任务 (Worker 崩溃或被杀), 返回回收数量
+
+        由此结束 (取消/失败) 的任务没有 Worker 上报终态, 在这里推送给进度订阅者。
+        """
+        deadline = datetime.now() - timedelta(seconds=settings.merge_task_stale_seconds)
+        stale = (
+            MergeTask.status == MergeTaskStatus.PROCESSING.value,
+            MergeTask.heartbeat_at < deadline,
+        )
+        exhausted = func.coalesce(MergeTask.attempts, 0) >= settings.merge_task_max_attempts
+        cancel_requested = func.coalesce(MergeTask.cancel_requested, False)
+        ending = [
+            task_id for (task_id,) in db.query(MergeTask.id)
+            .filter(*stale, cancel_requested | exhausted)
+            .all()
+        ]
+
+        # 已请求取消的任务不再重试
+        cancelled = db.query(MergeTask) \
+            .filter(*stale, cancel_requested) \
+            .update({
+                MergeTask.status: MergeTaskStatus.CANCELLED.value,
+                MergeTask.error_message: "任务已取消",
+                MergeTask.finished_at: datetime.now(),
+            }, synchronize_session=False)
+
+        failed = db.query(MergeTask) \
+            .filter(*stale, ~cancel_requested, exhausted) \
+            .update({
+                MergeTask.status: MergeTaskStatus.FAILED.value,
+                MergeTask.error_message: "Worker 异常退出, 已超过最大重试次数",
+                MergeTask.finished_at: datetime.now(),
+            }, synchronize_session=False)
+
+        requeued = db.query(MergeTask) \
+            .filter(*stale, ~cancel_requested, ~exhausted) \
+            .update({
+                MergeTask.status: MergeTaskStatus.PENDING.value,
+                MergeTask.worker_id: None,
+                MergeTask.heartbeat_at: None,
+            }, synchronize_session=False)
+
+        db.commit()
+
+        if ending:
+            ended = db.query(MergeTask.id, MergeTask.status, MergeTask.error_message) \
+                .filter(
+                    MergeTask.id.in_(ending),
+                    MergeTask.status.in_([MergeTaskStatus.CANCELLED.value, MergeTaskStatus.FAILED.value]),
+                ) \
+                .all()
+            for task_id, status, error in ended:
+                MergeProgress(task_id).finish(status, error)
+        return cancelled + failed + requeued
+
+    @staticmethod
+    def cancel(db: Session, task_id: str) -> bool:
+        """取消任务, 已结束的任务返回 False
+
+        排队中的任务直接标记为已取消; 执行中的任务只设置取消标记,
+        由执行它的 Worker 随心跳读取后协作停止并写回 cancelled。
+        """
+        cancelled = db.query(MergeTask) \
+            .filter(
+                MergeTask.id == task_id,
+                MergeTask.status == MergeTaskStatus.PENDING.value,
+            ) \
+            .update({
+                MergeTask.status: MergeTaskStatus.CANCELLED.value,
+                MergeTask.error_message: "任务已取消",
+                MergeTask.finished_at: datetime.now(),
+            }, synchronize_session=False)
+        if not cancelled:
+            cancelled = db.query(MergeTask) \
+                .filter(
+                    MergeTask.id == task_id,
+                    MergeTask.status == MergeTaskStatus.PROCESSING.value,
+                ) \
+                .update({MergeTask.cancel_requested: True}, synchronize_session=False)
+        db.commit()
+        return bool(cancelled)
+
+    @staticmethod
+    def is_cancel_requested(db: Session, task_id: str) -> bool:
+        """执行中的任务是否已请求取消"""
+        flag = db.query(MergeTask.cancel_requested).filter(MergeTask.id == task_id).scalar()
+        return bool(flag)
+
+
+class HeartbeatThread(threading.Thread):
+    """任务执行期间定期刷新心跳的后台线程 (使用独立的数据库会话)"""
+
+    def __init__(self, task_id: str, worker_id: str):
+        super().__init__(daemon=True)
+        self.task_id = task_id
+        self.worker_id = worker_id
+        self.lost = threading.Event()
+        self.cancelled = threading.Event()
+        self._stopped = threading.Event()
+
+    def run(self):
+        interval = settings.merge_task_heartbeat_seconds
+        while not self._stopped.wait(interval):
+            db = SessionLocal()
+            try:
+                if not MergeQueue.heartbeat(db, self.task_id, self.worker_id):
+                    self.lost.set()
+                    return
+                if MergeQueue.is_cancel_requested(db, self.task_id):
+                    self.cancelled.set()
+            except Exception:
+                db.rollback()
+            finally:
+                db.close()
+
+    def stop(self):
+        self._stopped.set()
@@ -1,23 +1,52 @@
 """
 合并任务业务服务
 """
+import csv
 import io
 import json
+import re
+import shutil
+import tempfile
 import uuid
 import zipfile
 from datetime import datetime
-from typing import List, Optional, Tuple
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple
 
-from sqlalchemy.orm import Session
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import mm
-from reportlab.pdfgen import canvas
 from pypdf import PdfReader, PdfWriter
+from sqlalchemy.orm import Session
 
+from app.config import settings
 from app.models.merge_task import MergeTask, MergeTaskStatus, OutputType
 from app.models.invoice import Invoice
-from app.schemas.merge_task import MergeTaskResponse
+from app.schemas.merge_task import (
+    LayoutOptions,
+    MergeBatchCreate,
+    MergeGroup,
+    MergeProgressEvent,
+    MergeTaskResponse,
+)
+from app.services.layout_engine import LayoutEngine
+from app.services.merge_cache import MergeCacheService
+from app.services.merge_fetch import FetchResult, MergeFetcher, MergeInput
+from app.services.merge_guard import MergeAborted, MergeGuard
+from app.services.merge_progress import MergeProgress, ProgressStream
+from app.services.merge_queue import MergeQueue
 from app.services.minio_service import MinioService
+from app.services.page_assembler import PageAssembler
+from app.utils.zip_utils import open_entry, stream_zip, write_bytes
+
+# ZIP 输出中的发票清单文件名
+MANIFEST_NAME = "manifest.csv"
+
+# 分组规则: 由发票记录计算分组名称
+GROUP_RULES = {
+    "seller": lambda inv: inv.seller_name or "未知销方",
+    "month": lambda inv: (inv.date or "")[:7] or "未知月份",
+    "type": lambda inv: inv.type or "other",
+}
+
+# 文件名中不允许出现的字符
+_UNSAFE_NAME = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
 
 
 class MergeService:
@@ -49,171 +78,742 @@ class MergeService:
         return tasks, total
 
     @staticmethod
-    async def create_task(
+    def create_task(
         db: Session,
         invoice_ids: List[str],
         output_type: str,
+        layout: Optional[LayoutOptions] = None,
+        base_task_id: Optional[str] = None,
     ) -> MergeTask:
-        """创建合并任务"""
-        task_id = MergeService.generate_id()
-        now = datetime.now()
-
+        """创建合并任务 (仅入队, 由 Worker 异步执行), 页数和大小按发票记录预估"""
+        invoices = db.query(Invoice).filter(Invoice.id.in_(invoice_ids)).all()
+        total_pages, estimated_size = MergeService.estimate(invoice_ids, invoices, output_type, layout)
+        invoice_map = {inv.id: inv for inv in invoices}
         task = MergeTask(
-            id=task_id,
+            id=MergeService.generate_id(),
             invoice_ids=json.dumps(invoice_ids),
-            status=MergeTaskStatus.PROCESSING.value,
+            status=MergeTaskStatus.PENDING.value,
             output_type=output_type,
-            total_pages=0,
-            total_amount=0.0,
-            created_at=now,
+            layout=layout.model_dump_json(by_alias=True) if layout else None,
+            total_pages=total_pages,
+            total_amount=sum(invoice_map[i].total_amount or 0.0 for i in invoice_ids if i in invoice_map),
+            estimated_size=estimated_size,
+            base_task_id=base_task_id,
+            attempts=0,
+            created_at=datetime.now(),
         )
 
         db.add(task)
         db.commit()
+        db.refresh(task)
+
+        return task
+
+    @staticmethod
+    def create_append(db: Session, base: MergeTask, invoice_ids: List[str]) -> Tuple[Optional[MergeTask], str]:
+        """在已完成的 PDF 合并任务后追加发票, 返回 (新任务, 错误信息)
+
+        新任务的发票列表为基础任务的发票加上新增发票, 排版配置与基础任务相同;
+        执行时复制基础结果中已排满的页面, 只拼版新增部分。
+        """
+        if base.status != MergeTaskStatus.COMPLETED.value:
+            return None, "只能向已完成的合并任务追加发票"
+        if base.output_type != OutputType.PDF.value or base.groups:
+            return None, "只能向普通 PDF 合并任务追加发票"
+
+        base_ids = json.loads(base.invoice_ids)
+        existing = set(base_ids)
+        new_ids = [i for i in dict.fromkeys(invoice_ids) if i not in existing]
+        if not new_ids:
+            return None, "没有新增的发票"
+
+        layout = LayoutOptions.model_validate_json(base.layout) if base.layout else None
+        return MergeService.create_task(
+            db, base_ids + new_ids, OutputType.PDF.value, layout, base_task_id=base.id,
+        ), ""
+
+    @staticmethod
+    def create_batch(db: Session, request: MergeBatchCreate) -> Tuple[Optional[MergeTask], str]:
+        """创建分组合并任务, 返回 (任务, 错误信息)
+
+        分组在创建时确定并保存在任务上; 各分组共用的发票在执行时只下载、解析一次。
+        """
+        groups = request.groups
+        if request.group_by:
+            groups, error = MergeService.group_invoices(db, request.invoice_ids, request.group_by)
+            if error:
+                return None, error
+        groups = [group for group in groups if group.invoice_ids]
+        if not groups:
+            return None, "请指定分组规则或分组列表"
+        if len(groups) > settings.merge_batch_max_groups:
+            return None, f"分组数量超过上限 {settings.merge_batch_max_groups}"
+
+        # 任务的发票列表为各分组发票去重后的并集
+        invoice_ids = list(dict.fromkeys(i for group in groups for i in group.invoice_ids))
+        invoices = db.query(Invoice).filter(Invoice.id.in_(invoice_ids)).all()
+        invoice_map = {inv.id: inv for inv in invoices}
+
+        total_pages = estimated_size = 0
+        for group in groups:
+            pages, size = MergeService.estimate(
+                group.invoice_ids, invoices, request.output_type, request.layout,
+            )
+            total_pages += pages
+            estimated_size += size
+
+        task = MergeTask(
+            id=MergeService.generate_id(),
+            invoice_ids=json.dumps(invoice_ids),
+            status=MergeTaskStatus.PENDING.value,
+            output_type=request.output_type,
+            layout=request.layout.model_dump_json(by_alias=True) if request.layout else None,
+            total_pages=total_pages,
+            total_amount=sum(invoice_map[i].total_amount or 0.0 for i in invoice_ids if i in invoice_map),
+            estimated_size=estimated_size,
+            groups=json.dumps([
+                {"name": group.name, "invoiceIds": group.invoice_ids} for group in groups
+            ], ensure_ascii=False),
+            bundle=request.bundle,
+            attempts=0,
+            created_at=datetime.now(),
+        )
+
+        db.add(task)
+        db.commit()
+        db.refresh(task)
+
+        return task, ""
+
+    @staticmethod
+    def group_invoices(db: Session, invoice_ids: List[str], group_by: str) -> Tuple[List[MergeGroup], str]:
+        """按规则分组, 分组按首次出现的顺序排列, 组内保持发票顺序"""
+        if not invoice_ids:
+            return [], "请选择要合并的发票"
+        invoices = db.query(Invoice).filter(Invoice.id.in_(invoice_ids)).all()
+        invoice_map = {inv.id: inv for inv in invoices}
+        missing = [i for i in invoice_ids if i not in invoice_map]
+        if missing:
+            return [], f"发票不存在: {', '.join(missing)}"
+
+        rule = GROUP_RULES[group_by]
+        grouped: Dict[str, List[str]] = {}
+        for invoice_id in dict.fromkeys(invoice_ids):
+            grouped.setdefault(rule(invoice_map[invoice_id]), []).append(invoice_id)
+        return [MergeGroup(name=name, invoiceIds=ids) for name, ids in grouped.items()], ""
+
+    @staticmethod
+    def estimate(
+        invoice_ids: List[str],
+        invoices: List[Invoice],
+        output_type: str,
+        layout: Optional[LayoutOptions] = None,
+    ) -> Tuple[int, int]:
+        """不下载文件, 按发票记录的页数和预处理产物大小估算 (页数, 字节数)
+
+        尚未完成预处理的发票按 1 页、原文件大小 (未知时为 0) 计算。
+        """
+        invoice_map = {inv.id: inv for inv in invoices}
+        targets = [invoice_map[i] for i in invoice_ids if i in invoice_map]
+        if output_type != OutputType.PDF.value:
+            return len(targets), sum(inv.file_size or 0 for inv in targets)
+
+        slots = sum(max(inv.page_count or 1, 1) for inv in targets)
+        size = sum(inv.artifact_size or inv.file_size or 0 for inv in targets)
+        return LayoutEngine.compute(layout).page_count(slots), size
+
+    @staticmethod
+    def run_task(db: Session, task: MergeTask, worker_id: str, heartbeat=None) -> bool:
+        """执行已认领的合并任务并写回结果 (含各阶段耗时), 返回是否成功; 执行过程中推送实时进度
+
+        heartbeat 为该任务的 HeartbeatThread, 用于响应取消请求; 超出限制或被取消时以明确的原因结束。
+        """
+        guard = MergeGuard(heartbeat)
+        progress = MergeProgress(task.id, guard.check)
+        if task.created_at and task.started_at:
+            progress.record("queue", (task.started_at - task.created_at).total_seconds())
+        try:
+            values = MergeService._execute(db, task, progress, guard)
+            values["status"] = MergeTaskStatus.COMPLETED.value
+            values["error_message"] = None
+        except MergeAborted as e:
+            db.rollback()
+            values = {
+                "status": MergeTaskStatus.CANCELLED.value if e.cancelled else MergeTaskStatus.FAILED.value,
+                "error_message": str(e),
+            }
+        except Exception as e:
+            db.rollback()
+            values = {
+                "status": MergeTaskStatus.FAILED.value,
+                "error_message": str(e) or e.__class__.__name__,
+            }
+        values["stage_timings"] = json.dumps(progress.timings)
+
+        MergeQueue.finish(db, task.id, worker_id, values)
+        progress.finish(values["status"], values["error_message"])
+        return values["status"] == MergeTaskStatus.COMPLETED.value
+
+    @staticmethod
+    def _execute(db: Session, task: MergeTask, progress: MergeProgress, guard: MergeGuard) -> dict:
+        """下载、合并并上传, 返回需要写回任务的字段 (相同输入直接复用缓存结果)"""
+        # 创建时按发票记录预估的大小和页数已超限时不必下载
+        guard.check_estimate(task.estimated_size or 0, task.total_pages or 0)
+        invoice_ids = json.loads(task.invoice_ids)
+        invoices = db.query(Invoice).filter(Invoice.id.in_(invoice_ids)).all()
+        if task.groups:
+            # 分组合并的输出组合多变, 不走合并结果缓存
+            return MergeService._render_batch(task, invoice_ids, invoices, progress, guard)
+
+        with progress.stage("cache"):
+            cache_key = MergeCacheService.compute_key(
+                invoice_ids, invoices, task.output_type, MergeService._render_options(task, invoice_ids, invoices),
+            )
+            cached = MergeCacheService.acquire(db, cache_key, task.id, guard.check) if cache_key else None
+        if cached is not None:
+            invoice_map = {inv.id: inv for inv in invoices}
+            return {
+                "total_pages": cached.total_pages,
+                "total_amount": sum(invoice_map[i].total_amount or 0.0 for i in invoice_ids),
+                "object_name": cached.object_name,
+                "download_url": MinioService.get_public_url(cached.object_name),
+                "failed_invoices": json.dumps([]),
+                "cache_key": cache_key,
+                "cache_hit": True,
+            }
 
-        # 执行合并
         try:
-            invoices = db.query(Invoice).filter(Invoice.id.in_(invoice_ids)).all()
-            total_amount = sum(inv.total_amount for inv in invoices)
+            values = None
+            if task.base_task_id:
+                counted = guard.snapshot()
+                values = MergeService._render_append(
+                    db, task, invoice_ids, invoices, cache_key, progress, guard,
+                )
+                if values is None:
+                    # 追加路径中途放弃, 改为完整合并前撤回已计入的输入和页数
+                    guard.restore(counted)
+            if values is None:
+                values = MergeService._render(task, invoice_ids, invoices, cache_key, progress, guard)
+        except Exception:
+            if cache_key:
+                MergeCacheService.abandon(db, cache_key, task.id)
+            raise
+
+        if cache_key:
+            if values["cache_key"]:
+                MergeCacheService.publish(
+                    db, cache_key, task.id, task.output_type,
+                    values["object_name"], values["total_pages"],
+                )
+            else:
+                MergeCacheService.abandon(db, cache_key, task.id)
+        return values
+
+    @staticmethod
+    def layout_options(task: MergeTask) -> LayoutOptions:
+        """任务的排版配置 (未指定时使用默认配置)"""
+        if task.layout:
+            return LayoutOptions.model_validate_json(task.layout)
+        return LayoutOptions()
+
+    @staticmethod
+    def _render_options(task: MergeTask, invoice_ids: List[str], invoices: List[Invoice]) -> dict:
+        """影响输出内容的渲染参数 (参与缓存键计算)
+
+        ZIP 内的清单、PDF 的分类标签都取自发票字段, 字段被编辑或识别补全后输出随之变化, 因此这些字段也计入缓存键。
+        """
+        options = {}
+        invoice_map = {inv.id: inv for inv in invoices}
+        if task.output_type == OutputType.PDF.value:
+            layout = MergeService.layout_options(task)
+            options = {
+                "layout": layout.model_dump(by_alias=True),
+                "imageDpi": settings.merge_image_dpi,
+                "jpegQuality": settings.merge_jpeg_quality,
+            }
+            if layout.show_category_label:
+                options["categoryLabels"] = [
+                    invoice_map[invoice_id].type for invoice_id in invoice_ids if invoice_id in invoice_map
+                ]
+        else:
+            options = {
+                "manifest": MANIFEST_NAME,
+                "manifestRows": [
+                    MergeService._manifest_fields(invoice_map[invoice_id])
+                    for invoice_id in invoice_ids if invoice_id in invoice_map
+                ],
+            }
+        return options
+
+    @staticmethod
+    def _render(
+        task: MergeTask,
+        invoice_ids: List[str],
+        invoices: List[Invoice],
+        cache_key: Optional[str],
+        progress: MergeProgress,
+        guard: MergeGuard,
+    ) -> dict:
+        """下载输入、生成合并结果并上传"""
+        # 从 MinIO 并发下载文件
+        # PDF 输出时使用预处理产物 (OFD 转换后的 PDF、预缩放的图片), ZIP 输出保留原文件
+        prepared = task.output_type == OutputType.PDF.value
+        with MergeService._fetch(invoice_ids, invoices, prepared, progress, guard) as fetched:
+            file_contents = fetched.inputs
+            if not file_contents:
+                raise Exception("没有可合并的文件: " + "; ".join(
+                    f"{f.invoice_id}: {f.reason}" for f in fetched.failures
+                ))
+            total_amount = sum(f.invoice.total_amount or 0.0 for f in file_contents)
+
+            # 部分文件下载失败时结果与缓存键不符, 不进入缓存
+            if fetched.failures:
+                cache_key = None
+            stem = cache_key or f"merged_{task.id}"
+
+            if task.output_type == OutputType.PDF.value:
+                # 结果写入临时文件 (超过阈值自动落盘), 再分片上传到 MinIO, 避免在内存中整体复制
+                object_name = f"merged/{stem}.pdf"
+                with tempfile.SpooledTemporaryFile(max_size=settings.merge_spool_max_bytes) as output:
+                    with progress.stage("render", len(file_contents)):
+                        total_pages = MergeService._merge_to_pdf(
+                            file_contents, output, MergeService.layout_options(task), progress.update, guard,
+                        )
+                    MergeService._upload(output, object_name, "application/pdf", progress)
+            else:
+                # ZIP 边打包边分片上传, 不经过临时文件
+                object_name = f"merged/{stem}.zip"
+                total_pages = MergeService._stream_zip(file_contents, object_name, progress)
+
+            return {
+                "total_pages": total_pages,
+                "total_amount": total_amount,
+                "object_name": object_name,
+                "download_url": MinioService.get_public_url(object_name),
+                "failed_invoices": json.dumps([
+                    {"invoiceId": f.invoice_id, "reason": f.reason} for f in fetched.failures
+                ], ensure_ascii=False),
+                "cache_key": cache_key,
+                "cache_hit": False,
+            }
 
-            # 从 MinIO 下载文件
-            file_contents = []
-            for inv in invoices:
-                if inv.file_url:
+    @staticmethod
+    def _fetch(
+        invoice_ids: List[str],
+        invoices: List[Invoice],
+        prepared: bool,
+        progress: MergeProgress,
+        guard: MergeGuard,
+    ) -> FetchResult:
+        """下载输入, 每个文件下载完成时计入输入大小上限; 超出 merge_memory_budget_mb 的输入转存到磁盘, 用完需关闭"""
+        with progress.stage("fetch", len(invoice_ids)):
+            return MergeFetcher.fetch(
+                invoice_ids, invoices, prepared=prepared, on_progress=progress.update,
+                memory_budget=settings.merge_memory_budget_mb * 1024 * 1024,
+                on_input=guard.add_input_bytes,
+            )
+
+    @staticmethod
+    def _upload(output: BinaryIO, object_name: str, content_type: str, progress: MergeProgress):
+        """把写好的临时文件分片上传到 MinIO, 按字节数上报进度"""
+        length = output.tell()
+        output.seek(0)
+        with progress.stage("upload", length):
+            MinioService.upload_file_stream(
+                ProgressStream(output, progress, length), object_name, length, content_type,
+            )
+
+    @staticmethod
+    def _stream_zip(file_contents: List[MergeInput], object_name: str, progress: MergeProgress) -> int:
+        """在后台线程打包 ZIP, 同时以未知长度分片上传到 MinIO, 返回文件数
+
+        打包与上传合并为 upload 阶段; 已压缩的文件原样存储, ZIP 大小接近输入总大小, 以此作为进度总量。
+        """
+        length = sum(item.size for item in file_contents)
+        with progress.stage("upload", length):
+            return stream_zip(
+                lambda zf: MergeService._write_zip(zf, file_contents),
+                lambda stream: MinioService.upload_file_stream(
+                    ProgressStream(stream, progress, length), object_name, -1, "application/zip",
+                ),
+            )
+
+    @staticmethod
+    def _append_plan(
+        task: MergeTask,
+        base: Optional[MergeTask],
+        invoices: List[Invoice],
+    ) -> Optional[Tuple[List[str], int, int]]:
+        """计算追加合并的增量方案, 返回 (基础结果末页的发票ID, 末页已占槽位数, 可直接复制的页数)
+
+        以下情况无法只追加, 返回 None 由调用方完整重新合并:
+        基础结果不可用或有下载失败的发票 (重新合并会重试)、显示页码 (已有页面的总页数会变化)、
+        基础发票的页数未知或与基础结果的页数不符。
+        """
+        options = MergeService.layout_options(task)
+        if (
+            base is None
+            or base.status != MergeTaskStatus.COMPLETED.value
+            or base.output_type != OutputType.PDF.value
+            or base.groups
+            or not base.object_name
+            or (base.failed_invoices and json.loads(base.failed_invoices))
+            or options.show_page_number
+        ):
+            return None
+
+        invoice_map = {inv.id: inv for inv in invoices}
+        base_ids = json.loads(base.invoice_ids)
+        if any(i not in invoice_map or invoice_map[i].page_count is None for i in base_ids):
+            return None
+        slot_counts = [max(invoice_map[i].page_count, 1) for i in base_ids]
+
+        geometry = LayoutEngine.compute(options)
+        if geometry.page_count(sum(slot_counts)) != base.total_pages:
+            return None
+
+        # 末页未排满时需要与新增发票一起重新拼版, 找出占用末页槽位的发票
+        remainder = sum(slot_counts) % geometry.per_page
+        full_pages = sum(slot_counts) // geometry.per_page
+        tail_ids: List[str] = []
+        covered = 0
+        for invoice_id, count in zip(reversed(base_ids), reversed(slot_counts)):
+            if covered >= remainder:
+                break
+            tail_ids.insert(0, invoice_id)
+            covered += count
+        return tail_ids, remainder, full_pages
+
+    @staticmethod
+    def _render_append(
+        db: Session,
+        task: MergeTask,
+        invoice_ids: List[str],
+        invoices: List[Invoice],
+        cache_key: Optional[str],
+        progress: MergeProgress,
+        guard: MergeGuard,
+    ) -> Optional[dict]:
+        """追加合并: 复制基础结果中已排满的页面, 只拼版末页和新增发票, 耗时只与新增部分相关
+
+        不满足增量条件时返回 None。
+        """
+        base = MergeService.get_by_id(db, task.base_task_id)
+        plan = MergeService._append_plan(task, base, invoices)
+        if plan is None:
+            return None
+        tail_ids, remainder, full_pages = plan
+        base_count = len(json.loads(base.invoice_ids))
+        new_ids = invoice_ids[base_count:]
+        invoice_map = {inv.id: inv for inv in invoices}
+        base_amount = sum(invoice_map[i].total_amount or 0.0 for i in invoice_ids[:base_count])
+
+        with MergeService._fetch(tail_ids + new_ids, invoices, True, progress, guard) as fetched:
+            tail_inputs = fetched.inputs[:len(tail_ids)]
+            if [item.invoice.id for item in tail_inputs] != tail_ids:
+                # 末页的基础发票读取失败
+                return None
+            new_inputs = fetched.inputs[len(tail_ids):]
+            if not new_inputs:
+                raise Exception("没有可合并的文件: " + "; ".join(
+                    f"{f.invoice_id}: {f.reason}" for f in fetched.failures
+                ))
+
+            assembler = PageAssembler(MergeService.layout_options(task), progress.update, guard.check)
+            tail_items = assembler.expand(tail_inputs, first_number=base_count - len(tail_ids) + 1)
+            if len(tail_items) != sum(max(invoice_map[i].page_count, 1) for i in tail_ids):
+                # 实际页数与记录不符, 槽位无法对齐
+                return None
+            items = (tail_items[len(tail_items) - remainder:] if remainder else []) \
+                + assembler.expand(new_inputs, first_number=base_count + 1)
+
+            if fetched.failures:
+                cache_key = None
+            stem = cache_key or f"merged_{task.id}"
+            object_name = f"merged/{stem}.pdf"
+
+            with tempfile.SpooledTemporaryFile(max_size=settings.merge_spool_max_bytes) as base_file, \
+                    tempfile.SpooledTemporaryFile(max_size=settings.merge_spool_max_bytes) as rendered, \
+                    tempfile.SpooledTemporaryFile(max_size=settings.merge_spool_max_bytes) as output:
+                with progress.stage("base", base.total_pages):
                     try:
-                        # 从URL提取object_name
-                        object_name = "/".join(inv.file_url.split("/")[-2:])
-                        content = MinioService.download_file(object_name)
-                        file_contents.append({
-                            "content": content,
-                            "type": inv.file_type,
-                            "name": f"{inv.id}.{inv.file_type}"
-                        })
+                        for chunk in MinioService.iter_file(base.object_name):
+                            base_file.write(chunk)
+                        base_file.seek(0)
+                        base_reader = PdfReader(base_file)
+                        if len(base_reader.pages) != base.total_pages:
+                            return None
                     except Exception:
+                        # 基础结果已被清理或损坏
+                        return None
+                    guard.add_input_bytes(base_file.seek(0, 2))
+
+                with progress.stage("render", len(items)):
+                    guard.add_pages(full_pages + assembler.geometry.page_count(len(items)))
+                    new_pages = assembler.render(items, rendered, first_page=full_pages)
+                    rendered.seek(0)
+                    writer = PdfWriter()
+                    if full_pages:
+                        writer.append(base_reader, pages=(0, full_pages))
+                    writer.append(PdfReader(rendered))
+                    writer.write(output)
+
+                MergeService._upload(output, object_name, "application/pdf", progress)
+
+            return {
+                "total_pages": full_pages + new_pages,
+                "total_amount": base_amount + sum(f.invoice.total_amount or 0.0 for f in new_inputs),
+                "object_name": object_name,
+                "download_url": MinioService.get_public_url(object_name),
+                "failed_invoices": json.dumps([
+                    {"invoiceId": f.invoice_id, "reason": f.reason} for f in fetched.failures
+                ], ensure_ascii=False),
+                "cache_key": cache_key,
+                "cache_hit": False,
+            }
+
+    @staticmethod
+    def _render_batch(
+        task: MergeTask,
+        invoice_ids: List[str],
+        invoices: List[Invoice],
+        progress: MergeProgress,
+        guard: MergeGuard,
+    ) -> dict:
+        """分组合并: 所有发票只下载一次, 逐个分组生成输出, 按 bundle 打包为一个 ZIP 或分别上传
+
+        render 阶段的进度按已完成的分组数计算。
+        """
+        is_pdf = task.output_type == OutputType.PDF.value
+        with MergeService._fetch(invoice_ids, invoices, is_pdf, progress, guard) as fetched:
+            if not fetched.inputs:
+                raise Exception("没有可合并的文件: " + "; ".join(
+                    f"{f.invoice_id}: {f.reason}" for f in fetched.failures
+                ))
+            input_map = {item.invoice.id: item for item in fetched.inputs}
+            failure_map = {f.invoice_id: f.reason for f in fetched.failures}
+
+            # 同一拼版器在各分组间复用已解析的 PDF; 图片在每个分组中按需缩放, 用完即释放
+            assembler = PageAssembler(MergeService.layout_options(task), checkpoint=guard.check) if is_pdf else None
+            suffix = "pdf" if is_pdf else "zip"
+            groups = json.loads(task.groups)
+            file_names = MergeService._group_file_names([group["name"] for group in groups], suffix)
+
+            results = []
+            with tempfile.SpooledTemporaryFile(max_size=settings.merge_spool_max_bytes) as bundle:
+                bundle_zip = zipfile.ZipFile(bundle, 'w') if task.bundle else None
+                for index, (group, file_name) in enumerate(zip(groups, file_names)):
+                    inputs = [input_map[i] for i in group["invoiceIds"] if i in input_map]
+                    result = {
+                        "name": group["name"],
+                        "invoiceIds": group["invoiceIds"],
+                        "fileName": None,
+                        "totalPages": 0,
+                        "totalAmount": sum(item.invoice.total_amount or 0.0 for item in inputs),
+                        "downloadUrl": None,
+                        "failedInvoices": [
+                            {"invoiceId": i, "reason": failure_map[i]}
+                            for i in group["invoiceIds"] if i in failure_map
+                        ],
+                        "errorMessage": None,
+                    }
+                    results.append(result)
+                    if not inputs:
+                        result["errorMessage"] = "没有可合并的文件"
                         continue
 
-            if output_type == OutputType.PDF.value:
-                output_data, total_pages = MergeService._merge_to_pdf(file_contents)
-                object_name = f"merged/merged_{task_id}.pdf"
-                content_type = "application/pdf"
-            else:
-                output_data, total_pages = MergeService._merge_to_zip(file_contents)
-                object_name = f"merged/merged_{task_id}.zip"
-                content_type = "application/zip"
+                    if bundle_zip is not None and not is_pdf:
+                        # ZIP 输出打包时直接按分组建目录, 不嵌套压缩包
+                        with progress.stage("render", len(groups), index):
+                            folder = file_name[:-len(".zip")]
+                            MergeService._write_zip(bundle_zip, inputs, folder=folder + "/")
+                        result["fileName"] = folder + "/"
+                        result["totalPages"] = len(inputs)
+                        continue
 
-            # 上传合并后的文件到 MinIO
-            MinioService.upload_file(output_data, object_name, content_type)
-            download_url = MinioService.get_public_url(object_name)
+                    with tempfile.SpooledTemporaryFile(max_size=settings.merge_spool_max_bytes) as output:
+                        with progress.stage("render", len(groups), index):
+                            if is_pdf:
+                                result["totalPages"] = MergeService._assemble(assembler, inputs, output, guard)
+                            else:
+                                result["totalPages"] = MergeService._merge_to_zip(inputs, output)
+                            if bundle_zip is not None:
+                                size = output.tell()
+                                output.seek(0)
+                                with open_entry(bundle_zip, file_name, size) as entry:
+                                    shutil.copyfileobj(output, entry)
+                        result["fileName"] = file_name
+                        if bundle_zip is None:
+                            object_name = MergeService._group_object_name(task.id, file_name)
+                            MergeService._upload(
+                                output, object_name, "application/pdf" if is_pdf else "application/zip", progress,
+                            )
+                            result["downloadUrl"] = MinioService.get_public_url(object_name)
+
+                if not any(result["fileName"] for result in results):
+                    if bundle_zip is not None:
+                        bundle_zip.close()
+                    raise Exception("所有分组均没有可合并的文件")
+
+                object_name = None
+                if bundle_zip is not None:
+                    write_bytes(bundle_zip, "manifest.json", json.dumps({
+                        "taskId": task.id,
+                        "outputType": task.output_type,
+                        "groups": results,
+                    }, ensure_ascii=False, indent=2).encode("utf-8"))
+                    bundle_zip.close()
+                    object_name = f"merged/batch_{task.id}.zip"
+                    MergeService._upload(bundle, object_name, "application/zip", progress)
+
+            return {
+                "total_pages": sum(result["totalPages"] for result in results),
+                "total_amount": sum(item.invoice.total_amount or 0.0 for item in fetched.inputs),
+                "object_name": object_name,
+                "download_url": MinioService.get_public_url(object_name) if object_name else None,
+                "failed_invoices": json.dumps([
+                    {"invoiceId": f.invoice_id, "reason": f.reason} for f in fetched.failures
+                ], ensure_ascii=False),
+                "groups": json.dumps(results, ensure_ascii=False),
+                "cache_key": None,
+                "cache_hit": False,
+            }
 
-            task.status = MergeTaskStatus.COMPLETED.value
-            task.total_pages = total_pages
-            task.total_amount = total_amount
-            task.download_url = download_url
+    @staticmethod
+    def _group_object_name(task_id: str, file_name: str) -> str:
+        """分组合并 (未打包) 中单个分组输出的对象名"""
+        return f"merged/batch_{task_id}/{file_name}"
 
-        except Exception as e:
-            print(f"合并失败: {e}")
-            task.status = MergeTaskStatus.FAILED.value
+    @staticmethod
+    def _group_file_names(names: List[str], suffix: str) -> List[str]:
+        """由分组名称生成不重复的安全文件名"""
+        file_names = []
+        used = set()
+        for index, name in enumerate(names, start=1):
+            stem = _UNSAFE_NAME.sub("_", name).strip(" .") or f"group_{index}"
+            file_name = f"{stem}.{suffix}"
+            if file_name in used:
+                file_name = f"{stem}_{index}.{suffix}"
+            used.add(file_name)
+            file_names.append(file_name)
+        return file_names
 
-        db.commit()
-        db.refresh(task)
+    @staticmethod
+    def _merge_to_pdf(
+        file_contents: List[MergeInput],
+        output: BinaryIO,
+        options: LayoutOptions,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+        guard: Optional[MergeGuard] = None,
+    ) -> int:
+        """PDF 与图片按排版配置拼版为一个 PDF, 写入 output 并返回页数"""
+        assembler = PageAssembler(options, on_progress, guard.check if guard is not None else None)
+        return MergeService._assemble(assembler, file_contents, output, guard)
 
-        return task
+    @staticmethod
+    def _assemble(
+        assembler: PageAssembler,
+        file_contents: List[MergeInput],
+        output: BinaryIO,
+        guard: Optional[MergeGuard] = None,
+    ) -> int:
+        """展开槽位后先检查输出页数上限, 再拼版"""
+        items = assembler.expand(file_contents)
+        if guard is not None:
+            guard.add_pages(assembler.geometry.page_count(len(items)))
+        return assembler.render(items, output)
 
     @staticmethod
-    def _merge_to_pdf(file_contents: List[dict]) -> tuple[bytes, int]:
-        """合并为PDF"""
-        pdf_files = [f for f in file_contents if f["type"] == "pdf"]
+    def _merge_to_zip(
+        file_contents: List[MergeInput],
+        output: BinaryIO,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+    ) -> int:
+        """打包为ZIP"""
+        with zipfile.ZipFile(output, 'w') as zf:
+            return MergeService._write_zip(zf, file_contents, on_progress)
 
-        if pdf_files:
-            return MergeService._merge_pdfs(pdf_files)
-        else:
-            return MergeService._images_to_pdf(file_contents)
-
-    @staticmethod
-    def _merge_pdfs(pdf_files: List[dict]) -> tuple[bytes, int]:
-        """合并PDF文件"""
-        writer = PdfWriter()
-        total_pages = 0
-
-        for pdf_file in pdf_files:
-            try:
-                reader = PdfReader(io.BytesIO(pdf_file["content"]))
-                for page in reader.pages:
-                    writer.add_page(page)
-                    total_pages += 1
-            except Exception:
-                continue
-
-        output = io.BytesIO()
-        writer.write(output)
-        return output.getvalue(), total_pages
-
-    @staticmethod
-    def _images_to_pdf(file_contents: List[dict]) -> tuple[bytes, int]:
-        """图片合并为PDF (2合1布局)"""
-        output = io.BytesIO()
-        c = canvas.Canvas(output, pagesize=A4)
-        width, height = A4
-
-        margin = 10 * mm
-        gap = 5 * mm
-        img_width = width - 2 * margin
-        img_height = (height - 2 * margin - gap) / 2
-
-        page_count = 0
-        for i, file_data in enumerate(file_contents):
-            if i % 2 == 0 and i > 0:
-                c.showPage()
-
-            position = i % 2
-            y = height - margin - img_height if position == 0 else margin + gap / 2
-
-            try:
-                # 从内存加载图片
-                from PIL import Image
-                img = Image.open(io.BytesIO(file_data["content"]))
-
-                # 转换为临时文件供reportlab使用
-                img_buffer = io.BytesIO()
-                img.save(img_buffer, format='PNG')
-                img_buffer.seek(0)
-
-                from reportlab.lib.utils import ImageReader
-                img_reader = ImageReader(img_buffer)
-
-                c.drawImage(
-                    img_reader, margin, y,
-                    width=img_width, height=img_height,
-                    preserveAspectRatio=True, anchor='c'
-                )
-            except Exception:
-                c.setFillColorRGB(0.9, 0.9, 0.9)
-                c.rect(margin, y, img_width, img_height, fill=1)
-                c.setFillColorRGB(0.5, 0.5, 0.5)
-                c.drawCentredString(width / 2, y + img_height / 2, f"发票 {i + 1}")
+    @staticmethod
+    def _write_zip(
+        zf: zipfile.ZipFile,
+        file_contents: List[MergeInput],
+        on_progress: Optional[Callable[[int, int], None]] = None,
+        folder: str = "",
+    ) -> int:
+        """把输入文件和发票清单 (manifest.csv) 写入 ZIP 的 folder 目录下, 返回文件数
+
+        文件流式写入, 已转存到磁盘的输入不整体读回内存; PDF、图片、OFD 原样存储不再压缩。
+        """
+        for index, file_data in enumerate(file_contents, start=1):
+            with file_data.open() as source, open_entry(zf, folder + file_data.name, file_data.size) as entry:
+                shutil.copyfileobj(source, entry)
+            if on_progress is not None:
+                on_progress(index, len(file_contents))
+        write_bytes(zf, folder + MANIFEST_NAME, MergeService._manifest_csv(file_contents))
+        return len(file_contents)
 
-            if position == 1 or i == len(file_contents) - 1:
-                page_count += 1
+    @staticmethod
+    def _manifest_csv(file_contents: List[MergeInput]) -> bytes:
+        """ZIP 内的发票清单, 带 BOM 以便 Excel 直接打开"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["文件名", "发票ID", "发票代码", "发票号码", "发票类型", "开票日期",
+                         "销方名称", "购方名称", "金额", "税额", "价税合计"])
+        for item in file_contents:
+            writer.writerow([item.name, *MergeService._manifest_fields(item.invoice)])
+        return buffer.getvalue().encode("utf-8-sig")
 
-        c.save()
-        return output.getvalue(), page_count
+    @staticmethod
+    def _manifest_fields(inv: Invoice) -> list:
+        """清单中一张发票的字段 (文件名之后的各列)"""
+        return [
+            inv.id, inv.code, inv.number, inv.type, inv.date,
+            inv.seller_name, inv.buyer_name, inv.amount, inv.tax_amount, inv.total_amount,
+        ]
 
     @staticmethod
-    def _merge_to_zip(file_contents: List[dict]) -> tuple[bytes, int]:
-        """打包为ZIP"""
-        output = io.BytesIO()
-        with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as zf:
-            for file_data in file_contents:
-                zf.writestr(file_data["name"], file_data["content"])
-        return output.getvalue(), len(file_contents)
+    def get_download_url(db: Session, task_id: str, group: Optional[int] = None) -> Optional[str]:
+        """获取下载URL, group 为分组合并 (未打包) 中分组的序号"""
+        task = MergeService.get_by_id(db, task_id)
+        if not task or task.status != MergeTaskStatus.COMPLETED.value:
+            return None
+        if group is None:
+            return task.download_url
+        groups = json.loads(task.groups) if task.groups else []
+        if group >= len(groups):
+            return None
+        return groups[group].get("downloadUrl")
 
     @staticmethod
-    def get_download_url(db: Session, task_id: str) -> Optional[str]:
-        """获取下载URL"""
+    def get_download_object(
+        db: Session,
+        task_id: str,
+        group: Optional[int] = None,
+    ) -> Optional[Tuple[str, str]]:
+        """获取下载的对象名和下载文件名, 任务未完成或分组没有单独输出时返回 None"""
         task = MergeService.get_by_id(db, task_id)
         if not task or task.status != MergeTaskStatus.COMPLETED.value:
             return None
-        return task.download_url
+        if group is None:
+            if not task.object_name:
+                return None
+            suffix = task.object_name.rsplit(".", 1)[-1]
+            return task.object_name, f"merged_{task.id}.{suffix}"
+        groups = json.loads(task.groups) if task.groups else []
+        if group >= len(groups) or not groups[group].get("downloadUrl"):
+            return None
+        file_name = groups[group]["fileName"]
+        return MergeService._group_object_name(task.id, file_name), file_name
+
+    @staticmethod
+    def to_progress_event(task: MergeTask) -> MergeProgressEvent:
+        """由任务记录生成进度事件 (订阅开始时尚无实时进度的情况)"""
+        return MergeProgressEvent(
+            taskId=task.id,
+            status=task.status,
+            stageTimings=json.loads(task.stage_timings) if task.stage_timings else {},
+            errorMessage=task.error_message,
+        )
 
     @staticmethod
     def to_response(task: MergeTask) -> MergeTaskResponse:
@@ -227,4 +827,14 @@ class MergeService:
             totalAmount=task.total_amount,
             createdAt=task.created_at.isoformat() + "Z" if task.created_at else "",
             downloadUrl=task.download_url,
+            errorMessage=task.error_message,
+            failedInvoices=json.loads(task.failed_invoices) if task.failed_invoices else [],
+            stageTimings=json.loads(task.stage_timings) if task.stage_timings else {},
+            cacheHit=bool(task.cache_hit),
+            estimatedSize=task.estimated_size or 0,
+            layout=MergeService.layout_options(task) if task.output_type == OutputType.PDF.value else None,
+            groups=json.loads(task.groups) if task.groups else [],
+            bundle=bool(task.bundle),
+            baseTaskId=task.base_task_id,
+            cancelRequested=bool(task.cancel_requested),
         )
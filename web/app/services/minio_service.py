@@ -3,11 +3,15 @@ MinIO 对象存储服务
 """
 import io
 import uuid
-from datetime import timedelta
-from typing import Optional, BinaryIO
+from datetime import datetime, timedelta, timezone
+from typing import Optional, BinaryIO, Iterator, List
 from pathlib import Path
 
+import certifi
+import urllib3
 from minio import Minio
+from minio.commonconfig import REPLACE, ComposeSource, CopySource
+from minio.deleteobjects import DeleteObject
 from minio.error import S3Error
 
 from app.config import settings
@@ -27,11 +31,28 @@ class MinioService:
                 access_key=settings.minio_access_key,
                 secret_key=settings.minio_secret_key,
                 secure=settings.minio_secure,
+                http_client=cls._build_http_client(),
             )
             # 确保 bucket 存在
             cls._ensure_bucket()
         return cls._client
 
+    @staticmethod
+    def _build_http_client() -> urllib3.PoolManager:
+        """构建连接池 (连接数需覆盖并发下载数, 否则多余的连接会被丢弃重建)"""
+        timeout = timedelta(minutes=5).seconds
+        return urllib3.PoolManager(
+            timeout=urllib3.Timeout(connect=timeout, read=timeout),
+            maxsize=max(10, settings.minio_max_connections),
+            cert_reqs="CERT_REQUIRED",
+            ca_certs=certifi.where(),
+            retries=urllib3.Retry(
+                total=5,
+                backoff_factor=0.2,
+                status_forcelist=[500, 502, 503, 504],
+            ),
+        )
+
     @classmethod
     def _ensure_bucket(cls):
         """确保存储桶存在"""
@@ -63,6 +84,11 @@ class MinioService:
         unique_id = str(uuid.uuid4())[:8]
         return f"{prefix}/{unique_id}{ext}"
 
+    @staticmethod
+    def object_name_from_url(file_url: str) -> str:
+        """从访问URL提取对象名称 (prefix/filename)"""
+        return "/".join(file_url.split("/")[-2:])
+
     @classmethod
     def upload_file(
         cls,
@@ -94,7 +120,11 @@ class MinioService:
         length: int,
         content_type: str = "application/octet-stream",
     ) -> str:
-        """上传文件流到 MinIO"""
+        """上传文件流到 MinIO
+
+        超过 minio_part_size 的流按分片 (multipart) 逐片读取上传, 内存占用不超过一个分片;
+        length 为 -1 时表示长度未知。
+        """
         client = cls.get_client()
         bucket_name = settings.minio_bucket_name
 
@@ -105,11 +135,34 @@ class MinioService:
                 data=file_stream,
                 length=length,
                 content_type=content_type,
+                part_size=settings.minio_part_size,
             )
             return object_name
         except S3Error as e:
             raise Exception(f"上传文件失败: {e}")
 
+    @classmethod
+    def compose_files(
+        cls,
+        source_names: List[str],
+        object_name: str,
+        content_type: str = "application/octet-stream",
+    ) -> str:
+        """在 MinIO 服务端按顺序拼接多个对象 (除最后一个外每个源对象至少 5MB)"""
+        client = cls.get_client()
+        bucket_name = settings.minio_bucket_name
+
+        try:
+            client.compose_object(
+                bucket_name,
+                object_name,
+                [ComposeSource(bucket_name, name) for name in source_names],
+                metadata={"Content-Type": content_type},
+            )
+            return object_name
+        except S3Error as e:
+            raise Exception(f"合并文件失败: {e}")
+
     @classmethod
     def download_file(cls, object_name: str) -> bytes:
         """从 MinIO 下载文件"""
@@ -125,6 +178,28 @@ class MinioService:
         except S3Error as e:
             raise Exception(f"下载文件失败: {e}")
 
+    @classmethod
+    def iter_file(
+        cls,
+        object_name: str,
+        chunk_size: int = 1024 * 1024,
+        offset: int = 0,
+        length: int = 0,
+    ) -> Iterator[bytes]:
+        """分块读取 MinIO 中的文件, 不在内存中保留完整内容; offset/length 指定读取范围 (length 为 0 时读到结尾)"""
+        client = cls.get_client()
+        bucket_name = settings.minio_bucket_name
+
+        try:
+            response = client.get_object(bucket_name, object_name, offset=offset, length=length)
+        except S3Error as e:
+            raise Exception(f"下载文件失败: {e}")
+        try:
+            yield from response.stream(chunk_size)
+        finally:
+            response.close()
+            response.release_conn()
+
     @classmethod
     def get_file_url(cls, object_name: str, expires: int = 3600) -> str:
         """获取文件的预签名URL"""
@@ -141,6 +216,55 @@ class MinioService:
         except S3Error as e:
             raise Exception(f"获取文件URL失败: {e}")
 
+    @classmethod
+    def get_upload_url(cls, object_name: str, expires: int = 900) -> str:
+        """获取上传用的预签名 PUT URL, 客户端可直接上传到 MinIO"""
+        client = cls.get_client()
+        bucket_name = settings.minio_bucket_name
+
+        try:
+            return client.presigned_put_object(
+                bucket_name=bucket_name,
+                object_name=object_name,
+                expires=timedelta(seconds=expires),
+            )
+        except S3Error as e:
+            raise Exception(f"获取上传URL失败: {e}")
+
+    @classmethod
+    def read_head(cls, object_name: str, length: int) -> bytes:
+        """读取文件开头的 length 个字节"""
+        client = cls.get_client()
+        bucket_name = settings.minio_bucket_name
+
+        try:
+            response = client.get_object(bucket_name, object_name, offset=0, length=length)
+            try:
+                return response.read()
+            finally:
+                response.close()
+                response.release_conn()
+        except S3Error as e:
+            raise Exception(f"下载文件失败: {e}")
+
+    @classmethod
+    def copy_file(cls, source_name: str, object_name: str, content_type: str) -> str:
+        """在 MinIO 服务端复制对象并设置 Content-Type"""
+        client = cls.get_client()
+        bucket_name = settings.minio_bucket_name
+
+        try:
+            client.copy_object(
+                bucket_name,
+                object_name,
+                CopySource(bucket_name, source_name),
+                metadata={"Content-Type": content_type},
+                metadata_directive=REPLACE,
+            )
+            return object_name
+        except S3Error as e:
+            raise Exception(f"复制文件失败: {e}")
+
     @classmethod
     def get_public_url(cls, object_name: str) -> str:
         """获取公开访问URL (需要桶设置为公开)"""
@@ -160,6 +284,17 @@ class MinioService:
             print(f"删除文件失败: {e}")
             return False
 
+    @classmethod
+    def stat_file(cls, object_name: str):
+        """获取对象元信息 (etag/size/last_modified 等)"""
+        client = cls.get_client()
+        bucket_name = settings.minio_bucket_name
+
+        try:
+            return client.stat_object(bucket_name, object_name)
+        except S3Error as e:
+            raise Exception(f"获取文件信息失败: {e}")
+
     @classmethod
     def file_exists(cls, object_name: str) -> bool:
         """检查文件是否存在"""
@@ -172,6 +307,22 @@ class MinioService:
         except S3Error:
             return False
 
+    @classmethod
+    def delete_files(cls, object_names: List[str]) -> int:
+        """批量删除文件, 返回删除失败的数量"""
+        client = cls.get_client()
+        bucket_name = settings.minio_bucket_name
+
+        errors = client.remove_objects(
+            bucket_name,
+            [DeleteObject(name) for name in object_names],
+        )
+        failed = 0
+        for error in errors:
+            print(f"删除文件失败: {error}")
+            failed += 1
+        return failed
+
     @classmethod
     def list_files(cls, prefix: str = "", recursive: bool = True) -> list:
         """列出文件"""
@@ -188,3 +339,32 @@ class MinioService:
         except S3Error as e:
             print(f"列出文件失败: {e}")
             return []
+
+    @classmethod
+    def list_objects(cls, prefix: str = "", recursive: bool = True) -> list:
+        """列出对象 (包含大小和修改时间)"""
+        client = cls.get_client()
+        bucket_name = settings.minio_bucket_name
+
+        try:
+            return list(client.list_objects(
+                bucket_name,
+                prefix=prefix,
+                recursive=recursive,
+            ))
+        except S3Error as e:
+            print(f"列出文件失败: {e}")
+            return []
+
+    @classmethod
+    def delete_stale(cls, prefix: str, max_age_hours: int) -> int:
+        """删除前缀下修改时间早于 max_age_hours 小时前的对象, 返回删除数量"""
+        cutoff = datetime.now(timezone.utc) - timedelta(hours=max_age_hours)
+        stale = [
+            obj.object_name
+            for obj in cls.list_objects(prefix)
+            if obj.last_modified and obj.last_modified < cutoff
+        ]
+        if stale:
+            cls.delete_files(stale)
+        return len(stale)
@@ -0,0 +1,57 @@
+"""
+OFD 转换缓存 - OFD 发票渲染为 PDF 后与原文件相邻存放, 每个文件只转换一次
+
+转换结果对象名为 "<原对象名>.pdf"; 原文件对象名唯一且不会被覆盖, 因此无需失效处理。
+合并 PDF 时 OFD 发票直接读取转换结果, 走与 PDF 发票相同的矢量拼版路径。
+"""
+from typing import List, Optional, Tuple
+
+from app.services.minio_service import MinioService
+from app.services.render_pool import RenderPool
+from app.utils.ofd_render import render_ofd_to_pdf
+
+
+def convert_job(content: bytes) -> Tuple[Optional[bytes], str]:
+    """进程池任务: 转换单个 OFD 文件, 返回 (PDF 内容, 错误信息)"""
+    try:
+        return render_ofd_to_pdf(content), ""
+    except Exception as e:
+        return None, f"OFD 转换失败: {e}"
+
+
+class OfdConversionService:
+    """OFD 转换缓存服务"""
+
+    @staticmethod
+    def converted_name(object_name: str) -> str:
+        """转换结果的对象名称"""
+        return f"{object_name}.pdf"
+
+    @staticmethod
+    def load_cached(object_name: str) -> Optional[bytes]:
+        """读取已缓存的转换结果, 不存在时返回 None"""
+        try:
+            return MinioService.download_file(OfdConversionService.converted_name(object_name))
+        except Exception:
+            return None
+
+    @staticmethod
+    def convert(object_names: List[str], contents: List[bytes]) -> List[Tuple[Optional[bytes], str]]:
+        """在渲染进程池中批量转换并写入缓存, 结果顺序与输入一致"""
+        results = RenderPool.map(convert_job, contents)
+        for object_name, (pdf, _) in zip(object_names, results):
+            if pdf is None:
+                continue
+            try:
+                MinioService.upload_file(
+                    pdf, OfdConversionService.converted_name(object_name), "application/pdf",
+                )
+            except Exception:
+                # 缓存写入失败不影响本次使用, 下次重新转换
+                pass
+        return results
+
+    @staticmethod
+    def delete_cached(object_name: str):
+        """删除转换结果 (发票删除时调用)"""
+        MinioService.delete_file(OfdConversionService.converted_name(object_name))
@@ -0,0 +1,237 @@
+"""
+页面拼版 - PDF 与图片统一按排版配置 N 合 1 输出
+
+PDF 页面以矢量方式缩放平移到槽位 (pypdf 页面变换 + 合并), 不做栅格化;
+图片在渲染进程池中并行解码缩放后, 与占位块一起由 reportlab 绘制在底层页面上;
+分类标签和页码位于最上层。
+同一拼版器多次 assemble 时 (分组合并), 同一发票的 PDF 只解析一次。
+已转存到磁盘的输入按需读取: PDF 解析时只读取所需的对象; 图片按页面顺序、按内存预算分批读回并缩放,
+最后一个用到它的页面绘制完成后即释放, 不在整个任务期间保留。
+输出页面 (reportlab 画布、PdfWriter) 在写出前仍保留在内存中, 其大小与输出文件大小相当。
+"""
+import shutil
+import tempfile
+from dataclasses import dataclass
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+from pypdf import PageObject, PdfReader, PdfWriter, Transformation
+from reportlab.pdfgen import canvas
+
+from app.config import settings
+from app.schemas.merge_task import LayoutOptions
+from app.services.layout_engine import LayoutEngine, PageGeometry
+from app.services.merge_fetch import MergeInput, budget_batches
+from app.services.render_pool import RenderPool
+from app.utils.image_utils import NormalizedImage
+
+
+@dataclass
+class LayoutItem:
+    """占用一个槽位的内容: PDF 的一页、一张图片或无法解析时的占位块"""
+    source: MergeInput
+    number: int
+    page: Optional[PageObject] = None
+    is_image: bool = False
+
+
+class PageAssembler:
+    """页面拼版器"""
+
+    def __init__(
+        self,
+        options: LayoutOptions,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+        checkpoint: Optional[Callable[[], None]] = None,
+    ):
+        self.options = options
+        # on_progress(已放入槽位的内容数, 总数)
+        self.on_progress = on_progress
+        # 每批图片解码、每页绘制和合并后调用 (如 MergeGuard.check), 可抛出异常中止拼版
+        self.checkpoint = checkpoint
+        self.geometry: PageGeometry = LayoutEngine.compute(options)
+        # 按发票ID缓存已解析的 PDF 页面; 已缩放的图片只保留到最后一个用到它的页面绘制完成
+        self._pages: Dict[str, List[PageObject]] = {}
+        self._images: Dict[str, Optional[NormalizedImage]] = {}
+
+    def assemble(self, inputs: List[MergeInput], output: BinaryIO) -> int:
+        """拼版并写入 output, 返回输出页数"""
+        return self.render(self.expand(inputs), output)
+
+    def render(
+        self,
+        items: List[LayoutItem],
+        output: BinaryIO,
+        first_page: int = 0,
+        total_pages: Optional[int] = None,
+    ) -> int:
+        """把槽位内容拼版写入 output, 返回输出页数
+
+        items 从第 first_page 页 (从 0 开始) 的第一个槽位开始排列, 用于只渲染完整文档中的部分页面;
+        total_pages 为完整文档的页数, 用于页码。
+        """
+        page_count = self.geometry.page_count(len(items))
+        numbering = (first_page, total_pages or page_count)
+        has_vector = any(item.page is not None for item in items)
+
+        with tempfile.SpooledTemporaryFile(max_size=settings.merge_spool_max_bytes) as base:
+            # 没有矢量页时装饰直接画在底层, 否则单独生成一层叠加在最上面
+            self._render_canvas(items, page_count, numbering, base, content=True, decorations=not has_vector)
+            placed = sum(1 for item in items if item.page is None)
+            self._report(placed, len(items))
+            if not has_vector:
+                base.seek(0)
+                shutil.copyfileobj(base, output)
+                return page_count
+
+            base.seek(0)
+            writer = PdfWriter(clone_from=PdfReader(base))
+            for index, item in enumerate(items):
+                if item.page is None:
+                    continue
+                page_index, slot = self.geometry.locate(index)
+                writer.pages[page_index].merge_transformed_page(item.page, self._fit_page(item.page, slot))
+                placed += 1
+                self._check()
+                self._report(placed, len(items))
+
+            if self.options.show_category_label or self.options.show_page_number:
+                with tempfile.SpooledTemporaryFile(max_size=settings.merge_spool_max_bytes) as overlay:
+                    self._render_canvas(items, page_count, numbering, overlay, content=False, decorations=True)
+                    overlay.seek(0)
+                    for page, overlay_page in zip(writer.pages, PdfReader(overlay).pages):
+                        page.merge_page(overlay_page)
+                    writer.write(output)
+            else:
+                writer.write(output)
+
+        return page_count
+
+    def expand(self, inputs: List[MergeInput], first_number: int = 1) -> List[LayoutItem]:
+        """把输入文件展开为按顺序排列的槽位内容, 发票序号从 first_number 开始"""
+        items = []
+        for number, source in enumerate(inputs, start=first_number):
+            if source.type == "pdf":
+                pages = self._pages.get(source.invoice.id)
+                if pages is None:
+                    try:
+                        pages = list(PdfReader(source.open()).pages)
+                    except Exception:
+                        pages = []
+                    self._pages[source.invoice.id] = pages
+                if not pages:
+                    items.append(LayoutItem(source=source, number=number))
+                for page in pages:
+                    items.append(LayoutItem(source=source, number=number, page=page))
+            else:
+                items.append(LayoutItem(source=source, number=number, is_image=True))
+        return items
+
+    def _report(self, done: int, total: int):
+        if self.on_progress is not None:
+            self.on_progress(done, total)
+
+    def _check(self):
+        if self.checkpoint is not None:
+            self.checkpoint()
+
+    @staticmethod
+    def _image_uses(items: List[LayoutItem]) -> Tuple[List[MergeInput], Dict[str, int], Dict[str, int]]:
+        """按首次出现的顺序列出图片输入, 以及每张图片首次、最后一次出现的槽位序号"""
+        sources: List[MergeInput] = []
+        first: Dict[str, int] = {}
+        last: Dict[str, int] = {}
+        for index, item in enumerate(items):
+            if not item.is_image:
+                continue
+            invoice_id = item.source.invoice.id
+            if invoice_id not in first:
+                first[invoice_id] = index
+                sources.append(item.source)
+            last[invoice_id] = index
+        return sources, first, last
+
+    def _normalize_images(self, sources: List[MergeInput]) -> int:
+        """在渲染进程池中并行解码、缩放 sources 开头不超过内存预算的一批图片 (各槽位尺寸相同), 返回数量"""
+        batch = next(self._batches(sources))
+        slot = self.geometry.slots[0]
+        normalized = RenderPool.normalize_images(
+            [source.content for source in batch], (slot.width, slot.height),
+        )
+        self._images.update(zip((source.invoice.id for source in batch), normalized))
+        self._check()
+        return len(batch)
+
+    @staticmethod
+    def _batches(sources: List[MergeInput]) -> Iterator[List[MergeInput]]:
+        """按 merge_memory_budget_mb 把输入分批, 每批读回内存的内容不超过预算"""
+        return budget_batches(sources, settings.merge_memory_budget_mb * 1024 * 1024)
+
+    @staticmethod
+    def _fit_page(page: PageObject, slot) -> Transformation:
+        """计算把 PDF 页面等比缩放、居中放入槽位的变换矩阵"""
+        page.transfer_rotation_to_content()
+        box = page.cropbox
+        scale, x, y = slot.fit(float(box.width), float(box.height))
+        return Transformation() \
+            .translate(-float(box.left), -float(box.bottom)) \
+            .scale(scale, scale) \
+            .translate(x, y)
+
+    def _render_canvas(
+        self,
+        items: List[LayoutItem],
+        page_count: int,
+        numbering: Tuple[int, int],
+        output: BinaryIO,
+        content: bool,
+        decorations: bool,
+    ):
+        """用 reportlab 绘制每页的图片/占位块 (content) 和分类标签/页码 (decorations)
+
+        numbering 为 (首页在完整文档中的序号, 完整文档页数)。
+        """
+        geometry = self.geometry
+        first_page, total_pages = numbering
+        c = canvas.Canvas(output, pagesize=geometry.page_size)
+        sources, first_use, last_use = self._image_uses(items) if content else ([], {}, {})
+        loaded = 0
+
+        for page_index in range(page_count):
+            start = page_index * geometry.per_page
+            end = start + geometry.per_page
+            # 本页用到的图片尚未缩放时, 从本页起按顺序缩放下一批
+            while loaded < len(sources) and first_use[sources[loaded].invoice.id] < end:
+                loaded += self._normalize_images(sources[loaded:])
+
+            for slot, item in zip(geometry.slots, items[start:end]):
+                if content and item.page is None:
+                    image = self._images.get(item.source.invoice.id) if item.is_image else None
+                    self._draw_content(c, slot, item, image)
+                if decorations and self.options.show_category_label:
+                    LayoutEngine.draw_category_label(c, slot, item.source.invoice.type)
+
+            if decorations and self.options.show_page_number:
+                LayoutEngine.draw_page_number(c, geometry, first_page + page_index, total_pages)
+            c.showPage()
+            # 之后的页面不再用到的图片立即释放
+            for item in items[start:end]:
+                if content and item.is_image and last_use[item.source.invoice.id] < end:
+                    self._images.pop(item.source.invoice.id, None)
+            self._check()
+
+        c.save()
+
+    @staticmethod
+    def _draw_content(c: canvas.Canvas, slot, item: LayoutItem, image: Optional[NormalizedImage]):
+        """绘制图片, 无法解析的文件绘制占位块"""
+        if image is not None:
+            try:
+                c.drawImage(
+                    image.reader(), slot.x, slot.y,
+                    width=slot.width, height=slot.height,
+                    preserveAspectRatio=True, anchor='c'
+                )
+                return
+            except Exception:
+                pass
+        LayoutEngine.draw_placeholder(c, slot, f"发票 {item.number}")
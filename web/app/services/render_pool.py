@@ -0,0 +1,113 @@
+"""
+渲染进程池 - 把图片解码/缩放、发票字段提取、缩略图渲染等 CPU 密集的逐文件处理分散到多个进程
+
+逐文件处理在进程池中并行执行, 结果按提交顺序返回, 最终拼版仍在调用方进程中顺序完成,
+保证输出确定。merge_render_processes 为 0 时在当前进程内直接执行。
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, List, Optional, Tuple
+
+from app.config import settings
+from app.utils.image_utils import NormalizedImage, normalize_image
+
+
+def _warm_up():
+    """子进程初始化: 预先导入渲染依赖, 避免首个任务承担导入开销"""
+    import PIL.Image  # noqa: F401
+    import pypdf  # noqa: F401
+    import reportlab.pdfgen.canvas  # noqa: F401
+
+    PIL.Image.init()
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _normalize_image_job(args) -> Optional[NormalizedImage]:
+    """子进程任务: 处理单张图片, 无法解析时返回 None"""
+    content, slot_size, dpi, jpeg_quality = args
+    try:
+        return normalize_image(content, slot_size, dpi, jpeg_quality)
+    except Exception:
+        return None
+
+
+class RenderPool:
+    """渲染进程池 (进程内单例)"""
+
+    _executor: Optional[Executor] = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_executor(cls) -> Optional[Executor]:
+        """获取进程池, 未启用时返回 None"""
+        if settings.merge_render_processes <= 0:
+            return None
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = ProcessPoolExecutor(
+                    max_workers=settings.merge_render_processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_warm_up,
+                )
+        return cls._executor
+
+    @classmethod
+    def warm_up(cls):
+        """启动全部子进程并完成依赖导入"""
+        executor = cls.get_executor()
+        if executor is None:
+            return
+        futures = [executor.submit(_ping) for _ in range(settings.merge_render_processes)]
+        for future in futures:
+            future.result()
+
+    @classmethod
+    def shutdown(cls):
+        with cls._lock:
+            if cls._executor is not None:
+                cls._executor.shutdown(wait=True, cancel_futures=True)
+                cls._executor = None
+
+    @classmethod
+    def map(cls, fn: Callable, jobs: List) -> List:
+        """在进程池中并行执行 fn(job), 结果顺序与 jobs 一致; fn 须为模块级函数"""
+        executor = cls.get_executor()
+        if executor is None or len(jobs) <= 1:
+            return [fn(job) for job in jobs]
+        try:
+            return list(executor.map(fn, jobs))
+        except BrokenProcessPool:
+            # 子进程异常退出 (如被 OOM 杀掉): 重建进程池, 本批在当前进程内完成
+            cls.shutdown()
+            return [fn(job) for job in jobs]
+
+    @classmethod
+    def run(cls, fn: Callable, job):
+        """在进程池中执行单个 fn(job) 并等待结果 (供 API 进程中的按需渲染使用)"""
+        executor = cls.get_executor()
+        if executor is None:
+            return fn(job)
+        try:
+            return executor.submit(fn, job).result()
+        except BrokenProcessPool:
+            cls.shutdown()
+            return fn(job)
+
+    @classmethod
+    def normalize_images(
+        cls,
+        contents: List[bytes],
+        slot_size: Tuple[float, float],
+    ) -> List[Optional[NormalizedImage]]:
+        """并行处理一批图片, 结果顺序与输入一致"""
+        jobs = [
+            (content, slot_size, settings.merge_image_dpi, settings.merge_jpeg_quality)
+            for content in contents
+        ]
+        return cls.map(_normalize_image_job, jobs)
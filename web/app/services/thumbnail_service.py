@@ -0,0 +1,119 @@
+"""
+缩略图服务 - 发票预览图按尺寸生成一次, 缓存在 MinIO 中原文件旁边
+
+缓存对象名为 "<原对象名>.thumb-<尺寸>.jpg"。缺失的尺寸在请求时生成:
+同一缩略图的并发请求只生成一次, 不同缩略图同时生成的数量受 thumbnail_concurrency 限制,
+渲染在渲染进程池中执行。
+"""
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+from app.config import settings
+from app.models.invoice import Invoice
+from app.services.merge_fetch import MergeFetcher
+from app.services.minio_service import MinioService
+from app.services.render_pool import RenderPool
+from app.utils.thumbnail_utils import thumbnail_job
+
+# 尺寸名称 → 长边像素: small 用于列表, medium 用于排版预览
+THUMBNAIL_SIZES = {
+    "small": 240,
+    "medium": 800,
+}
+
+
+class ThumbnailService:
+    """缩略图服务"""
+
+    _semaphore: Optional[threading.BoundedSemaphore] = None
+    _inflight: Dict[str, list] = {}
+    _guard = threading.Lock()
+
+    @staticmethod
+    def object_name(invoice: Invoice, size: str) -> str:
+        """缩略图的对象名称"""
+        return f"{MinioService.object_name_from_url(invoice.file_url)}.thumb-{size}.jpg"
+
+    @staticmethod
+    def etag(invoice: Invoice, size: str) -> str:
+        """缩略图的 ETag, 原文件不会改变, 由发票内容和尺寸确定"""
+        return f'"{invoice.content_hash or invoice.id}-{size}"'
+
+    @classmethod
+    def get(cls, invoice: Invoice, size: str) -> bytes:
+        """读取缩略图, 不存在时生成并写入缓存"""
+        return cls.get_or_render(
+            cls.object_name(invoice, size),
+            lambda: cls._render(invoice, THUMBNAIL_SIZES[size]),
+        )
+
+    @classmethod
+    def get_or_render(
+        cls,
+        object_name: str,
+        render: Callable[[], bytes],
+        content_type: str = "image/jpeg",
+    ) -> bytes:
+        """读取缓存对象, 不存在时调用 render 生成并写入 (单飞 + 并发上限, 其他预览图共用)"""
+        cached = cls._load(object_name)
+        if cached is not None:
+            return cached
+
+        with cls._single_flight(object_name):
+            # 等待期间其他请求可能已生成
+            cached = cls._load(object_name)
+            if cached is not None:
+                return cached
+
+            with cls._get_semaphore():
+                data = render()
+            MinioService.upload_file(data, object_name, content_type)
+            return data
+
+    @staticmethod
+    def delete_all(object_name: str):
+        """删除原文件的全部尺寸缩略图 (发票删除时调用)"""
+        for size in THUMBNAIL_SIZES:
+            MinioService.delete_file(f"{object_name}.thumb-{size}.jpg")
+
+    @staticmethod
+    def _load(object_name: str) -> Optional[bytes]:
+        try:
+            return MinioService.download_file(object_name)
+        except Exception:
+            return None
+
+    @staticmethod
+    def _render(invoice: Invoice, max_edge: int) -> bytes:
+        # 复用合并的输入读取: 优先使用预处理产物, OFD 以转换后的 PDF 返回
+        fetched = MergeFetcher.fetch([invoice.id], [invoice], concurrency=1, prepared=True)
+        if not fetched.inputs:
+            raise ValueError(fetched.failures[0].reason if fetched.failures else "读取文件失败")
+        item = fetched.inputs[0]
+        return RenderPool.run(
+            thumbnail_job, (item.type, item.content, max_edge, settings.thumbnail_jpeg_quality),
+        )
+
+    @classmethod
+    def _get_semaphore(cls) -> threading.BoundedSemaphore:
+        with cls._guard:
+            if cls._semaphore is None:
+                cls._semaphore = threading.BoundedSemaphore(max(1, settings.thumbnail_concurrency))
+        return cls._semaphore
+
+    @classmethod
+    @contextmanager
+    def _single_flight(cls, key: str):
+        """同一 key 的生成串行执行, 无人等待时释放锁"""
+        with cls._guard:
+            entry: List = cls._inflight.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with cls._guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    cls._inflight.pop(key, None)
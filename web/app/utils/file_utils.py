@@ -1,7 +1,22 @@
 """
 文件处理工具
 """
+import hashlib
+from typing import BinaryIO, Optional
+
+from app.config import settings
 from app.models.invoice import FileType
+from app.utils.ofd_utils import is_ofd_package
+
+# 文件类型嗅探读取的头部字节数 (PDF 规范允许 %PDF- 出现在前 1024 字节内)
+SNIFF_BYTES = 1024
+
+CONTENT_TYPES = {
+    FileType.PDF.value: "application/pdf",
+    FileType.JPG.value: "image/jpeg",
+    FileType.PNG.value: "image/png",
+    FileType.OFD.value: "application/ofd",
+}
 
 
 def get_file_type_from_name(filename: str) -> str:
@@ -17,17 +32,73 @@ def get_file_type_from_name(filename: str) -> str:
     return mapping.get(ext, FileType.PDF.value)
 
 
-def validate_file_type(content_type: str) -> bool:
-    """验证文件MIME类型"""
-    allowed_types = [
-        "application/pdf",
-        "image/jpeg",
-        "image/png",
-        "image/jpg",
-    ]
-    return content_type in allowed_types
+def validate_file_size(size: int, max_size_mb: Optional[int] = None) -> bool:
+    """验证文件大小"""
+    return size <= (max_size_mb or settings.upload_max_file_mb) * 1024 * 1024
 
 
-def validate_file_size(size: int, max_size_mb: int = 10) -> bool:
-    """验证文件大小"""
-    return size <= max_size_mb * 1024 * 1024
+def sniff_file_type(head: bytes) -> Optional[str]:
+    """根据文件头部的魔数判断文件类型, 不支持的类型返回 None"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return FileType.JPG.value
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return FileType.PNG.value
+    if b"%PDF-" in head[:SNIFF_BYTES]:
+        return FileType.PDF.value
+    # OFD 为 zip 包, 头部只能判断出 zip, 完整文件可用时再由 sniff_stream 检查包结构
+    if head.startswith(b"PK\x03\x04"):
+        return FileType.OFD.value
+    return None
+
+
+def sniff_head(stream: BinaryIO) -> Optional[str]:
+    """只根据可定位流的头部判断文件类型 (用于不完整的文件, 如切片), 读取后回到开头"""
+    head = stream.read(SNIFF_BYTES)
+    stream.seek(0)
+    return sniff_file_type(head)
+
+
+def sniff_stream(stream: BinaryIO) -> Optional[str]:
+    """判断完整文件流的类型, zip 包须包含 OFD.xml 才视为 OFD, 读取后回到开头"""
+    file_type = sniff_head(stream)
+    if file_type == FileType.OFD.value and not is_ofd_package(stream):
+        return None
+    return file_type
+
+
+def hash_stream(stream: BinaryIO, block_size: int = 1024 * 1024) -> str:
+    """分块计算可定位流的 SHA-256, 计算后回到开头"""
+    digest = hashlib.sha256()
+    for block in iter(lambda: stream.read(block_size), b""):
+        digest.update(block)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+class FileTooLargeError(ValueError):
+    """文件超过大小限制"""
+
+
+class HashingReader:
+    """边读边计算 SHA-256 并统计大小的只读流, 超过 max_size 时抛出 FileTooLargeError
+
+    用于把上传内容直接交给 MinIO 客户端读取, 不在内存中保留完整文件。
+    """
+
+    def __init__(self, stream: BinaryIO, max_size: int):
+        self._stream = stream
+        self._hash = hashlib.sha256()
+        self.max_size = max_size
+        self.size = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._stream.read(size)
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise FileTooLargeError(f"文件大小超过{self.max_size // 1024 // 1024}MB限制")
+        self._hash.update(data)
+        return data
+
+    @property
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
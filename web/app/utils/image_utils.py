@@ -0,0 +1,107 @@
+"""
+图片处理工具 - 为 PDF 排版准备图片
+"""
+import io
+from dataclasses import dataclass
+from typing import Tuple
+
+from PIL import Image, ImageOps
+from reportlab import rl_config
+from reportlab.lib.utils import ImageReader
+
+# 图片流以二进制写入 PDF, 默认的 ASCII85 编码会让体积膨胀约 25%
+rl_config.useA85 = 0
+
+# EXIF 方向标签
+_EXIF_ORIENTATION = 0x0112
+# 需要交换宽高的 EXIF 方向 (旋转 90/270 度)
+_TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+# 可以原样作为 DCT 流嵌入 PDF 的 JPEG 颜色模式
+_PASSTHROUGH_JPEG_MODES = {"RGB", "L", "CMYK"}
+# 以原始像素传递时保留的颜色模式, 其余 (调色板等) 先转换
+_RAW_MODES = {"RGB", "RGBA", "L", "LA", "CMYK"}
+
+
+def target_pixel_size(
+    image_size: Tuple[int, int],
+    slot_size: Tuple[float, float],
+    dpi: int,
+) -> Tuple[int, int]:
+    """按槽位尺寸(pt)和目标DPI计算图片等比缩放后所需的像素尺寸 (不放大)"""
+    width, height = image_size
+    max_width = slot_size[0] / 72 * dpi
+    max_height = slot_size[1] / 72 * dpi
+    scale = min(max_width / width, max_height / height, 1.0)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+@dataclass
+class NormalizedImage:
+    """缩放/旋转处理后的图片, 只包含字节数据, 可在进程间传递"""
+    data: bytes
+    jpeg: bool
+    mode: str = ""
+    size: Tuple[int, int] = (0, 0)
+
+    def reader(self) -> ImageReader:
+        """转换为 reportlab 可绘制的 ImageReader"""
+        if self.jpeg:
+            return ImageReader(io.BytesIO(self.data))
+        return ImageReader(Image.frombytes(self.mode, self.size, self.data))
+
+
+def normalize_image(
+    content: bytes,
+    slot_size: Tuple[float, float],
+    dpi: int = 200,
+    jpeg_quality: int = 85,
+) -> NormalizedImage:
+    """将图片处理为适合放入槽位的尺寸和方向
+
+    - 无需缩放且无需旋转的 JPEG 原样嵌入 (DCTDecode), 不做任何重新编码
+    - 超过槽位所需分辨率的 JPEG 先用 draft 模式在解码阶段降采样, 再缩放并重新编码为 JPEG
+    - 其他格式返回原始像素, 由 reportlab 无损压缩, 不再经过 PNG 编码中转
+    """
+    img = Image.open(io.BytesIO(content))
+    orientation = img.getexif().get(_EXIF_ORIENTATION, 1)
+
+    size = img.size
+    if orientation in _TRANSPOSED_ORIENTATIONS:
+        size = (size[1], size[0])
+    target = target_pixel_size(size, slot_size, dpi)
+    needs_resize = target[0] < size[0]
+
+    if img.format == "JPEG":
+        if not needs_resize and orientation == 1 and img.mode in _PASSTHROUGH_JPEG_MODES:
+            return NormalizedImage(data=content, jpeg=True)
+
+        # draft 在解码时按 1/2、1/4、1/8 缩小, 保证结果不小于目标尺寸
+        draft_size = (target[1], target[0]) if orientation in _TRANSPOSED_ORIENTATIONS else target
+        img.draft("RGB", draft_size)
+        img = ImageOps.exif_transpose(img)
+        if img.size != target:
+            img = img.resize(target, Image.LANCZOS)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+
+        buffer = io.BytesIO()
+        img.save(buffer, format="JPEG", quality=jpeg_quality, optimize=True)
+        return NormalizedImage(data=buffer.getvalue(), jpeg=True)
+
+    img = ImageOps.exif_transpose(img)
+    if img.mode not in _RAW_MODES:
+        has_alpha = "A" in img.getbands() or "transparency" in img.info
+        img = img.convert("RGBA" if has_alpha else "RGB")
+    if needs_resize:
+        img = img.resize(target, Image.LANCZOS)
+    return NormalizedImage(data=img.tobytes(), jpeg=False, mode=img.mode, size=img.size)
+
+
+def prepare_image(
+    content: bytes,
+    slot_size: Tuple[float, float],
+    dpi: int = 200,
+    jpeg_quality: int = 85,
+) -> ImageReader:
+    """将图片处理为适合放入槽位的 ImageReader"""
+    return normalize_image(content, slot_size, dpi, jpeg_quality).reader()
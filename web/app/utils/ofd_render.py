@@ -0,0 +1,244 @@
+"""
+OFD 渲染 - 把 OFD 版式文档绘制为矢量 PDF
+
+OFD 坐标单位为 mm, 原点在页面左上角, y 轴向下; 绘制时整体变换到 PDF 坐标系,
+文字和图片局部再翻转一次保持正向。支持模板页、文字 (含 DeltaX/DeltaY 字距)、
+路径和图片对象; 字体统一使用内置中文字体, 电子签章不渲染。
+"""
+import io
+import re
+from typing import Dict, List, Optional, Tuple
+from xml.etree import ElementTree
+
+from PIL import Image
+from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+from reportlab.pdfgen.canvas import Canvas
+
+from app.utils.ofd_utils import OfdDocument, OfdError, first, local_name
+
+FONT = "STSong-Light"
+pdfmetrics.registerFont(UnicodeCIDFont(FONT))
+
+# 规范默认线宽 0.353mm (1pt)
+DEFAULT_LINE_WIDTH = 0.353
+
+
+def _floats(value: Optional[str]) -> List[float]:
+    return [float(v) for v in value.split()] if value else []
+
+
+def _deltas(value: Optional[str]) -> List[float]:
+    """展开 DeltaX/DeltaY, "g 3 1.5" 表示 1.5 重复 3 次"""
+    tokens = value.split() if value else []
+    result: List[float] = []
+    i = 0
+    while i < len(tokens):
+        if tokens[i] == "g" and i + 2 < len(tokens):
+            result.extend([float(tokens[i + 2])] * int(tokens[i + 1]))
+            i += 3
+        else:
+            result.append(float(tokens[i]))
+            i += 1
+    return result
+
+
+def _color(element: ElementTree.Element, name: str) -> Optional[Tuple[float, float, float]]:
+    """FillColor/StrokeColor 的 RGB 值 (0-1), 未指定时返回 None"""
+    color = next((c for c in element if local_name(c.tag) == name), None)
+    if color is None:
+        return None
+    values = _floats(color.get("Value"))
+    if len(values) == 1:
+        values = values * 3
+    if len(values) < 3:
+        return 0, 0, 0
+    return tuple(v / 255 for v in values[:3])
+
+
+class OfdRenderer:
+    """单个 OFD 文档的渲染器"""
+
+    def __init__(self, content: bytes):
+        self.document = OfdDocument(content)
+        self.templates = self.document.template_paths()
+        self.media = self.document.media_files()
+        self._images: Dict[str, Optional[ImageReader]] = {}
+
+    def render(self) -> bytes:
+        """渲染全部页面, 返回 PDF 内容"""
+        paths = self.document.page_paths()
+        if not paths:
+            raise OfdError("OFD 文件没有页面")
+
+        output = io.BytesIO()
+        c = Canvas(output)
+        for path in paths:
+            page = self.document.read_xml(path)
+            width, height = self.document.page_box(page)
+            c.setPageSize((width * mm, height * mm))
+            c.saveState()
+            # 变换到 mm 坐标系, 原点左上角, y 轴向下
+            c.translate(0, height * mm)
+            c.scale(mm, -mm)
+            templates = [e for e in page if local_name(e.tag) == "Template"]
+            self._draw_templates(c, templates, foreground=False)
+            self._draw_content(c, page)
+            self._draw_templates(c, templates, foreground=True)
+            c.restoreState()
+            c.showPage()
+        c.save()
+        return output.getvalue()
+
+    def _draw_templates(self, c: Canvas, templates: List[ElementTree.Element], foreground: bool):
+        """模板页默认作为背景, ZOrder 为 Foreground 时绘制在页面内容之上"""
+        for template in templates:
+            if (template.get("ZOrder") == "Foreground") != foreground:
+                continue
+            path = self.templates.get(template.get("TemplateID", ""))
+            if path:
+                self._draw_content(c, self.document.read_xml(path))
+
+    def _draw_content(self, c: Canvas, page: ElementTree.Element):
+        content = first(page, "Content")
+        if content is None:
+            return
+        for layer in content:
+            if local_name(layer.tag) == "Layer":
+                self._draw_block(c, layer)
+
+    def _draw_block(self, c: Canvas, block: ElementTree.Element):
+        for element in block:
+            name = local_name(element.tag)
+            if name == "PageBlock":
+                self._draw_block(c, element)
+            elif name in ("TextObject", "PathObject", "ImageObject"):
+                if element.get("Visible", "true") == "false":
+                    continue
+                c.saveState()
+                try:
+                    self._apply_boundary(c, element)
+                    getattr(self, "_draw_" + name[:-6].lower())(c, element)
+                except (ValueError, OSError):
+                    # 单个对象数据异常时跳过, 不影响整页
+                    pass
+                finally:
+                    c.restoreState()
+
+    @staticmethod
+    def _apply_boundary(c: Canvas, element: ElementTree.Element):
+        """对象内坐标以外接矩形左上角为原点, 再叠加对象自身的 CTM"""
+        boundary = _floats(element.get("Boundary"))
+        if len(boundary) == 4:
+            c.translate(boundary[0], boundary[1])
+        ctm = _floats(element.get("CTM"))
+        if len(ctm) == 6:
+            c.transform(*ctm)
+
+    def _draw_text(self, c: Canvas, element: ElementTree.Element):
+        size = float(element.get("Size", "3.5"))
+        c.setFont(FONT, size)
+        fill = _color(element, "FillColor") or (0, 0, 0)
+        c.setFillColorRGB(*fill)
+
+        x = y = 0.0
+        for code in (e for e in element if local_name(e.tag) == "TextCode"):
+            text = code.text or ""
+            x = float(code.get("X", x))
+            y = float(code.get("Y", y))
+            dx = _deltas(code.get("DeltaX"))
+            dy = _deltas(code.get("DeltaY"))
+            # 同一 TextCode 放在一个文本对象中逐字定位, 保持 PDF 中文字可复制
+            c.saveState()
+            c.scale(1, -1)
+            text_object = c.beginText()
+            text_object.setFont(FONT, size)
+            for index, char in enumerate(text):
+                text_object.setTextOrigin(x, -y)
+                text_object.textOut(char)
+                if index < len(text) - 1:
+                    x += dx[index] if index < len(dx) else pdfmetrics.stringWidth(char, FONT, size)
+                    y += dy[index] if index < len(dy) else 0.0
+            c.drawText(text_object)
+            c.restoreState()
+
+    def _draw_path(self, c: Canvas, element: ElementTree.Element):
+        data = next((e for e in element if local_name(e.tag) == "AbbreviatedData"), None)
+        if data is None or not data.text:
+            return
+        stroke = element.get("Stroke", "true") != "false"
+        fill = element.get("Fill", "false") == "true"
+        if not stroke and not fill:
+            return
+
+        c.setLineWidth(float(element.get("LineWidth", DEFAULT_LINE_WIDTH)))
+        c.setStrokeColorRGB(*(_color(element, "StrokeColor") or (0, 0, 0)))
+        c.setFillColorRGB(*(_color(element, "FillColor") or (0, 0, 0)))
+
+        path = c.beginPath()
+        tokens = re.findall(r"[A-Za-z]|-?\d*\.?\d+(?:[eE][-+]?\d+)?", data.text)
+        current = (0.0, 0.0)
+        i = 0
+        while i < len(tokens):
+            op = tokens[i]
+            i += 1
+            args = []
+            while i < len(tokens) and not tokens[i].isalpha():
+                args.append(float(tokens[i]))
+                i += 1
+            if op in ("S", "M") and len(args) >= 2:
+                current = (args[0], args[1])
+                path.moveTo(*current)
+            elif op == "L" and len(args) >= 2:
+                current = (args[0], args[1])
+                path.lineTo(*current)
+            elif op == "Q" and len(args) >= 4:
+                # 二次贝塞尔转三次
+                (x0, y0), (x1, y1), (x2, y2) = current, args[0:2], args[2:4]
+                path.curveTo(
+                    x0 + 2 / 3 * (x1 - x0), y0 + 2 / 3 * (y1 - y0),
+                    x2 + 2 / 3 * (x1 - x2), y2 + 2 / 3 * (y1 - y2),
+                    x2, y2,
+                )
+                current = (x2, y2)
+            elif op == "B" and len(args) >= 6:
+                path.curveTo(*args[:6])
+                current = (args[4], args[5])
+            elif op == "A" and len(args) >= 7:
+                # 椭圆弧近似为直线, 发票版面中几乎不使用
+                current = (args[5], args[6])
+                path.lineTo(*current)
+            elif op == "C":
+                path.close()
+        c.drawPath(path, stroke=int(stroke), fill=int(fill))
+
+    def _draw_image(self, c: Canvas, element: ElementTree.Element):
+        image = self._image(element.get("ResourceID", ""))
+        if image is None:
+            return
+        # 图片绘制在 CTM 变换后的单位正方形内, 翻转使图片首行位于上方
+        c.translate(0, 1)
+        c.scale(1, -1)
+        c.drawImage(image, 0, 0, width=1, height=1, mask="auto")
+
+    def _image(self, resource_id: str) -> Optional[ImageReader]:
+        if resource_id not in self._images:
+            reader = None
+            path = self.media.get(resource_id)
+            if path:
+                try:
+                    image = Image.open(io.BytesIO(self.document.read(path)))
+                    image.load()
+                    reader = ImageReader(image)
+                except (KeyError, OSError, OfdError):
+                    # JBIG2 等 Pillow 不支持的格式跳过
+                    reader = None
+            self._images[resource_id] = reader
+        return self._images[resource_id]
+
+
+def render_ofd_to_pdf(content: bytes) -> bytes:
+    """把 OFD 文件渲染为 PDF"""
+    return OfdRenderer(content).render()
@@ -0,0 +1,189 @@
+"""
+OFD 工具 - 解析 OFD (GB/T 33190) 电子发票包
+
+OFD 是 zip 包: OFD.xml 指向文档根 Document.xml, 文档中列出页面和模板页;
+电子发票通过 CustomTag 把发票代码、号码等语义字段关联到页面上的文字对象 ID。
+"""
+import io
+import posixpath
+import zipfile
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+from xml.etree import ElementTree
+
+# 单个 XML 部件的大小上限, 防止压缩炸弹
+MAX_PART_BYTES = 16 * 1024 * 1024
+
+
+class OfdError(ValueError):
+    """OFD 文件无法解析"""
+
+
+def local_name(tag: str) -> str:
+    """去掉命名空间前缀的标签名"""
+    return tag.rsplit("}", 1)[-1]
+
+
+def children(element: ElementTree.Element, name: str) -> Iterator[ElementTree.Element]:
+    """按本地标签名遍历所有后代元素"""
+    for child in element.iter():
+        if local_name(child.tag) == name:
+            yield child
+
+
+def first(element: ElementTree.Element, name: str) -> Optional[ElementTree.Element]:
+    return next(children(element, name), None)
+
+
+def is_ofd_package(stream: BinaryIO) -> bool:
+    """可定位流是否为 OFD 包 (zip 且包含 OFD.xml), 检查后回到开头"""
+    try:
+        with zipfile.ZipFile(stream) as package:
+            return "OFD.xml" in package.namelist()
+    except (zipfile.BadZipFile, OSError):
+        return False
+    finally:
+        stream.seek(0)
+
+
+class OfdDocument:
+    """OFD 包中的第一个文档"""
+
+    def __init__(self, content: bytes):
+        try:
+            self.zip = zipfile.ZipFile(io.BytesIO(content))
+            root = self.read_xml("OFD.xml")
+        except (zipfile.BadZipFile, KeyError) as e:
+            raise OfdError(f"不是有效的 OFD 文件: {e}")
+
+        doc_root = first(root, "DocRoot")
+        if doc_root is None or not doc_root.text:
+            raise OfdError("OFD 文件缺少 DocRoot")
+        self.doc_path = self.resolve("", doc_root.text)
+        self.doc_dir = posixpath.dirname(self.doc_path)
+        self.document = self.read_xml(self.doc_path)
+
+    def resolve(self, base_dir: str, loc: str) -> str:
+        """把 BaseLoc/FileLoc 解析为包内路径 (以 / 开头为包内绝对路径)"""
+        loc = loc.strip()
+        if loc.startswith("/"):
+            return posixpath.normpath(loc.lstrip("/"))
+        return posixpath.normpath(posixpath.join(base_dir, loc))
+
+    def read(self, path: str) -> bytes:
+        info = self.zip.getinfo(path)
+        if info.file_size > MAX_PART_BYTES:
+            raise OfdError(f"OFD 部件过大: {path}")
+        return self.zip.read(info)
+
+    def read_xml(self, path: str) -> ElementTree.Element:
+        try:
+            return ElementTree.fromstring(self.read(path))
+        except ElementTree.ParseError as e:
+            raise OfdError(f"OFD 部件解析失败 {path}: {e}")
+
+    def page_box(self, page: Optional[ElementTree.Element] = None) -> Tuple[float, float]:
+        """页面尺寸 (mm), 页面未指定时使用文档默认页面区域"""
+        for root in (page, self.document):
+            if root is None:
+                continue
+            area = first(root, "PageArea") if root is self.document else first(root, "Area")
+            box = first(area, "PhysicalBox") if area is not None else None
+            if box is not None and box.text:
+                values = [float(v) for v in box.text.split()]
+                if len(values) == 4:
+                    return values[2], values[3]
+        # 缺省为增值税电子发票版面 210mm x 140mm
+        return 210.0, 140.0
+
+    def media_files(self) -> Dict[str, str]:
+        """多媒体资源 ID → 包内路径 (PublicRes 与 DocumentRes)"""
+        media: Dict[str, str] = {}
+        common = first(self.document, "CommonData")
+        if common is None:
+            return media
+        for res in list(children(common, "PublicRes")) + list(children(common, "DocumentRes")):
+            if not res.text:
+                continue
+            res_path = self.resolve(self.doc_dir, res.text)
+            try:
+                root = self.read_xml(res_path)
+            except (KeyError, OfdError):
+                continue
+            base_dir = self.resolve(posixpath.dirname(res_path), root.get("BaseLoc", ""))
+            for item in children(root, "MultiMedia"):
+                media_file = first(item, "MediaFile")
+                if item.get("ID") and media_file is not None and media_file.text:
+                    media[item.get("ID")] = self.resolve(base_dir, media_file.text)
+        return media
+
+    def page_paths(self) -> List[str]:
+        """各页面 Content.xml 的包内路径"""
+        return [
+            self.resolve(self.doc_dir, page.get("BaseLoc", ""))
+            for page in children(self.document, "Page")
+            if page.get("BaseLoc")
+        ]
+
+    def template_paths(self) -> Dict[str, str]:
+        """模板页 ID → Content.xml 包内路径"""
+        return {
+            tpl.get("ID"): self.resolve(self.doc_dir, tpl.get("BaseLoc", ""))
+            for tpl in children(self.document, "TemplatePage")
+            if tpl.get("ID") and tpl.get("BaseLoc")
+        }
+
+    def text_objects(self) -> Dict[str, str]:
+        """所有页面 (含模板页) 文字对象 ID → 文字内容"""
+        texts: Dict[str, str] = {}
+        paths = list(self.template_paths().values()) + self.page_paths()
+        for path in paths:
+            try:
+                page = self.read_xml(path)
+            except (KeyError, OfdError):
+                continue
+            for obj in children(page, "TextObject"):
+                text = "".join(code.text or "" for code in children(obj, "TextCode"))
+                if obj.get("ID"):
+                    texts[obj.get("ID")] = text
+        return texts
+
+    def plain_text(self) -> str:
+        """所有文字按出现顺序拼接, 每个文字对象一行"""
+        return "\n".join(self.text_objects().values())
+
+    def custom_tags(self) -> Dict[str, List[str]]:
+        """CustomTag 中的语义字段 → 关联的文字对象 ID 列表"""
+        loc = first(self.document, "CustomTags")
+        if loc is None or not loc.text:
+            return {}
+        index_path = self.resolve(self.doc_dir, loc.text)
+        try:
+            index = self.read_xml(index_path)
+        except (KeyError, OfdError):
+            return {}
+
+        tags: Dict[str, List[str]] = {}
+        for file_loc in children(index, "FileLoc"):
+            if not file_loc.text:
+                continue
+            try:
+                tag_root = self.read_xml(self.resolve(posixpath.dirname(index_path), file_loc.text))
+            except (KeyError, OfdError):
+                continue
+            for element in tag_root.iter():
+                refs = [
+                    ref.text.strip()
+                    for ref in element
+                    if local_name(ref.tag) == "ObjectRef" and ref.text
+                ]
+                if refs:
+                    tags.setdefault(local_name(element.tag), []).extend(refs)
+        return tags
+
+    def tagged_fields(self) -> Dict[str, str]:
+        """语义字段 → 文字内容"""
+        texts = self.text_objects()
+        return {
+            name: "".join(texts.get(ref, "") for ref in refs).strip()
+            for name, refs in self.custom_tags().items()
+        }
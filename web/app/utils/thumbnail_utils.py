@@ -0,0 +1,67 @@
+"""
+缩略图工具 - 把 PDF 首页或图片渲染为限定长边的 JPEG
+
+PDF 由 pdfium 栅格化; pdfium 不是线程安全的, 同一进程内的调用串行执行。
+"""
+import io
+import threading
+from typing import Tuple
+
+import pypdfium2 as pdfium
+from PIL import Image, ImageOps
+
+from app.models.invoice import FileType
+
+_PDFIUM_LOCK = threading.Lock()
+
+
+def _render_pdf_page(content: bytes, max_edge: int) -> Image.Image:
+    """栅格化 PDF 第一页, 长边缩放到 max_edge 像素"""
+    with _PDFIUM_LOCK:
+        pdf = pdfium.PdfDocument(content)
+        try:
+            page = pdf[0]
+            width, height = page.get_size()
+            bitmap = page.render(scale=max_edge / max(width, height))
+            image = bitmap.to_pil()
+            page.close()
+        finally:
+            pdf.close()
+    return image
+
+
+def _scale_image(content: bytes, max_edge: int) -> Image.Image:
+    """按 EXIF 方向校正图片并缩小到长边不超过 max_edge (不放大)"""
+    image = Image.open(io.BytesIO(content))
+    # JPEG 在解码阶段按 1/2、1/4、1/8 降采样
+    image.draft("RGB", (max_edge, max_edge))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    return image
+
+
+def render_thumbnail(file_type: str, content: bytes, max_edge: int, quality: int = 80) -> bytes:
+    """生成缩略图 JPEG; OFD 须先转换为 PDF 再传入"""
+    if file_type == FileType.PDF.value:
+        image = _render_pdf_page(content, max_edge)
+    else:
+        image = _scale_image(content, max_edge)
+
+    if image.mode in ("RGBA", "LA", "P"):
+        # 透明背景铺白
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def thumbnail_job(args: Tuple[str, bytes, int, int]) -> bytes:
+    """进程池任务: 生成单个缩略图"""
+    file_type, content, max_edge, quality = args
+    return render_thumbnail(file_type, content, max_edge, quality)
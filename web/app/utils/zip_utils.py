@@ -0,0 +1,100 @@
+"""
+ZIP 打包工具 - 按文件类型选择压缩方式, 支持边打包边读取 (写入管道)
+
+PDF、图片、OFD 本身已经压缩, 再 deflate 几乎不减小体积却占用大量 CPU, 这些类型以 ZIP_STORED 原样存储,
+其他内容 (清单等文本) 仍然 deflate。
+"""
+import os
+import threading
+import time
+import zipfile
+from typing import BinaryIO, Callable, TypeVar
+
+T = TypeVar("T")
+
+# 已压缩的文件类型 (OFD 本身是 ZIP 容器)
+STORED_SUFFIXES = {"pdf", "jpg", "jpeg", "png", "ofd", "zip"}
+
+
+def compress_type(name: str) -> int:
+    """按文件扩展名选择压缩方式"""
+    suffix = name.rsplit(".", 1)[-1].lower() if "." in name else ""
+    return zipfile.ZIP_STORED if suffix in STORED_SUFFIXES else zipfile.ZIP_DEFLATED
+
+
+def open_entry(zf: zipfile.ZipFile, name: str, size: int = 0):
+    """以按类型选择的压缩方式打开一个写入条目, size 为预计大小 (用于判断是否需要 ZIP64)"""
+    info = zipfile.ZipInfo(name, date_time=time.localtime(time.time())[:6])
+    info.compress_type = compress_type(name)
+    info.external_attr = 0o600 << 16
+    return zf.open(info, "w", force_zip64=size > zipfile.ZIP64_LIMIT // 2)
+
+
+def write_bytes(zf: zipfile.ZipFile, name: str, data: bytes):
+    """写入一个内存中的条目"""
+    with open_entry(zf, name, len(data)) as entry:
+        entry.write(data)
+
+
+class _PipeReader:
+    """管道读取端: 打包失败后抛出打包的异常, 避免把不完整的 ZIP 当作正常结束上传"""
+
+    def __init__(self, stream: BinaryIO, outcome: dict):
+        self._stream = stream
+        self._outcome = outcome
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._stream.read(size)
+        if "error" in self._outcome:
+            raise self._outcome["error"]
+        return data
+
+
+def stream_zip(build: Callable[[zipfile.ZipFile], T], consume: Callable[[BinaryIO], object]) -> T:
+    """在后台线程中用 build 把 ZIP 写入管道, 调用线程用 consume 读取 (如分片上传), 返回 build 的返回值
+
+    打包与读取同时进行, 不经过临时文件; 管道有界, 读取慢时打包随之等待。
+    任一侧出错时另一侧随之结束, 并抛出最先出错一侧的异常。
+    """
+    read_fd, write_fd = os.pipe()
+    reader = os.fdopen(read_fd, "rb")
+    writer = os.fdopen(write_fd, "wb")
+    outcome: dict = {}
+
+    def produce():
+        zf = None
+        try:
+            zf = zipfile.ZipFile(writer, "w", zipfile.ZIP_DEFLATED)
+            outcome["result"] = build(zf)
+            zf.close()
+        except BaseException as e:
+            outcome["error"] = e
+            if zf is not None:
+                try:
+                    zf.close()
+                except Exception:
+                    pass
+        finally:
+            try:
+                writer.close()
+            except OSError:
+                # 读取端已关闭
+                pass
+
+    thread = threading.Thread(target=produce, name="zip-stream", daemon=True)
+    thread.start()
+    try:
+        consume(_PipeReader(reader, outcome))
+    except BaseException:
+        # 关闭读取端让打包线程的写入失败退出
+        reader.close()
+        thread.join()
+        error = outcome.get("error")
+        if error is not None and not isinstance(error, BrokenPipeError):
+            raise error
+        raise
+    reader.close()
+    thread.join()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
@@ -3,13 +3,27 @@
 """
 from typing import Optional, List
 
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Query
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
+from app.config import settings
 from app.database import get_db
-from app.schemas import ApiResponse, PageResponse, InvoiceResponse
-from app.services import InvoiceService
-from app.utils.file_utils import validate_file_type, validate_file_size
+from app.schemas import (
+    ApiResponse,
+    PageResponse,
+    InvoiceResponse,
+    BatchUploadResult,
+    ChunkUploadResponse,
+    ChunkStatusResponse,
+    MergeChunksRequest,
+    PresignUploadRequest,
+    PresignUploadResponse,
+    RegisterUploadRequest,
+)
+from app.services import InvoiceService, ChunkUploadService, BatchUploadService, DirectUploadService, ThumbnailService
+from app.services.batch_upload_service import BatchUploadItem
+from app.utils.file_utils import FileTooLargeError, sniff_stream, validate_file_size
 
 router = APIRouter(prefix="/invoices")
 
@@ -38,6 +52,109 @@ async def get_invoice_list(
     )
 
 
+@router.get("/check-hash", response_model=ApiResponse[Optional[InvoiceResponse]])
+async def check_invoice_hash(
+    sha256: str = Query(..., min_length=64, max_length=64),
+    db: Session = Depends(get_db),
+):
+    """按文件内容 SHA-256 查询已有发票, 存在时前端无需再上传 (秒传)"""
+    invoice = InvoiceService.get_by_hash(db, sha256.lower())
+
+    return ApiResponse(
+        code=0,
+        message="文件已存在" if invoice else "success",
+        data=InvoiceService.to_response(invoice, duplicate=True) if invoice else None
+    )
+
+
+@router.get("/upload-chunk", response_model=ApiResponse[ChunkStatusResponse])
+async def get_uploaded_chunks(fileHash: str = Query(..., min_length=1)):
+    """查询已上传的切片, 用于断点续传"""
+    return ApiResponse(
+        code=0,
+        message="success",
+        data=ChunkStatusResponse(
+            fileHash=fileHash,
+            uploadedChunks=ChunkUploadService.uploaded_chunks(fileHash),
+        )
+    )
+
+
+@router.post("/upload-chunk", response_model=ApiResponse[ChunkUploadResponse])
+async def upload_chunk(
+    chunk: UploadFile = File(...),
+    chunkIndex: int = Form(...),
+    fileHash: str = Form(..., min_length=1),
+    fileName: str = Form(...),
+    totalChunks: int = Form(...),
+    chunkHash: Optional[str] = Form(None),
+):
+    """上传单个切片, 切片直接写入 MinIO"""
+    # 切片已由 starlette 落在临时文件中, 按已知长度流式上传
+    length = chunk.size if chunk.size is not None else chunk.file.seek(0, 2)
+    chunk.file.seek(0)
+
+    error = ChunkUploadService.save_chunk(fileHash, chunkIndex, totalChunks, chunk.file, length)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+
+    return ApiResponse(
+        code=0,
+        message="success",
+        data=ChunkUploadResponse(chunkIndex=chunkIndex)
+    )
+
+
+@router.post("/merge-chunks", response_model=ApiResponse[InvoiceResponse])
+async def merge_chunks(
+    request: MergeChunksRequest,
+    db: Session = Depends(get_db),
+):
+    """合并切片并创建发票"""
+    invoice, duplicate, error = await run_in_threadpool(
+        ChunkUploadService.merge,
+        db, request.file_hash, request.file_name, request.total_chunks,
+    )
+    if not invoice:
+        raise HTTPException(status_code=400, detail=error)
+
+    return ApiResponse(
+        code=0,
+        message="文件已存在" if duplicate else "上传成功",
+        data=InvoiceService.to_response(invoice, duplicate)
+    )
+
+
+@router.post("/presign", response_model=ApiResponse[PresignUploadResponse])
+async def presign_upload(request: PresignUploadRequest):
+    """获取直传 MinIO 的预签名上传URL"""
+    data, error = DirectUploadService.presign(request.file_name, request.size)
+    if not data:
+        raise HTTPException(status_code=400, detail=error)
+
+    return ApiResponse(code=0, message="success", data=data)
+
+
+@router.post("/register", response_model=ApiResponse[InvoiceResponse])
+async def register_upload(
+    request: RegisterUploadRequest,
+    db: Session = Depends(get_db),
+):
+    """直传完成后登记发票"""
+    invoice, duplicate, error = await run_in_threadpool(
+        DirectUploadService.register,
+        db, request.object_name, request.file_name, request.sha256,
+    )
+    if not invoice:
+        raise HTTPException(status_code=400, detail=error)
+
+    return ApiResponse(
+        code=0,
+        message="文件已存在" if duplicate else "上传成功",
+        data=InvoiceService.to_response(invoice, duplicate)
+    )
+
+
 @router.get("/{invoice_id}", response_model=ApiResponse[InvoiceResponse])
 async def get_invoice_detail(invoice_id: str, db: Session = Depends(get_db)):
     """获取发票详情"""
@@ -52,6 +169,35 @@ async def get_invoice_detail(invoice_id: str, db: Session = Depends(get_db)):
     )
 
 
+@router.get("/{invoice_id}/thumbnail")
+async def get_invoice_thumbnail(
+    invoice_id: str,
+    request: Request,
+    size: str = Query("small", pattern="^(small|medium)$"),
+    db: Session = Depends(get_db),
+):
+    """获取发票缩略图 (JPEG), 首次请求时生成并缓存"""
+    invoice = InvoiceService.get_by_id(db, invoice_id)
+    if not invoice:
+        raise HTTPException(status_code=404, detail="发票不存在")
+    if not invoice.file_url:
+        raise HTTPException(status_code=404, detail="发票没有关联文件")
+
+    etag = ThumbnailService.etag(invoice, size)
+    headers = {
+        "Cache-Control": f"private, max-age={settings.thumbnail_max_age}, immutable",
+        "ETag": etag,
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    try:
+        data = await run_in_threadpool(ThumbnailService.get, invoice, size)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"缩略图生成失败: {e}")
+    return Response(content=data, media_type="image/jpeg", headers=headers)
+
+
 @router.post("/upload", response_model=ApiResponse[InvoiceResponse])
 async def upload_invoice(
     file: UploadFile = File(...),
@@ -61,51 +207,64 @@ async def upload_invoice(
     if not file.filename:
         raise HTTPException(status_code=400, detail="文件名不能为空")
 
-    if not validate_file_type(file.content_type or ""):
+    # 按文件头部魔数判断类型, 不信任客户端提供的 content_type
+    file_type = sniff_stream(file.file)
+    if not file_type:
         raise HTTPException(status_code=400, detail="不支持的文件类型")
 
-    content = await file.read()
-
-    if not validate_file_size(len(content)):
-        raise HTTPException(status_code=400, detail="文件大小超过10MB限制")
+    if file.size is not None and not validate_file_size(file.size):
+        raise HTTPException(status_code=400, detail=f"文件大小超过{settings.upload_max_file_mb}MB限制")
 
-    invoice = await InvoiceService.create_from_file(db, content, file.filename)
+    try:
+        invoice, duplicate = await run_in_threadpool(
+            InvoiceService.create_from_stream,
+            db, file.file, file.filename, file_type, -1 if file.size is None else file.size,
+        )
+    except FileTooLargeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     return ApiResponse(
         code=0,
-        message="上传成功",
-        data=InvoiceService.to_response(invoice)
+        message="文件已存在" if duplicate else "上传成功",
+        data=InvoiceService.to_response(invoice, duplicate)
     )
 
 
-@router.post("/batch-upload", response_model=ApiResponse[List[InvoiceResponse]])
+@router.post("/batch-upload", response_model=ApiResponse[List[BatchUploadResult]])
 async def batch_upload_invoices(
     files: List[UploadFile] = File(...),
     db: Session = Depends(get_db),
 ):
-    """批量上传发票文件"""
+    """批量上传发票文件, 返回每个文件的结果 (包括被拒绝的原因)"""
     if not files:
         raise HTTPException(status_code=400, detail="请选择要上传的文件")
+    if len(files) > settings.upload_max_batch_files:
+        raise HTTPException(status_code=400, detail=f"单次最多上传 {settings.upload_max_batch_files} 个文件")
 
-    invoices = []
+    items = []
     for file in files:
+        item = BatchUploadItem(
+            file_name=file.filename or "",
+            stream=file.file,
+            length=-1 if file.size is None else file.size,
+        )
         if not file.filename:
-            continue
-
-        if not validate_file_type(file.content_type or ""):
-            continue
-
-        content = await file.read()
-        if not validate_file_size(len(content)):
-            continue
+            item.error = "文件名不能为空"
+        elif file.size is not None and not validate_file_size(file.size):
+            item.error = f"文件大小超过{settings.upload_max_file_mb}MB限制"
+        else:
+            item.file_type = sniff_stream(file.file)
+            if not item.file_type:
+                item.error = "不支持的文件类型"
+        items.append(item)
 
-        invoice = await InvoiceService.create_from_file(db, content, file.filename)
-        invoices.append(InvoiceService.to_response(invoice))
+    results = await run_in_threadpool(BatchUploadService.upload, db, items)
+    succeeded = sum(1 for r in results if r.status == "success")
 
     return ApiResponse(
         code=0,
-        message=f"成功上传 {len(invoices)} 个文件",
-        data=invoices
+        message=f"成功上传 {succeeded} 个文件" + (f", {len(results) - succeeded} 个失败" if succeeded < len(results) else ""),
+        data=results
     )
 
 
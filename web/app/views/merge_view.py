@@ -1,13 +1,30 @@
 """
 合并任务视图
 """
-from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import RedirectResponse
+import hmac
+import json
+from typing import AsyncIterator, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse, StreamingResponse
 from sqlalchemy.orm import Session
 
-from app.database import get_db
-from app.schemas import ApiResponse, PageResponse, MergeTaskCreate, MergeTaskResponse
-from app.services import MergeService
+from app.config import settings
+from app.database import SessionLocal, get_db
+from app.schemas import (
+    ApiResponse,
+    PageResponse,
+    MergeTaskCreate,
+    MergeTaskResponse,
+    MergeBatchCreate,
+    MergeAppendRequest,
+    MergeProgressEvent,
+    MergePreviewRequest,
+    MergePreviewResponse,
+)
+from app.services import MergeService, MergeDownloadService, MergePreviewService, MergeQueue, ProgressHub
+from app.services.merge_progress import FINAL_STATUSES, progress_token
 
 router = APIRouter(prefix="/merge-tasks")
 
@@ -21,15 +38,91 @@ async def create_merge_task(
     if not request.invoice_ids:
         raise HTTPException(status_code=400, detail="请选择要合并的发票")
 
-    task = await MergeService.create_task(db, request.invoice_ids, request.output_type)
+    task = MergeService.create_task(db, request.invoice_ids, request.output_type, request.layout)
 
     return ApiResponse(
         code=0,
-        message="合并任务创建成功",
+        message="合并任务已提交",
         data=MergeService.to_response(task)
     )
 
 
+@router.post("/batch", response_model=ApiResponse[MergeTaskResponse])
+async def create_merge_batch(
+    request: MergeBatchCreate,
+    db: Session = Depends(get_db),
+):
+    """创建分组合并任务 (一次生成多个输出)"""
+    if request.group_by and request.groups:
+        raise HTTPException(status_code=400, detail="分组规则和分组列表只能指定一个")
+
+    task, error = MergeService.create_batch(db, request)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+
+    return ApiResponse(
+        code=0,
+        message="合并任务已提交",
+        data=MergeService.to_response(task)
+    )
+
+
+@router.post("/progress", include_in_schema=False)
+async def report_merge_progress(
+    event: MergeProgressEvent,
+    x_progress_token: str = Header(""),
+):
+    """接收 Worker 推送的合并进度 (内部接口), 分发给订阅者"""
+    if not hmac.compare_digest(x_progress_token, progress_token()):
+        raise HTTPException(status_code=403, detail="令牌无效")
+
+    ProgressHub.publish(event.model_dump(by_alias=True))
+    return Response(status_code=204)
+
+
+@router.post("/preview", response_model=ApiResponse[MergePreviewResponse])
+async def preview_merge_page(
+    request: MergePreviewRequest,
+    db: Session = Depends(get_db),
+):
+    """渲染合并结果的某一页 (不创建任务), 返回预览图地址"""
+    if not request.invoice_ids:
+        raise HTTPException(status_code=400, detail="请选择要合并的发票")
+
+    try:
+        key, total_pages, error = await run_in_threadpool(
+            MergePreviewService.render_page, db, request.invoice_ids, request.layout, request.page,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+
+    return ApiResponse(
+        code=0,
+        message="success",
+        data=MergePreviewResponse(
+            page=request.page,
+            totalPages=total_pages,
+            imageUrl=f"/api/v1/merge-tasks/preview/{key}",
+        )
+    )
+
+
+@router.get("/preview/{key}")
+async def get_merge_preview_image(key: str):
+    """获取已渲染的预览页 (JPEG, 按内容寻址, 可长期缓存)"""
+    data = await run_in_threadpool(MergePreviewService.load, key)
+    if data is None:
+        raise HTTPException(status_code=404, detail="预览不存在或已过期")
+
+    return Response(
+        content=data,
+        media_type="image/jpeg",
+        headers={"Cache-Control": f"private, max-age={settings.merge_preview_ttl_hours * 3600}, immutable"},
+    )
+
+
 @router.get("/{task_id}", response_model=ApiResponse[MergeTaskResponse])
 async def get_merge_task_detail(task_id: str, db: Session = Depends(get_db)):
     """获取合并任务详情"""
@@ -66,11 +159,136 @@ async def get_merge_task_list(
     )
 
 
+@router.post("/{task_id}/append", response_model=ApiResponse[MergeTaskResponse])
+async def append_merge_task(
+    task_id: str,
+    request: MergeAppendRequest,
+    db: Session = Depends(get_db),
+):
+    """向已完成的合并任务追加发票 (创建新任务, 只拼版新增部分)"""
+    base = MergeService.get_by_id(db, task_id)
+    if not base:
+        raise HTTPException(status_code=404, detail="任务不存在")
+
+    task, error = MergeService.create_append(db, base, request.invoice_ids)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+
+    return ApiResponse(
+        code=0,
+        message="合并任务已提交",
+        data=MergeService.to_response(task)
+    )
+
+
+@router.post("/{task_id}/cancel", response_model=ApiResponse[MergeTaskResponse])
+async def cancel_merge_task(task_id: str, db: Session = Depends(get_db)):
+    """取消合并任务: 排队中的任务立即取消, 执行中的任务由 Worker 在下一次心跳后停止"""
+    task = MergeService.get_by_id(db, task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="任务不存在")
+
+    if not MergeQueue.cancel(db, task_id):
+        raise HTTPException(status_code=400, detail="任务已结束, 无法取消")
+
+    db.refresh(task)
+    if task.status in FINAL_STATUSES:
+        # 排队中的任务没有 Worker 上报终态, 由这里通知进度订阅者
+        ProgressHub.publish(MergeService.to_progress_event(task).model_dump(by_alias=True))
+
+    return ApiResponse(
+        code=0,
+        message="任务已取消" if task.status in FINAL_STATUSES else "已请求取消",
+        data=MergeService.to_response(task)
+    )
+
+
+@router.get("/{task_id}/progress")
+async def stream_merge_progress(task_id: str, db: Session = Depends(get_db)):
+    """以 Server-Sent Events 推送合并进度, 任务结束时推送 end 事件 (完整任务信息) 后关闭"""
+    task = MergeService.get_by_id(db, task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="任务不存在")
+
+    if task.status in FINAL_STATUSES:
+        initial = MergeService.to_response(task)
+    else:
+        initial = MergeService.to_progress_event(task)
+
+    return StreamingResponse(
+        _progress_events(task_id, initial),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _sse(event: str, data) -> str:
+    """格式化一条 SSE 消息"""
+    if hasattr(data, "model_dump"):
+        data = data.model_dump(by_alias=True)
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _progress_events(task_id: str, initial) -> AsyncIterator[str]:
+    """先发送当前状态, 再转发 Worker 推送的进度
+
+    进度推送可能落在其他 API 进程, 每次保活时读取一次任务状态, 任务已结束时直接发送 end 事件。
+    """
+    if isinstance(initial, MergeTaskResponse):
+        yield _sse("end", initial)
+        return
+    if ProgressHub.latest(task_id) is None:
+        yield _sse("progress", initial)
+
+    async for event in ProgressHub.subscribe(task_id):
+        if event is None:
+            # 保活, 防止代理断开空闲连接
+            yield ": keepalive\n\n"
+            task = await run_in_threadpool(_load_task, task_id)
+            if task is None or task.status in FINAL_STATUSES:
+                if task is not None:
+                    yield _sse("end", task)
+                return
+            continue
+        yield _sse("progress", event)
+        if event.get("status") in FINAL_STATUSES:
+            break
+
+    task = await run_in_threadpool(_load_task, task_id)
+    if task is not None:
+        yield _sse("end", task)
+
+
+def _load_task(task_id: str) -> Optional[MergeTaskResponse]:
+    db = SessionLocal()
+    try:
+        task = MergeService.get_by_id(db, task_id)
+        return MergeService.to_response(task) if task else None
+    finally:
+        db.close()
+
+
 @router.get("/{task_id}/download")
-async def download_merged_file(task_id: str, db: Session = Depends(get_db)):
-    """下载合并后的文件 (重定向到 MinIO URL)"""
-    download_url = MergeService.get_download_url(db, task_id)
-    if not download_url:
+async def download_merged_file(
+    task_id: str,
+    request: Request,
+    group: Optional[int] = Query(None, ge=0, description="分组合并 (未打包) 时分组的序号"),
+    mode: Optional[str] = Query(None, pattern="^(redirect|proxy)$", description="redirect / proxy, 默认按配置"),
+    db: Session = Depends(get_db),
+):
+    """下载合并后的文件 (重定向到 MinIO URL, 或经 API 转发并支持 Range / 条件请求)"""
+    if (mode or settings.merge_download_mode) != "proxy":
+        download_url = MergeService.get_download_url(db, task_id, group)
+        if not download_url:
+            raise HTTPException(status_code=404, detail="文件不存在或任务未完成")
+        return RedirectResponse(url=download_url)
+
+    target = MergeService.get_download_object(db, task_id, group)
+    if not target:
         raise HTTPException(status_code=404, detail="文件不存在或任务未完成")
+    try:
+        obj = await run_in_threadpool(MergeDownloadService.stat, *target)
+    except Exception:
+        raise HTTPException(status_code=404, detail="文件不存在或已被清理")
 
-    return RedirectResponse(url=download_url)
+    return MergeDownloadService.response(obj, request.headers)
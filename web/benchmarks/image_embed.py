@@ -0,0 +1,84 @@
+"""
+图片嵌入基准 - 对比旧实现 (解码后重新编码为 PNG) 与 JPEG 直通/降采样的耗时和输出体积
+
+用法:
+    python benchmarks/image_embed.py --count 10
+使用合成的手机照片尺寸 JPEG (4032x3024) 和扫描件尺寸 JPEG (1654x1169), 每张图片单独生成一页 PDF。
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw, ImageFilter
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+from app.config import settings
+from app.utils.image_utils import prepare_image
+
+SLOT = (A4[0] - 20 * mm, (A4[1] - 25 * mm) / 2)
+
+
+def _synthetic_jpeg(size, seed: int) -> bytes:
+    """生成带文字、线条和噪点的类发票照片"""
+    img = Image.effect_noise(size, 40 + seed % 20).convert("RGB")
+    draw = ImageDraw.Draw(img)
+    step = max(size[1] // 40, 10)
+    for y in range(0, size[1], step):
+        draw.line([(0, y), (size[0], y)], fill=(30, 30, 90), width=2)
+        draw.text((20, y + 2), f"INVOICE {seed:04d} LINE {y} 0123456789", fill=(0, 0, 0))
+    img = img.filter(ImageFilter.SMOOTH)
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def _legacy_reader(content: bytes) -> ImageReader:
+    img = Image.open(io.BytesIO(content))
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    buffer.seek(0)
+    return ImageReader(buffer)
+
+
+def _new_reader(content: bytes) -> ImageReader:
+    return prepare_image(content, SLOT, dpi=settings.merge_image_dpi, jpeg_quality=settings.merge_jpeg_quality)
+
+
+def _render(content: bytes, make_reader) -> int:
+    output = io.BytesIO()
+    c = canvas.Canvas(output, pagesize=A4)
+    c.drawImage(make_reader(content), 10 * mm, 10 * mm, width=SLOT[0], height=SLOT[1],
+                preserveAspectRatio=True, anchor="c")
+    c.save()
+    return len(output.getvalue())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=10)
+    args = parser.parse_args()
+
+    samples = {
+        "phone 4032x3024": (4032, 3024),
+        "scan 1654x1169": (1654, 1169),
+    }
+    for label, size in samples.items():
+        images = [_synthetic_jpeg(size, i) for i in range(args.count)]
+        source_kb = sum(len(img) for img in images) / len(images) / 1024
+        print(f"{label}: 源文件平均 {source_kb:.0f} KB")
+        for name, make_reader in (("legacy-png", _legacy_reader), ("jpeg-direct", _new_reader)):
+            started = time.perf_counter()
+            sizes = [_render(img, make_reader) for img in images]
+            elapsed = (time.perf_counter() - started) / len(images)
+            print(f"  {name:>11}: {elapsed * 1000:7.1f} ms/张, 输出 {sum(sizes) / len(sizes) / 1024:7.0f} KB/张")
+
+
+if __name__ == "__main__":
+    main()
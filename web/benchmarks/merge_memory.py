@@ -0,0 +1,115 @@
+"""
+合并输出内存基准 - 对比整体缓冲 (legacy) 与临时文件分片上传 (stream) 的峰值 RSS
+
+用法:
+    python benchmarks/merge_memory.py --files 40 --size-mb 5
+每种模式在独立子进程中运行, MinIO 替换为只读取并丢弃数据的接收端, 只统计本进程内存。
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class _SinkClient:
+    """模拟 MinIO 客户端: 按分片读取上传流后丢弃"""
+
+    def put_object(self, bucket_name, object_name, data, length, content_type=None, part_size=None):
+        chunk = part_size or length
+        remaining = length
+        while remaining > 0:
+            block = data.read(min(chunk, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB, macOS 为字节
+    return peak / 1024 if sys.platform != "darwin" else peak / 1024 / 1024
+
+
+def _make_inputs(count: int, size_mb: int):
+    from app.models.invoice import Invoice
+    from app.services.merge_fetch import MergeInput
+
+    inputs = []
+    for i in range(count):
+        inv = Invoice(id=f"bench{i}", file_type="pdf", total_amount=0.0)
+        inputs.append(MergeInput(
+            invoice=inv,
+            name=f"bench{i}.pdf",
+            type="pdf",
+            content=os.urandom(size_mb * 1024 * 1024),
+        ))
+    return inputs
+
+
+def run_mode(mode: str, count: int, size_mb: int) -> dict:
+    from app.config import settings
+    from app.services.merge_service import MergeService
+    from app.services.minio_service import MinioService
+
+    MinioService._client = _SinkClient()
+    inputs = _make_inputs(count, size_mb)
+    baseline = _peak_rss_mb()
+    started = time.perf_counter()
+
+    if mode == "legacy":
+        # 基线实现: 结果整体写入 BytesIO → getvalue() → upload_file 再包一层 BytesIO
+        output = io.BytesIO()
+        MergeService._merge_to_zip(inputs, output)
+        data = output.getvalue()
+        MinioService.upload_file(data, "bench/legacy.zip", "application/zip")
+        size = len(data)
+    else:
+        with tempfile.SpooledTemporaryFile(max_size=settings.merge_spool_max_bytes) as output:
+            MergeService._merge_to_zip(inputs, output)
+            size = output.tell()
+            output.seek(0)
+            MinioService.upload_file_stream(output, "bench/stream.zip", size, "application/zip")
+
+    return {
+        "mode": mode,
+        "outputMB": round(size / 1024 / 1024, 1),
+        "inputsRssMB": round(baseline, 1),
+        "peakRssMB": round(_peak_rss_mb(), 1),
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--size-mb", type=int, default=5)
+    parser.add_argument("--mode", choices=["legacy", "stream"])
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.files, args.size_mb)))
+        return
+
+    for mode in ("legacy", "stream"):
+        output = subprocess.run(
+            [sys.executable, __file__, "--mode", mode,
+             "--files", str(args.files), "--size-mb", str(args.size_mb)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output)
+        print(
+            f"{result['mode']:>6}: 输出 {result['outputMB']} MB, "
+            f"输入就绪时 RSS {result['inputsRssMB']} MB, 峰值 RSS {result['peakRssMB']} MB, "
+            f"耗时 {result['seconds']} s"
+        )
+
+
+if __name__ == "__main__":
+    main()
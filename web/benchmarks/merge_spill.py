@@ -0,0 +1,148 @@
+"""
+合并输入内存预算压测 - 对比输入全部保留在内存 (memory) 与超出预算转存到磁盘 (spill) 的峰值 RSS
+
+用法:
+    python benchmarks/merge_spill.py --files 400 --size-mb 5 --budget-mb 64
+    python benchmarks/merge_spill.py --output pdf --files 200 --size-mb 4
+默认合成约 2GB 的一批输入。每种模式在独立子进程中运行, MinIO 替换为按需生成内容的下载端和丢弃数据的上传端,
+渲染在 Worker 进程内完成 (merge_render_processes=0), 只统计本进程内存。
+zip 输出使用随机内容; pdf 输出使用带噪点的 JPEG (拼版时缩放到槽位尺寸)。
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class _Response(io.BytesIO):
+    def release_conn(self):
+        pass
+
+
+class _SyntheticClient:
+    """模拟 MinIO 客户端: 下载返回合成内容, 上传按分片读取后丢弃"""
+
+    def __init__(self, template: bytes, size: int):
+        self.template = template
+        self.size = size
+
+    def get_object(self, bucket_name, object_name):
+        index = int(object_name.rsplit("/", 1)[-1].split(".")[0][len("bench"):])
+        if self.template:
+            # 每个文件都是新分配的对象, 末尾字节不同
+            return _Response(self.template[:-1] + bytes([index % 256]))
+        return _Response(os.urandom(self.size))
+
+    def put_object(self, bucket_name, object_name, data, length, content_type=None, part_size=None):
+        chunk = part_size or length
+        remaining = length
+        while remaining > 0:
+            block = data.read(min(chunk, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB, macOS 为字节
+    return peak / 1024 if sys.platform != "darwin" else peak / 1024 / 1024
+
+
+def _synthetic_jpeg(size_mb: int) -> bytes:
+    """生成约 size_mb 大小的噪点 JPEG"""
+    from PIL import Image
+
+    side = 1000
+    while True:
+        buffer = io.BytesIO()
+        Image.effect_noise((side, side), 80).convert("RGB").save(buffer, format="JPEG", quality=95)
+        if buffer.tell() >= size_mb * 1024 * 1024:
+            return buffer.getvalue()
+        side = int(side * 1.4)
+
+
+def run_mode(mode: str, output_type: str, count: int, size_mb: int, budget_mb: int) -> dict:
+    from app.config import settings
+    from app.models.invoice import Invoice
+    from app.schemas.merge_task import LayoutOptions
+    from app.services.merge_fetch import MergeFetcher
+    from app.services.merge_service import MergeService
+    from app.services.minio_service import MinioService
+
+    settings.merge_render_processes = 0
+    settings.merge_memory_budget_mb = budget_mb if mode == "spill" else 0
+    file_type = "jpg" if output_type == "pdf" else "pdf"
+    template = _synthetic_jpeg(size_mb) if output_type == "pdf" else b""
+    MinioService._client = _SyntheticClient(template, size_mb * 1024 * 1024)
+    invoices = [
+        Invoice(id=f"bench{i}", file_type=file_type, file_url=f"http://minio/bucket/bench/bench{i}.{file_type}")
+        for i in range(count)
+    ]
+    baseline = _peak_rss_mb()
+    started = time.perf_counter()
+
+    with MergeFetcher.fetch(
+        [inv.id for inv in invoices], invoices,
+        memory_budget=settings.merge_memory_budget_mb * 1024 * 1024,
+    ) as fetched:
+        input_mb = sum(item.size for item in fetched.inputs) / 1024 / 1024
+        fetched_rss = _peak_rss_mb()
+        with tempfile.SpooledTemporaryFile(max_size=settings.merge_spool_max_bytes) as output:
+            if output_type == "pdf":
+                MergeService._merge_to_pdf(fetched.inputs, output, LayoutOptions())
+                content_type = "application/pdf"
+            else:
+                MergeService._merge_to_zip(fetched.inputs, output)
+                content_type = "application/zip"
+            size = output.tell()
+            output.seek(0)
+            MinioService.upload_file_stream(output, f"bench/{mode}.{output_type}", size, content_type)
+
+    return {
+        "mode": mode,
+        "inputMB": round(input_mb, 1),
+        "outputMB": round(size / 1024 / 1024, 1),
+        "baselineRssMB": round(baseline, 1),
+        "fetchedRssMB": round(fetched_rss, 1),
+        "peakRssMB": round(_peak_rss_mb(), 1),
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--output", choices=["zip", "pdf"], default="zip")
+    parser.add_argument("--files", type=int, default=400)
+    parser.add_argument("--size-mb", type=int, default=5)
+    parser.add_argument("--budget-mb", type=int, default=64)
+    parser.add_argument("--mode", choices=["memory", "spill"])
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.output, args.files, args.size_mb, args.budget_mb)))
+        return
+
+    for mode in ("memory", "spill"):
+        output = subprocess.run(
+            [sys.executable, __file__, "--mode", mode, "--output", args.output,
+             "--files", str(args.files), "--size-mb", str(args.size_mb), "--budget-mb", str(args.budget_mb)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output)
+        print(
+            f"{result['mode']:>6}: 输入 {result['inputMB']} MB, 输出 {result['outputMB']} MB, "
+            f"起始 RSS {result['baselineRssMB']} MB, 下载完成时 {result['fetchedRssMB']} MB, "
+            f"峰值 {result['peakRssMB']} MB, 耗时 {result['seconds']} s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
 from app.database import init_db
+from app.middleware import UploadSizeLimitMiddleware
 from app.views import api_router
 
 # 创建应用
@@ -18,6 +19,9 @@ app = FastAPI(
     version="1.0.0",
 )
 
+# 上传请求体大小限制 (先注册, 位于 CORS 内层, 413 响应也带 CORS 头, 浏览器才能读取错误信息)
+app.add_middleware(UploadSizeLimitMiddleware)
+
 # CORS配置
 app.add_middleware(
     CORSMiddleware,
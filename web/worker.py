@@ -0,0 +1,144 @@
+"""
+合并任务 Worker 启动脚本
+
+用法:
+    python worker.py                 # 按 MERGE_WORKER_PROCESSES 启动多个进程
+    python worker.py --processes 4   # 指定进程数
+可在多个节点上同时运行, 各 Worker 通过 merge_tasks 表认领任务;
+没有合并任务时批量提取待识别发票的字段。
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+from app.config import settings
+
+logger = logging.getLogger("merge_worker")
+
+# 清理过期上传切片/未登记直传文件/合并预览的间隔 (秒), 需要列举对象, 不必每轮都做
+UPLOAD_CLEANUP_INTERVAL = 3600
+
+
+def run_worker(index: int = 0):
+    """Worker 主循环: 回收超时任务/清理过期缓存 → 认领合并任务 → 执行, 无合并任务时提取发票字段"""
+    from app.database import SessionLocal, init_db
+    from app.services.chunk_upload_service import ChunkUploadService
+    from app.services.direct_upload_service import DirectUploadService
+    from app.services.extraction_service import ExtractionService
+    from app.services.merge_cache import MergeCacheService
+    from app.services.merge_preview import MergePreviewService
+    from app.services.merge_queue import MergeQueue, HeartbeatThread
+    from app.services.merge_service import MergeService
+    from app.services.render_pool import RenderPool
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+    stopping = False
+
+    def handle_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        logger.info("[%s] 收到退出信号, 当前任务完成后退出", worker_id)
+
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+
+    init_db()
+    RenderPool.warm_up()
+    logger.info("[%s] Worker 已启动", worker_id)
+
+    last_recover = 0.0
+    last_upload_cleanup = 0.0
+    while not stopping:
+        db = SessionLocal()
+        try:
+            now = time.monotonic()
+            if now - last_recover >= settings.merge_task_heartbeat_seconds:
+                recovered = MergeQueue.recover_stale(db)
+                if recovered:
+                    logger.warning("[%s] 回收了 %d 个超时任务", worker_id, recovered)
+                evicted = MergeCacheService.evict_expired(db)
+                if evicted:
+                    logger.info("[%s] 清理了 %d 个过期的合并缓存", worker_id, evicted)
+                last_recover = now
+            if now - last_upload_cleanup >= UPLOAD_CLEANUP_INTERVAL:
+                last_upload_cleanup = now
+                removed = ChunkUploadService.cleanup_stale() + DirectUploadService.cleanup_stale()
+                if removed:
+                    logger.info("[%s] 清理了 %d 个过期的上传文件", worker_id, removed)
+                removed = MergePreviewService.cleanup_stale()
+                if removed:
+                    logger.info("[%s] 清理了 %d 个过期的合并预览", worker_id, removed)
+
+            task = MergeQueue.claim(db, worker_id)
+            if task is None:
+                # 合并任务优先, 空闲时批量提取发票字段
+                extracted = ExtractionService.run_batch(db, worker_id)
+                if extracted:
+                    logger.info("[%s] 提取了 %d 张发票的字段", worker_id, extracted)
+                else:
+                    time.sleep(settings.merge_worker_poll_interval)
+                continue
+
+            logger.info("[%s] 开始处理任务 %s (第 %d 次)", worker_id, task.id, task.attempts)
+            heartbeat = HeartbeatThread(task.id, worker_id)
+            heartbeat.start()
+            try:
+                success = MergeService.run_task(db, task, worker_id, heartbeat)
+            finally:
+                heartbeat.stop()
+            logger.info("[%s] 任务 %s %s", worker_id, task.id, "完成" if success else "失败")
+        except Exception:
+            logger.exception("[%s] Worker 循环异常", worker_id)
+            db.rollback()
+            time.sleep(settings.merge_worker_poll_interval)
+        finally:
+            db.close()
+
+    RenderPool.shutdown()
+    logger.info("[%s] Worker 已退出", worker_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="发票合并任务 Worker")
+    parser.add_argument(
+        "--processes", "-n",
+        type=int,
+        default=settings.merge_worker_processes,
+        help="Worker 进程数",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+
+    if args.processes <= 1:
+        run_worker()
+        return
+
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(i,), name=f"merge-worker-{i}")
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+
+    def forward_stop(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, forward_stop)
+    signal.signal(signal.SIGINT, forward_stop)
+
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()